@@ -59,8 +59,11 @@ import sparse.assessment
 import sparse.decomposition
 import sparse.expectations
 import sparse.committor
+import sparse.correlations
 import sparse.fingerprints
 import sparse.mean_first_passage_time
+import sparse.hitting_probability
+import sparse.sensitivity
 
 __author__ = "Benjamin Trendelkamp-Schroer, Martin Scherer, Jan-Hendrik Prinz, Frank Noe"
 __copyright__ = "Copyright 2014, Computational Molecular Biology Group, FU-Berlin"
@@ -324,13 +327,17 @@ def is_reversible(T, mu=None, tol=1e-12):
 ################################################################################
 
 @shortcut('statdist')
-def stationary_distribution(T):
+def stationary_distribution(T, rate_matrix=False):
     r"""Compute stationary distribution of stochastic matrix T.
 
     Parameters
     ----------
     T : (M, M) ndarray or scipy.sparse matrix
-        Transition matrix
+        Transition matrix (default) or rate matrix (if rate_matrix=True)
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix K and the stationary distribution
+        solves :math:`\mu^T K = 0`. Always uses the sparse
+        implementation, a dense K is converted.
 
     Returns
     -------
@@ -355,8 +362,12 @@ def stationary_distribution(T):
     array([0.44444444, 0.11111111, 0.44444444])
 
     """
+    if rate_matrix:
+        if not is_rate_matrix(T):
+            raise ValueError("Input matrix is not a rate matrix. "
+                             "Cannot compute stationary distribution")
     # is this a transition matrix?
-    if not is_transition_matrix(T):
+    elif not is_transition_matrix(T):
         raise ValueError("Input matrix is not a transition matrix."
                          "Cannot compute stationary distribution")
     # is the stationary distribution unique?
@@ -366,8 +377,10 @@ def stationary_distribution(T):
                          "distribution. Separate disconnected components "
                          "and handle them separately")
     # we're good to go...
+    if rate_matrix:
+        return sparse.decomposition.stationary_distribution_from_rate_matrix(_csr_matrix(T))
     if _issparse(T):
-        return sparse.decomposition.stationary_distribution_from_backward_iteration(T)
+        return sparse.decomposition.stationary_distribution_from_linear_system(T)
     else:
         return dense.decomposition.stationary_distribution_from_backward_iteration(T)
 
@@ -628,14 +641,14 @@ def rdl_decomposition(T, k=None, norm='auto', ncv=None):
         return dense.decomposition.rdl_decomposition(T, k=k, norm=norm)
 
 
-def mfpt(T, target, origin=None, tau=1, mu=None):
+def mfpt(T, target, origin=None, tau=1, mu=None, solver='direct', rate_matrix=False, **kwargs):
     r"""Mean first passage times (from a set of starting states - optional)
     to a set of target states.
     
     Parameters
     ----------
     T : ndarray or scipy.sparse matrix, shape=(n,n)
-        Transition matrix.
+        Transition matrix (default) or rate matrix (if rate_matrix=True).
     target : int or list of int
         Target states for mfpt calculation.
     origin : int or list of int (optional)
@@ -646,11 +659,33 @@ def mfpt(T, target, origin=None, tau=1, mu=None):
         constructed.
     mu : (n,) ndarray (optional)
         The stationary distribution of the transition matrix T.
+    solver : str (optional)
+        Linear solver, one of 'direct', 'gmres', 'bicgstab' or 'amg'
+        (algebraic multigrid, requires pyamg). The iterative solvers
+        always use the sparse implementation, a dense T is converted.
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix K and the mean first passage times
+        are returned in the time unit of K, tau is not used. Always uses
+        the sparse implementation, a dense K is converted.
+    **kwargs : optional
+        Options of the sparse solvers
+    tol : float, default=1e-10
+        Relative residual tolerance of the iterative solvers.
+    x0 : ndarray, shape=(n,)
+        Initial guess for the iterative solvers.
+    maxiter : int
+        Maximum number of iterations of the iterative solvers.
+    return_conv : bool, default=False
+        If True, the residual history of the solver is also returned.
     
     Returns
     -------
     m_t : ndarray, shape=(n,) or shape(1,)
         Mean first passage time or vector of mean first passage times.
+    (resnorms) : ndarray
+        Relative residual norms, one for each solver iteration. Only
+        returned if return_conv = True and T is sparse or an iterative
+        solver is used.
     
     Notes
     -----
@@ -697,11 +732,23 @@ def mfpt(T, target, origin=None, tau=1, mu=None):
     target = _types.ensure_int_vector(target)
     origin = _types.ensure_int_vector_or_None(origin)
     # go
-    if _issparse(T):
+    if rate_matrix:
+        """Generator K takes the role of T-I, no time unit of a lag time"""
+        tau = 1
+    if _issparse(T) or solver != 'direct' or rate_matrix:
+        T = _csr_matrix(T)
         if origin is None:
-            t_tau = sparse.mean_first_passage_time.mfpt(T, target)
+            res = sparse.mean_first_passage_time.mfpt(T, target, solver=solver,
+                                                      rate_matrix=rate_matrix, **kwargs)
         else:
-            t_tau = sparse.mean_first_passage_time.mfpt_between_sets(T, target, origin, mu=mu)
+            res = sparse.mean_first_passage_time.mfpt_between_sets(T, target, origin, mu=mu,
+                                                                   solver=solver,
+                                                                   rate_matrix=rate_matrix,
+                                                                   **kwargs)
+        if kwargs.get('return_conv', False):
+            # scale answer by lag time used.
+            return tau * res[0], res[1]
+        t_tau = res
     else:
         if origin is None:
             t_tau = dense.mean_first_passage_time.mfpt(T, target)
@@ -712,7 +759,7 @@ def mfpt(T, target, origin=None, tau=1, mu=None):
     return tau * t_tau
 
 
-def hitting_probability(T, target):
+def hitting_probability(T, target, solver='direct', **kwargs):
     """
     Computes the hitting probabilities for all states to the target states.
     
@@ -727,20 +774,39 @@ def hitting_probability(T, target):
     ----------
     T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
-    B : array_like
-        List of integer state labels for the target set
+    target : array_like or list of array_like
+        List of integer state labels for the target set. If a list of
+        mutually disjoint target sets is given, the probabilities to
+        hit each of the sets before all other sets are computed using
+        a single factorization.
+    solver : str (optional)
+        Linear solver, one of 'direct', 'gmres', 'bicgstab' or 'amg'
+        (algebraic multigrid, requires pyamg). The iterative solvers
+        always use the sparse implementation, a dense T is converted.
+    **kwargs : optional
+        Options of the sparse solvers
+    tol : float, default=1e-10
+        Relative residual tolerance of the iterative solvers.
+    maxiter : int
+        Maximum number of iterations of the iterative solvers.
 
     Returns
     -------
-    h : ndarray(n)
-        a vector with hitting probabilities
+    h : ndarray(n) or ndarray(n, k)
+        a vector with hitting probabilities, or one column for each of
+        the k target sets
 
     """
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
-    target = _types.ensure_int_vector(target)
-    if _issparse(T):
-        _showSparseConversionWarning()  # currently no sparse implementation!
-        return dense.hitting_probability.hitting_probability(T.toarray(), target)
+    if not _np.isscalar(target) and len(target) == 0:
+        raise ValueError("Target set is empty.")
+    multiple = not (_np.isscalar(target) or _np.ndim(target[0]) == 0)
+    if multiple:
+        target = [_types.ensure_int_vector(A) for A in target]
+    else:
+        target = _types.ensure_int_vector(target)
+    if _issparse(T) or multiple or solver != 'direct':
+        return sparse.hitting_probability.hitting_probability(_csr_matrix(T), target, solver=solver, **kwargs)
     else:
         return dense.hitting_probability.hitting_probability(T, target)
 
@@ -749,7 +815,7 @@ def hitting_probability(T, target):
 # Transition path theory
 ################################################################################
 
-def committor(T, A, B, forward=True, mu=None):
+def committor(T, A, B, forward=True, mu=None, solver='direct', rate_matrix=False, **kwargs):
     r"""Compute the committor between sets of microstates.
     
     The committor assigns to each microstate a probability that being
@@ -762,7 +828,7 @@ def committor(T, A, B, forward=True, mu=None):
     Parameters
     ----------
     T : (M, M) ndarray or scipy.sparse matrix
-        Transition matrix
+        Transition matrix (default) or rate matrix (if rate_matrix=True)
     A : array_like
         List of integer state labels for set A
     B : array_like
@@ -770,11 +836,34 @@ def committor(T, A, B, forward=True, mu=None):
     forward : bool
         If True compute the forward committor, else
         compute the backward committor.
+    solver : str (optional)
+        Linear solver, one of 'direct', 'gmres', 'bicgstab' or 'amg'
+        (algebraic multigrid, requires pyamg). The iterative solvers
+        always use the sparse implementation, a dense T is converted.
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix K, which takes the place of the
+        generator L=T-I. Always uses the sparse implementation, a dense
+        K is converted.
+    **kwargs : optional
+        Options of the sparse solvers
+    tol : float, default=1e-10
+        Relative residual tolerance of the iterative solvers.
+    x0 : (M,) ndarray
+        Initial guess for the iterative solvers, e.g. the committor
+        at a neighbouring lag time.
+    maxiter : int
+        Maximum number of iterations of the iterative solvers.
+    return_conv : bool, default=False
+        If True, the residual history of the solver is also returned.
     
     Returns
     -------
     q : (M,) ndarray
         Vector of comittor probabilities.
+    (resnorms) : ndarray
+        Relative residual norms, one for each solver iteration. Only
+        returned if return_conv = True and T is sparse or an iterative
+        solver is used.
 
     Notes
     -----
@@ -856,16 +945,28 @@ def committor(T, A, B, forward=True, mu=None):
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
     A = _types.ensure_int_vector(A)
     B = _types.ensure_int_vector(B)
-    if _issparse(T):
+    if rate_matrix:
+        T = _csr_matrix(T)
         if forward:
-            return sparse.committor.forward_committor(T, A, B)
+            return sparse.committor.forward_committor(T, A, B, solver=solver, rate_matrix=True, **kwargs)
+        else:
+            return sparse.committor.backward_committor(T, A, B, solver=solver, rate_matrix=True, **kwargs)
+    if _issparse(T) or solver != 'direct':
+        T = _csr_matrix(T)
+        if forward:
+            return sparse.committor.forward_committor(T, A, B, solver=solver, **kwargs)
         else:
             """ if P is time reversible backward commitor is equal 1 - q+"""
             if is_reversible(T, mu=mu):
-                return 1.0 - sparse.committor.forward_committor(T, A, B)
+                if kwargs.get('x0', None) is not None:
+                    kwargs['x0'] = 1.0 - _np.asarray(kwargs['x0'])
+                res = sparse.committor.forward_committor(T, A, B, solver=solver, **kwargs)
+                if kwargs.get('return_conv', False):
+                    return 1.0 - res[0], res[1]
+                return 1.0 - res
 
             else:
-                return sparse.committor.backward_committor(T, A, B)
+                return sparse.committor.backward_committor(T, A, B, solver=solver, **kwargs)
 
     else:
         if forward:
@@ -889,15 +990,17 @@ def expected_counts(T, p0, N):
     ----------
     T : (M, M) ndarray or sparse matrix
         Transition matrix
-    p0 : (M,) ndarray
-        Initial (probability) vector
+    p0 : (M,) or (M, K) ndarray
+        Initial (probability) vector, or K initial vectors in the columns
+        of a matrix
     N : int
         Number of steps to take
     
     Returns
     --------
-    EC : (M, M) ndarray or sparse matrix
-        Expected value for transition counts after N steps
+    EC : (M, M) ndarray or sparse matrix, or list of K of them
+        Expected value for transition counts after N steps, one per
+        initial vector if p0 is a matrix
 
     Notes
     -----
@@ -925,10 +1028,15 @@ def expected_counts(T, p0, N):
     """
     # check input
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
-    p0 = _types.ensure_float_vector(p0, require_order=True)
+    if _np.ndim(p0) == 2:
+        p0 = _types.ensure_ndarray(p0, ndim=2, shape=(T.shape[0], _np.shape(p0)[1]), kind='numeric')
+    else:
+        p0 = _types.ensure_float_vector(p0, require_order=True)
     # go
     if _issparse(T):
         return sparse.expectations.expected_counts(p0, T, N)
+    elif p0.ndim == 2:
+        return [dense.expectations.expected_counts(p0[:, i], T, N) for i in range(p0.shape[1])]
     else:
         return dense.expectations.expected_counts(p0, T, N)
 
@@ -992,6 +1100,16 @@ def expected_counts_stationary(T, N, mu=None):
 # Fingerprints
 ################################################################################
 
+def _ensure_observables(obs, n):
+    r"""Ensures obs is a (n,) observable vector or a (n, K) matrix of K observables"""
+    obs = _types.ensure_ndarray(obs, kind='numeric')
+    if obs.ndim == 2:
+        _types.assert_array(obs, shape=(n, obs.shape[1]))
+    else:
+        _types.assert_array(obs, ndim=1, size=n)
+    return obs
+
+
 def fingerprint_correlation(T, obs1, obs2=None, tau=1, k=None, ncv=None):
     r"""Dynamical fingerprint for equilibrium correlation experiment.
 
@@ -999,9 +1117,11 @@ def fingerprint_correlation(T, obs1, obs2=None, tau=1, k=None, ncv=None):
     ----------
     T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
-    obs1 : (M,) ndarray
-        Observable, represented as vector on state space
-    obs2 : (M,) ndarray (optional)
+    obs1 : (M,) or (M, K) ndarray
+        Observable, represented as vector on state space, or K observables
+        in the columns of a matrix. All amplitudes are obtained from a
+        single eigendecomposition of T.
+    obs2 : (M,) or (M, K) ndarray (optional)
         Second observable, for cross-correlations    
     k : int (optional)
         Number of time-scales and amplitudes to compute
@@ -1015,8 +1135,8 @@ def fingerprint_correlation(T, obs1, obs2=None, tau=1, k=None, ncv=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the correlation experiment
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the correlation experiment, one column per observable
 
     See also
     --------
@@ -1094,8 +1214,9 @@ def fingerprint_correlation(T, obs1, obs2=None, tau=1, k=None, ncv=None):
     # will not do fingerprint analysis for nonreversible matrices
     if not is_reversible(T):
         raise ValueError('Fingerprint calculation is not supported for nonreversible transition matrices. ')
-    obs1 = _types.ensure_ndarray(obs1, ndim=1, size=n, kind='numeric')
-    obs1 = _types.ensure_ndarray_or_None(obs1, ndim=1, size=n, kind='numeric')
+    obs1 = _ensure_observables(obs1, n)
+    if obs2 is not None:
+        obs2 = _ensure_observables(obs2, n)
     # go
     if _issparse(T):
         return sparse.fingerprints.fingerprint_correlation(T, obs1, obs2=obs2, tau=tau, k=k, ncv=ncv)
@@ -1113,10 +1234,12 @@ def fingerprint_relaxation(T, p0, obs, tau=1, k=None, ncv=None):
     ----------
     T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
-    obs1 : (M,) ndarray
-        Observable, represented as vector on state space
-    obs2 : (M,) ndarray (optional)
-        Second observable, for cross-correlations    
+    p0 : (M,) ndarray
+        Initial distribution for the relaxation experiment
+    obs : (M,) or (M, K) ndarray
+        Observable, represented as vector on state space, or K observables
+        in the columns of a matrix. All amplitudes are obtained from a
+        single eigendecomposition of T.
     k : int (optional)
         Number of time-scales and amplitudes to compute
     tau : int (optional)
@@ -1129,8 +1252,8 @@ def fingerprint_relaxation(T, p0, obs, tau=1, k=None, ncv=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the relaxation experiment
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the relaxation experiment, one column per observable
 
     See also
     --------
@@ -1188,7 +1311,7 @@ def fingerprint_relaxation(T, p0, obs, tau=1, k=None, ncv=None):
     if not is_reversible(T):
         raise ValueError('Fingerprint calculation is not supported for nonreversible transition matrices. ')
     p0 = _types.ensure_ndarray(p0, ndim=1, size=n, kind='numeric')
-    obs = _types.ensure_ndarray(obs, ndim=1, size=n, kind='numeric')
+    obs = _ensure_observables(obs, n)
     # go
     if _issparse(T):
         return sparse.fingerprints.fingerprint_relaxation(T, p0, obs, tau=tau, k=k, ncv=ncv)
@@ -1263,7 +1386,9 @@ def correlation(T, obs1, obs2=None, times=(1), maxtime=None, k=None, ncv=None, r
     maxtime : int, optional, default=None
         Maximum time step to use. Equivalent to . Alternative to times.
     k : int (optional)
-        Number of eigenvalues and eigenvectors to use for computation
+        Number of eigenvalues and eigenvectors to use for computation. If
+        not given for a sparse T, the observable is propagated to all
+        times by matrix-vector products.
     ncv : int (optional)
         The number of Lanczos vectors generated, `ncv` must be greater than k;
         it is recommended that ncv > 2*k       
@@ -1336,6 +1461,8 @@ def correlation(T, obs1, obs2=None, times=(1), maxtime=None, k=None, ncv=None, r
     # check input
     # go
     if _issparse(T):
+        if k is None:
+            return sparse.correlations.correlation(T, obs1, obs2=obs2, times=times)
         return sparse.fingerprints.correlation(T, obs1, obs2=obs2, times=times, k=k, ncv=ncv)
     else:
         return dense.fingerprints.correlation(T, obs1, obs2=obs2, times=times, k=k)
@@ -1359,7 +1486,9 @@ def relaxation(T, p0, obs, times=(1), k=None, ncv=None):
     times : list of int (optional)
         List of times at which to compute expectation
     k : int (optional)
-        Number of eigenvalues and eigenvectors to use for computation
+        Number of eigenvalues and eigenvectors to use for computation. If
+        not given for a sparse T, the observable is propagated to all
+        times by matrix-vector products.
     ncv : int (optional)
         The number of Lanczos vectors generated, `ncv` must be greater than k;
         it is recommended that ncv > 2*k       
@@ -1410,6 +1539,8 @@ def relaxation(T, p0, obs, times=(1), k=None, ncv=None):
     times = _types.ensure_int_vector(times, require_order=True)
     # go
     if _issparse(T):
+        if k is None:
+            return sparse.correlations.relaxation(T, p0, obs, times=times)
         return sparse.fingerprints.relaxation(T, p0, obs, k=k, times=times)
     else:
         return dense.fingerprints.relaxation(T, p0, obs, k=k, times=times)
@@ -1434,10 +1565,9 @@ def _pcca_object(T, m):
     pcca : PCCA
         PCCA object
     """
+    T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
     if _issparse(T):
-        _showSparseConversionWarning()
-        T = T.toarray()
-    T = _types.ensure_ndarray(T, ndim=2, uniform=True, kind='numeric')
+        T = _csr_matrix(T)
     return PCCA(T, m)
 
 
@@ -1500,6 +1630,9 @@ def pcca_memberships(T, m):
     probabilities are computed via numerical optimization of the
     entries of a membership matrix.
 
+    For sparse T the memberships are computed from the m dominant
+    eigenvectors without converting T to a dense matrix.
+
     References
     ----------
     .. [1] Roeblitz, S and M Weber. 2013. Fuzzy spectral clustering by
@@ -1637,31 +1770,30 @@ def coarsegrain(P, m):
 # Sensitivities
 ################################################################################
 
-def _showSparseConversionWarning():
-    msg = ("Converting input to dense, since this method is currently only implemented for dense arrays")
-    warnings.warn(msg, UserWarning)
-
-
 def eigenvalue_sensitivity(T, k):
     r"""Sensitivity matrix of a specified eigenvalue.
     
     Parameters
     ----------
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
-    k : int
+    k : int or array_like
         Compute sensitivity matrix for k-th eigenvalue
 
     Returns
     -------
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix for k-th eigenvalue.
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
+        For an array of indices the sensitivities are computed from a
+        single decomposition and returned as (m, M, M) ndarray for dense
+        T and as list of scipy.sparse matrices for sparse T.
     
     """
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
     if _issparse(T):
-        _showSparseConversionWarning()
-        eigenvalue_sensitivity(T.todense(), k)
+        return sparse.sensitivity.eigenvalue_sensitivity(T, k)
     else:
         return dense.sensitivity.eigenvalue_sensitivity(T, k)
 
@@ -1671,21 +1803,25 @@ def timescale_sensitivity(T, k):
     
     Parameters
     ----------
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
-    k : int
+    k : int or array_like
         Compute sensitivity matrix for the k-th time-scale.
 
     Returns
     -------
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix for the k-th time-scale.
         
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
+        For an array of indices the sensitivities are computed from a
+        single decomposition and returned as (m, M, M) ndarray for dense
+        T and as list of scipy.sparse matrices for sparse T.
     """
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
     if _issparse(T):
-        _showSparseConversionWarning()
-        timescale_sensitivity(T.todense(), k)
+        return sparse.sensitivity.timescale_sensitivity(T, k)
     else:
         return dense.sensitivity.timescale_sensitivity(T, k)
 
@@ -1695,25 +1831,29 @@ def eigenvector_sensitivity(T, k, j, right=True):
     
     Parameters
     ----------
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix (stochastic matrix).
-    k : int
+    k : int or array_like
         Eigenvector index 
-    j : int
-        Element index 
+    j : int or array_like
+        Element index, broadcast against k
     right : bool
         If True compute for right eigenvector, otherwise compute for left eigenvector.
 
     Returns
     -------
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix for the j-th element of the k-th eigenvector.
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
+        For an array of indices the sensitivities are computed from a
+        single decomposition and returned as (m, M, M) ndarray for dense
+        T and as list of scipy.sparse matrices for sparse T.
     
     """
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
     if _issparse(T):
-        _showSparseConversionWarning()
-        eigenvector_sensitivity(T.todense(), k, j, right=right)
+        return sparse.sensitivity.eigenvector_sensitivity(T, k, j, right=right)
     else:
         return dense.sensitivity.eigenvector_sensitivity(T, k, j, right=right)
 
@@ -1724,24 +1864,28 @@ def stationary_distribution_sensitivity(T, j):
     
     Parameters
     ----------
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
        Transition matrix (stochastic matrix).
-    j : int
+    j : int or array_like
         Index of stationary distribution element
         for which sensitivity matrix is computed.
         
 
     Returns
     -------
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix for the specified element
         of the stationary distribution.
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
+        For an array of indices the sensitivities are computed from a
+        single decomposition and returned as (m, M, M) ndarray for dense
+        T and as list of scipy.sparse matrices for sparse T.
     
     """
     T = _types.ensure_ndarray_or_sparse(T, ndim=2, uniform=True, kind='numeric')
     if _issparse(T):
-        _showSparseConversionWarning()
-        stationary_distribution_sensitivity(T.todense(), j)
+        return sparse.sensitivity.stationary_distribution_sensitivity(T, j)
     else:
         return dense.sensitivity.stationary_distribution_sensitivity(T, j)
 
@@ -1751,17 +1895,22 @@ def mfpt_sensitivity(T, target, i):
     
     Parameters
     ----------
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix 
     target : int or list
         Target state or set for mfpt computation
-    i : int
+    i : int or array_like
         Compute the sensitivity for state `i`
         
     Returns
     -------
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix for specified state
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
+        For an array of indices the sensitivities are computed from a
+        single decomposition and returned as (m, M, M) ndarray for dense
+        T and as list of scipy.sparse matrices for sparse T.
     
     """
     # check input
@@ -1769,8 +1918,7 @@ def mfpt_sensitivity(T, target, i):
     target = _types.ensure_int_vector(target)
     # go
     if _issparse(T):
-        _showSparseConversionWarning()
-        mfpt_sensitivity(T.todense(), target, i)
+        return sparse.sensitivity.mfpt_sensitivity(T, target, i)
     else:
         return dense.sensitivity.mfpt_sensitivity(T, target, i)
 
@@ -1781,13 +1929,13 @@ def committor_sensitivity(T, A, B, i, forward=True):
     Parameters
     ----------
     
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
     A : array_like
         List of integer state labels for set A
     B : array_like
         List of integer state labels for set B
-    i : int
+    i : int or array_like
         Compute the sensitivity for committor entry `i`
     forward : bool (optional)
         Compute the forward committor. If forward
@@ -1795,8 +1943,13 @@ def committor_sensitivity(T, A, B, i, forward=True):
     
     Returns
     -------    
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix of the specified committor entry.
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
+        For an array of indices the sensitivities are computed from a
+        single decomposition and returned as (m, M, M) ndarray for dense
+        T and as list of scipy.sparse matrices for sparse T.
     
     """
     # check inputs
@@ -1804,8 +1957,10 @@ def committor_sensitivity(T, A, B, i, forward=True):
     A = _types.ensure_int_vector(A)
     B = _types.ensure_int_vector(B)
     if _issparse(T):
-        _showSparseConversionWarning()
-        committor_sensitivity(T.todense(), A, B, i, forward)
+        if forward:
+            return sparse.sensitivity.forward_committor_sensitivity(T, A, B, i)
+        else:
+            return sparse.sensitivity.backward_committor_sensitivity(T, A, B, i)
     else:
         if forward:
             return dense.sensitivity.forward_committor_sensitivity(T, A, B, i)
@@ -1818,15 +1973,17 @@ def expectation_sensitivity(T, a):
 
     Parameters
     ----------
-    T : (M, M) ndarray
+    T : (M, M) ndarray or scipy.sparse matrix
         Transition matrix
     a : (M,) ndarray
         Observable, a[i] is the value of the observable at state i.
 
     Returns
     -------
-    S : (M, M) ndarray
+    S : (M, M) ndarray or scipy.sparse matrix
         Sensitivity matrix of the expectation value.
+        For sparse T, the sensitivity is evaluated on the sparsity
+        pattern of T and returned as scipy.sparse matrix.
     
     """
     # check input
@@ -1834,7 +1991,6 @@ def expectation_sensitivity(T, a):
     a = _types.ensure_float_vector(a, require_order=True)
     # go
     if _issparse(T):
-        _showSparseConversionWarning()
-        return dense.sensitivity.expectation_sensitivity(T.toarray(), a)
+        return sparse.sensitivity.expectation_sensitivity(T, a)
     else:
         return dense.sensitivity.expectation_sensitivity(T, a)
@@ -31,6 +31,8 @@ Created on 29.11.2013
 
 import numpy as np
 
+from msmtools.analysis.sparse.correlations import _check_products, _time_products_by_mtx_vec_prod
+
 from decomposition import rdl_decomposition
 
 
@@ -111,17 +113,17 @@ def time_correlation_direct_by_mtx_vec_prod(P, mu, obs1, obs2=None, time=1, star
         r = xrange(t_diff)
     else:
         if time >= 2:
-            P_i_obs = np.dot(P, np.dot(P, obs2))  # vector <P, <P, obs2> := P^2 * obs
+            P_i_obs = P.dot(P.dot(obs2))  # vector <P, <P, obs2> := P^2 * obs
             r = xrange(time - 2)
         elif time == 1:
-            P_i_obs = np.dot(P, obs2)  # P^1 = P*obs
+            P_i_obs = P.dot(obs2)  # P^1 = P*obs
             r = xrange(0)
         elif time == 0:  # P^0 = I => I*obs2 = obs2
             P_i_obs = obs2
             r = xrange(0)
 
     for k in r:  # since we already substituted started with 0
-        P_i_obs = np.dot(P, P_i_obs)
+        P_i_obs = P.dot(P_i_obs)
     corr = np.dot(l, P_i_obs)
     if return_P_k_obs:
         return corr, (time, P_i_obs)
@@ -138,11 +140,12 @@ def time_correlations_direct(P, pi, obs1, obs2=None, times=[1]):
     
     Parameters
     ----------
-    P : ndarray, shape=(n, n) or scipy.sparse matrix
+    P : ndarray, shape=(n, n)
         Transition matrix
-    obs1 : ndarray, shape=(n)
-        Vector representing observable 1 on discrete states
-    obs2 : ndarray, shape=(n)
+    obs1 : ndarray, shape=(n) or (n, m)
+        Vector representing observable 1 on discrete states, or a matrix
+        with m observables in its columns
+    obs2 : ndarray, shape=(n) or (n, m)
         Vector representing observable 2 on discrete states. If not given,
         the autocorrelation of obs1 will be computed
     pi : ndarray, shape=(n)
@@ -152,37 +155,69 @@ def time_correlations_direct(P, pi, obs1, obs2=None, times=[1]):
     
     Returns
     -------
-    
+    correlations : ndarray, shape(n_t) or (n_t, m)
+        Correlations at the given times in increasing order of time, one
+        column per pair of observables
+
     """
-    n_t = len(times)
-    times = np.sort(times)  # sort it to use caching of previously computed correlations
-    f = np.zeros(n_t)
-
-    # maximum time > number of rows?
-    if times[-1] > P.shape[0]:
-        use_diagonalization = True
-        R, D, L = rdl_decomposition(P)
-        # discard imaginary part, if all elements i=0
-        if not np.any(np.iscomplex(R)):
-            R = np.real(R)
-        if not np.any(np.iscomplex(D)):
-            D = np.real(D)
-        if not np.any(np.iscomplex(L)):
-            L = np.real(L)
-        rdl = (R, D, L)
-
-    if use_diagonalization:
-        for i in xrange(n_t):
-            f[i] = time_correlation_by_diagonalization(P, pi, obs1, obs2, times[i], rdl)
+    times = np.sort(times)
+    if obs2 is None:
+        obs2 = obs1
+    obs1 = np.asarray(obs1)
+    if obs1.ndim == 2:
+        l = pi[:, np.newaxis] * obs1
     else:
-        start_values = None
-        for i in xrange(n_t):
-            f[i], start_values = \
-                time_correlation_direct_by_mtx_vec_prod(P, pi, obs1, obs2,
-                                                        times[i], start_values, True)
+        l = pi * obs1
+    return time_products(P, l, obs2, times)
+
+
+def time_products(P, l, r, times=[1]):
+    r"""Compute the products l' P^k r for all given times k at once.
+
+    For times up to the number of states, the times are sorted and a single
+    (block) vector is propagated from one requested time to the next, up to
+    the largest time, see msmtools.analysis.sparse.correlations. The side
+    with fewer columns is the one being propagated. For longer times, the
+    powers of P are evaluated once by diagonalization.
+
+    Parameters
+    ----------
+    P : ndarray, shape=(n, n)
+        Transition matrix
+    l : ndarray, shape=(n) or (n, m)
+        Left vector, or m left vectors in the columns of a matrix
+    r : ndarray, shape=(n) or (n, m)
+        Right vector, or m right vectors in the columns of a matrix
+    times : array-like, shape(n_t)
+        Vector of non-negative integer time points
+
+    Returns
+    -------
+    products : ndarray, shape(n_t) or (n_t, m)
+        Products l' P^k r at the given times, one column per pair of
+        columns of l and r
+
+    """
+    l, r, times, single = _check_products(P, l, r, times)
+    if times.size > 0 and times.max() > P.shape[0]:
+        f = _time_products_by_diagonalization(P, l, r, times)
+    else:
+        f = _time_products_by_mtx_vec_prod(P, l, r, times)
+    if single:
+        f = f[:, 0]
     return f
 
 
+def _time_products_by_diagonalization(P, l, r, times):
+    R, D, L = rdl_decomposition(P)
+    ev = np.diagonal(D)
+    # amplitudes of the eigenmodes for every pair of columns
+    amplitudes = np.dot(l.T, R).T * np.dot(L, r)
+    ev_t = ev[np.newaxis, :] ** times[:, np.newaxis]
+    # imaginary parts cancel
+    return np.dot(ev_t, amplitudes).real
+
+
 def time_relaxation_direct_by_mtx_vec_prod(P, p0, obs, time=1, start_values=None, return_pP_k=False):
     r"""Compute time-relaxations of obs with respect of given initial distribution.
     
@@ -222,17 +257,17 @@ def time_relaxation_direct_by_mtx_vec_prod(P, p0, obs, time=1, start_values=None
         r = xrange(t_diff)
     else:
         if time >= 2:
-            pk_i = np.dot(np.dot(p0, P), P)  # pk_2
+            pk_i = P.T.dot(P.T.dot(p0))  # pk_2
             r = xrange(time - 2)
         elif time == 1:
-            pk_i = np.dot(p0, P)  # propagate once
+            pk_i = P.T.dot(p0)  # propagate once
             r = xrange(0)
         elif time == 0:  # P^0 = I => p0*I = p0
             pk_i = p0
             r = xrange(0)
 
     for k in r:  # perform the rest of the propagations p0 P^t_diff
-        pk_i = np.dot(pk_i, P)
+        pk_i = P.T.dot(pk_i)
 
     # result
     l = np.dot(pk_i, obs)
@@ -264,42 +299,24 @@ def time_relaxations_direct(P, p0, obs, times=[1]):
     
     Parameters
     ----------
-    P : ndarray, shape=(n, n) or scipy.sparse matrix
+    P : ndarray, shape=(n, n)
         Transition matrix
     p0 : ndarray, shape=(n)
         initial distribution
-    obs : ndarray, shape=(n)
-        Vector representing observable on discrete states. 
+    obs : ndarray, shape=(n) or (n, m)
+        Vector representing observable on discrete states, or a matrix
+        with m observables in its columns
     times : array-like, shape(n_t)
         Vector of time points at which the (auto)correlation will be evaluated 
     
     Returns
     -------
-    relaxations : ndarray, shape(n_t)
+    relaxations : ndarray, shape(n_t) or (n_t, m)
+        Relaxations at the given times in increasing order of time
     """
-    n_t = len(times)
     times = np.sort(times)
-
-    # maximum time > number of rows?
-    if times[-1] > P.shape[0]:
-        use_diagonalization = True
-        R, D, L = rdl_decomposition(P)
-        # discard imaginary part, if all elements i=0
-        if not np.any(np.iscomplex(R)):
-            R = np.real(R)
-        if not np.any(np.iscomplex(D)):
-            D = np.real(D)
-        if not np.any(np.iscomplex(L)):
-            L = np.real(L)
-        rdl = (R, D, L)
-
-    f = np.empty(n_t, dtype=D.dtype)
-
-    if use_diagonalization:
-        for i in xrange(n_t):
-            f[i] = time_relaxation_direct_by_diagonalization(P, p0, obs, times[i], rdl)
-    else:
-        start_values = None
-        for i in xrange(n_t):
-            f[i], start_values = time_relaxation_direct_by_mtx_vec_prod(P, p0, obs, times[i], start_values, True)
-    return f
\ No newline at end of file
+    p0 = np.asarray(p0)
+    if p0.shape[0] != P.shape[0]:
+        raise ValueError("shape of init dist p0 (%s) not compatible with given matrix (shape=%s)"
+                         % (p0.shape[0], P.shape))
+    return time_products(P, p0, obs, times)
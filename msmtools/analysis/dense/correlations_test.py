@@ -150,6 +150,31 @@ class TestCorrelations(unittest.TestCase):
 
         assert_allclose(expected, result)
 
+    def test_time_products_many_observables(self):
+        """all observables at once for unsorted times"""
+        obs = np.random.random((10, 3))
+        p0 = np.random.random(10)
+        p0 /= p0.sum()
+        times = [20, 0, 3, 7, 3]
+        """results are returned in increasing order of time"""
+        corr_expected = np.array([np.dot(self.mu * obs[:, j], np.dot(np.linalg.matrix_power(self.T, t), obs[:, j]))
+                                  for t in sorted(times) for j in range(3)]).reshape(len(times), 3)
+        rel_expected = np.array([np.dot(np.dot(p0, np.linalg.matrix_power(self.T, t)), obs) for t in sorted(times)])
+        assert_allclose(correlations.time_correlations_direct(self.T, self.mu, obs, times=times), corr_expected)
+        assert_allclose(correlations.time_relaxations_direct(self.T, p0, obs, times=times), rel_expected)
+        for j in range(3):
+            assert_allclose(correlations.time_correlations_direct(self.T, self.mu, obs[:, j], times=times),
+                            corr_expected[:, j])
+            assert_allclose(correlations.time_relaxations_direct(self.T, p0, obs[:, j], times=times),
+                            rel_expected[:, j])
+
+        """long times are evaluated by diagonalization"""
+        times = [1000, 15]
+        rel_expected = np.array([np.dot(np.dot(p0, np.linalg.matrix_power(self.T, t)), obs) for t in sorted(times)])
+        assert_allclose(correlations.time_relaxations_direct(self.T, p0, obs, times=times), rel_expected)
+
+        with self.assertRaises(ValueError):
+            correlations.time_relaxations_direct(self.T, p0, obs, times=[-1])
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -33,6 +33,8 @@ dynamical fingerprints, expectations and correlations
 
 import numpy as np
 
+from msmtools.util import propagation
+
 from decomposition import rdl_decomposition, timescales_from_eigenvalues
 from decomposition import stationary_distribution_from_backward_iteration as statdist
 
@@ -51,9 +53,10 @@ def fingerprint_correlation(P, obs1, obs2=None, tau=1, k=None):
     ----------
     P : (M, M) ndarray
         Transition matrix
-    obs1 : (M,) ndarray
-        Observable, represented as vector on state space
-    obs2 : (M,) ndarray (optional)
+    obs1 : (M,) or (M, K) ndarray
+        Observable, represented as vector on state space, or K observables
+        in the columns of a matrix
+    obs2 : (M,) or (M, K) ndarray (optional)
         Second observable, for cross-correlations    
     tau : int (optional)
         Lag time of given transition matrix, for correct time-scales
@@ -64,8 +67,8 @@ def fingerprint_correlation(P, obs1, obs2=None, tau=1, k=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the correlation experiment
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the correlation experiment, one column per observable
 
     """
     return fingerprint(P, obs1, obs2=obs2, k=k, tau=tau)
@@ -81,9 +84,10 @@ def fingerprint_relaxation(P, p0, obs, tau=1, k=None):
     ----------
     P : (M, M) ndarray
         Transition matrix
-    obs1 : (M,) ndarray
-        Observable, represented as vector on state space
-    obs2 : (M,) ndarray (optional)
+    obs1 : (M,) or (M, K) ndarray
+        Observable, represented as vector on state space, or K observables
+        in the columns of a matrix
+    obs2 : (M,) or (M, K) ndarray (optional)
         Second observable, for cross-correlations    
     tau : int (optional)
         Lag time of given transition matrix, for correct time-scales
@@ -94,8 +98,8 @@ def fingerprint_relaxation(P, p0, obs, tau=1, k=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the relaxation experiment
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the relaxation experiment, one column per observable
         
     """
     one_vec = np.ones(P.shape[0])
@@ -111,9 +115,10 @@ def fingerprint(P, obs1, obs2=None, p0=None, tau=1, k=None):
     ----------
     P : (M, M) ndarray
         Transition matrix
-    obs1 : (M,) ndarray
-        Observable, represented as vector on state space
-    obs2 : (M,) ndarray (optional)
+    obs1 : (M,) or (M, K) ndarray
+        Observable, represented as vector on state space, or K observables
+        in the columns of a matrix
+    obs2 : (M,) or (M, K) ndarray (optional)
         Second observable, for cross-correlations
     p0 : (M,) ndarray (optional)
         Initial distribution for a relaxation experiment
@@ -126,8 +131,8 @@ def fingerprint(P, obs1, obs2=None, p0=None, tau=1, k=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the given observable(s)
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the given observable(s), one column per observable
         
     """
     if obs2 is None:
@@ -142,10 +147,16 @@ def fingerprint(P, obs1, obs2=None, p0=None, tau=1, k=None):
     if p0 is None:
         """Use stationary distribution - we can not use only left
         eigenvectors since the system might be non-reversible"""
-        amplitudes = np.dot(mu * obs1, R) * np.dot(L, obs2)
+        w = mu
     else:
         """Use initial distribution"""
-        amplitudes = np.dot(p0 * obs1, R) * np.dot(L, obs2)
+        w = p0
+    if obs1.ndim == 2 or obs2.ndim == 2:
+        """Observables in the columns of a matrix, all amplitudes by matrix-matrix products"""
+        obs1 = obs1.reshape((obs1.shape[0], -1))
+        obs2 = obs2.reshape((obs2.shape[0], -1))
+        w = w[:, np.newaxis]
+    amplitudes = np.dot(R.T, w * obs1) * np.dot(L, obs2)
     return timescales, amplitudes
 
 
@@ -455,7 +466,4 @@ def propagate(A, x, N):
         Propagated vector
     
     """
-    y = 1.0 * x
-    for i in range(N):
-        y = np.dot(A, y)
-    return y
\ No newline at end of file
+    return propagation.propagate(A, x, N)
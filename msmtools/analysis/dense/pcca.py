@@ -31,7 +31,10 @@ https://github.com/CMD-at-ZIB/ZIBMolPy/blob/master/ZIBMolPy_package/ZIBMolPy/alg
 '''
 
 import numpy as np
-import math
+
+from scipy.sparse import issparse, diags, csr_matrix, identity
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import eigsh, eigs, splu
 
 
 def _pcca_connected_isa(evec, n_clusters):
@@ -91,32 +94,25 @@ def _pcca_connected_isa(evec, n_clusters):
     c = evec[:, range(n_clusters)]
 
     ortho_sys = np.copy(c)
-    max_dist = 0.0
 
     # representative states
     ind = np.zeros(n_clusters, dtype=np.int32)
 
     # select the first representative as the most outlying point
-    for (i, row) in enumerate(c):
-        if np.linalg.norm(row, 2) > max_dist:
-            max_dist = np.linalg.norm(row, 2)
-            ind[0] = i
+    ind[0] = np.argmax(np.linalg.norm(c, 2, axis=1))
 
     # translate coordinates to make the first representative the origin
     ortho_sys -= c[ind[0], None]
 
     # select the other m-1 representatives using a Gram-Schmidt orthogonalization
     for k in range(1, n_clusters):
-        max_dist = 0.0
         temp = np.copy(ortho_sys[ind[k - 1]])
 
         # select next farthest point that is not yet a representative
-        for (i, row) in enumerate(ortho_sys):
-            row -= np.dot(np.dot(temp, np.transpose(row)), temp)
-            distt = np.linalg.norm(row, 2)
-            if distt > max_dist and i not in ind[0:k]:
-                max_dist = distt
-                ind[k] = i
+        ortho_sys -= np.outer(np.dot(ortho_sys, temp), temp)
+        dist = np.linalg.norm(ortho_sys, 2, axis=1)
+        dist[ind[0:k]] = 0.0
+        ind[k] = np.argmax(dist)
         ortho_sys /= np.linalg.norm(ortho_sys[ind[k]], 2)
 
     # print "Final selection ", ind
@@ -173,28 +169,59 @@ def _opt_soft(eigvectors, rot_matrix, n_clusters):
     # reshape rot_crop_matrix into linear vector
     rot_crop_vec = np.reshape(rot_crop_matrix, x * y)
 
-    # Susanna Roeblitz' target function for optimization
-    def susanna_func(rot_crop_vec, eigvectors):
+    # Susanna Roeblitz' target function for optimization and its gradient. The column maxima
+    # are smoothed by a log-sum-exp of width tau, tau = 0 gives the original target function.
+    def susanna_func(rot_crop_vec, V, tau):
         # reshape into matrix
         rot_crop_matrix = np.reshape(rot_crop_vec, (x, y))
-        # fill matrix
-        rot_matrix = _fill_matrix(rot_crop_matrix, eigvectors)
-
-        result = 0
-        for i in range(0, n_clusters):
-            for j in range(0, n_clusters):
-                result += np.power(rot_matrix[j, i], 2) / rot_matrix[0, i]
-        return -result
-
-    from scipy.optimize import fmin
-
-    rot_crop_vec_opt = fmin(susanna_func, rot_crop_vec, args=(eigvectors,), disp=False)
+        # fill matrix without normalization: first row colmax, other rows Z
+        Z = np.concatenate((-np.sum(rot_crop_matrix, axis=1)[:, None], rot_crop_matrix), axis=1)
+        tmp = -np.dot(V, Z)
+        if tau > 0.0:
+            tmp_max = np.max(tmp, axis=0)
+            tmp -= tmp_max
+            tmp /= tau
+            W = np.exp(tmp, out=tmp)
+            W_sum = np.sum(W, axis=0)
+            colmax = tmp_max + tau * np.log(W_sum)
+            d_colmax_d_Z = -np.dot(V.T, W) / W_sum
+        else:
+            imax = np.argmax(tmp, axis=0)
+            colmax = tmp[imax, np.arange(y + 1)]
+            d_colmax_d_Z = -V[imax].T
+        s = np.sum(colmax)
+
+        # sum_ij rot_matrix[j, i]^2 / rot_matrix[0, i] for rot_matrix = [colmax; Z] / s
+        q = np.sum(Z ** 2, axis=0)
+        F = np.sum(colmax + q / colmax)
+        result = F / s
+
+        # derivative with respect to the column maxima and to Z
+        d_colmax = (1.0 - q / colmax ** 2) / s - F / s ** 2
+        d_Z = 2.0 * Z / (colmax * s) + d_colmax_d_Z * d_colmax[np.newaxis, :]
+        # the first column of Z is minus the row sum of the cropped matrix
+        grad = d_Z[:, 1:] - d_Z[:, 0, np.newaxis]
+        return -result, -np.reshape(grad, x * y)
+
+    from scipy.optimize import fmin_l_bfgs_b
+
+    # The target function is not differentiable where the maximizing state of a column changes.
+    # Optimize the smoothed function first and refine with the original one.
+    V = np.ascontiguousarray(eigvectors[:, 1:])
+    tau = 1e-4 * np.max(np.abs(V))
+    rot_crop_vec_opt, _, _ = fmin_l_bfgs_b(susanna_func, rot_crop_vec, args=(V, tau))
+    rot_crop_vec_opt, f_opt, _ = fmin_l_bfgs_b(susanna_func, rot_crop_vec_opt, args=(V, 0.0))
+
+    # keep the initial rotation matrix if it is better
+    if susanna_func(rot_crop_vec, V, 0.0)[0] < f_opt:
+        rot_crop_vec_opt = rot_crop_vec
 
     rot_crop_matrix = np.reshape(rot_crop_vec_opt, (x, y))
     rot_matrix = _fill_matrix(rot_crop_matrix, eigvectors)
 
     return rot_matrix
 
+
 def _fill_matrix(rot_crop_matrix, eigvectors):
     """
     Helper function for opt_soft
@@ -223,6 +250,36 @@ def _fill_matrix(rot_crop_matrix, eigvectors):
     return rot_matrix
 
 
+def _pcca_eigenvectors(P, pi, n):
+    """
+    Dominant right eigenvectors of a reversible transition matrix, orthonormal with respect to pi
+
+    For sparse P only the n dominant eigenvectors of the symmetrized matrix
+    D^1/2 P D^-1/2 are computed with ARPACK, D = diag(pi). Metastable
+    eigenvalues cluster at one, they are computed in shift-invert mode
+    with a shift slightly above one.
+
+    """
+    if issparse(P) and n < P.shape[0] - 1:
+        sqrt_pi = np.sqrt(pi)
+        S = diags(sqrt_pi, 0).dot(P).dot(diags(1.0 / sqrt_pi, 0))
+        S = 0.5 * (S + S.transpose())
+        vals, U = eigsh(S.tocsc(), k=n, sigma=1.0 + 1e-8, which='LM')
+        U = U[:, np.argsort(vals)[::-1]]
+        return U / sqrt_pi[:, None]
+
+    # right eigenvectors, ordered
+    from msmtools.analysis import eigenvectors
+
+    if issparse(P):
+        P = P.toarray()
+    evecs = eigenvectors(P, n)
+
+    # orthonormalize
+    evecs /= np.sqrt(np.sum(evecs * pi[:, None] * evecs, axis=0))[None, :]
+    return evecs
+
+
 def _pcca_connected(P, n, return_rot=False):
     """
     PCCA+ spectral clustering method with optimized memberships [1]_
@@ -232,7 +289,7 @@ def _pcca_connected(P, n, return_rot=False):
     
     Parameters
     ----------
-    P : ndarray (n,n)
+    P : ndarray (n,n) or scipy.sparse matrix
         Transition matrix.
     
     n : int
@@ -281,14 +338,8 @@ def _pcca_connected(P, n, return_rot=False):
     #      orthonormalize all eigenvectors e.g. using Gram-Schmidt orthonormalization. Currently there is no theoretical
     #      foundation for this, so I'll skip it for now.
 
-    # right eigenvectors, ordered
-    from msmtools.analysis import eigenvectors
-
-    evecs = eigenvectors(P, n)
-
-    # orthonormalize
-    for i in range(n):
-        evecs[:, i] /= math.sqrt(np.dot(evecs[:, i] * pi, evecs[:, i]))
+    # right eigenvectors, ordered and orthonormal with respect to pi
+    evecs = _pcca_eigenvectors(P, pi, n)
     # make first eigenvector positive
     evecs[:, 0] = np.abs(evecs[:, 0])
 
@@ -315,14 +366,62 @@ def _pcca_connected(P, n, return_rot=False):
     memberships = np.maximum(0.0, memberships)
     memberships = np.minimum(1.0, memberships)
     # print "memberships unnormalized: ",memberships
-    for i in range(0, np.shape(memberships)[0]):
-        memberships[i] /= np.sum(memberships[i])
+    memberships /= np.sum(memberships, axis=1)[:, None]
 
     # print "final chi = \n",chi
 
     return memberships
 
 
+def _components(P):
+    """
+    Strongly connected components of P and their classification
+
+    Components are ordered by decreasing size and components of equal size by their smallest state.
+    A component is closed if no transition leaves it. The classification uses the component labels
+    of all transitions of the CSR matrix P at once.
+
+    """
+    n = P.shape[0]
+    n_components, labels = connected_components(P, directed=True, connection='strong')
+    # states grouped by component label, increasing within each component
+    sizes = np.bincount(labels, minlength=n_components)
+    states = np.argsort(labels, kind='mergesort')
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    order = np.lexsort((states[offsets[:-1]], -sizes))
+    components = [states[offsets[i]:offsets[i + 1]] for i in order]
+
+    # a component is not closed if a transition leaves it
+    rows = np.repeat(np.arange(n), np.diff(P.indptr))
+    leaving = (labels[rows] != labels[P.indices]) & (P.data != 0.0)
+    closed = np.ones(n_components, dtype=bool)
+    closed[labels[rows[leaving]]] = False
+    return components, closed[order]
+
+
+def _subdominant_eigenvalues(P, components, k, dense_size=100):
+    """
+    Real parts of the k largest eigenvalues after the eigenvalue one for each closed component
+
+    Components with at most dense_size states are diagonalized densely, all components of the same
+    size in one batched call. Larger components use ARPACK in shift-invert mode.
+
+    """
+    ev = [None] * len(components)
+    sizes = np.array([component.size for component in components])
+    for size in np.unique(sizes[sizes <= max(dense_size, k + 2)]):
+        ind = np.where(sizes == size)[0]
+        blocks = np.array([P[components[i], :][:, components[i]].toarray() for i in ind])
+        vals = np.sort(np.real(np.linalg.eigvals(blocks)), axis=1)[:, ::-1]
+        for j, i in enumerate(ind):
+            ev[i] = vals[j, 1:k + 1]
+    for i in np.where(sizes > max(dense_size, k + 2))[0]:
+        Psub = P[components[i], :][:, components[i]].tocsc()
+        vals = eigs(Psub, k=k + 1, sigma=1.0 + 1e-8, which='LM', return_eigenvectors=False)
+        ev[i] = np.sort(np.real(vals))[::-1][1:k + 1]
+    return ev
+
+
 def pcca(P, m):
     """
     PCCA+ spectral clustering method with optimized memberships [1]_
@@ -333,8 +432,8 @@ def pcca(P, m):
     
     Parameters
     ----------
-    P : ndarray (n,n)
-        Transition matrix.
+    P : ndarray (n,n) or scipy.sparse matrix
+        Transition matrix. For sparse P only the dominant eigenvectors are computed.
     
     m : int
         Number of clusters to group to.
@@ -345,7 +444,8 @@ def pcca(P, m):
     
     chi : ndarray (n x m)
         A matrix containing the probability or membership of each state to be assigned to each cluster.
-        The rows sum to 1.
+        The rows sum to 1. The columns are ordered by the first state that has its largest membership
+        in the respective cluster, so dense and sparse input give the same column order.
         
     References
     ----------
@@ -355,11 +455,9 @@ def pcca(P, m):
     [2] F. Noe, multiset PCCA and HMMs, in preparation.
         
     """
-    # imports
-    from msmtools.estimation import connected_sets
-    from msmtools.analysis import eigenvalues, is_transition_matrix, hitting_probability
-
     # validate input
+    from msmtools.analysis import is_transition_matrix
+
     n = np.shape(P)[0]
     if (m > n):
         raise ValueError("Number of metastable states m = " + str(m)+
@@ -370,87 +468,76 @@ def pcca(P, m):
     # prepare output
     chi = np.zeros((n, m))
 
-    # test connectivity
-    components = connected_sets(P)
-    # print "all labels ",labels
-    n_components = len(components)  # (n_components, labels) = connected_components(P, connection='strong')
-    # print 'n_components'
-
-    # store components as closed (with positive equilibrium distribution)
-    # or as transition states (with vanishing equilibrium distribution)
-    closed_components = []
-    transition_states = []
-    for i in range(n_components):
-        component = components[i]  # np.argwhere(labels==i).flatten()
-        rest = list(set(range(n)) - set(component))
-        # is component closed?
-        if (np.sum(P[component, :][:, rest]) == 0):
-            closed_components.append(component)
-        else:
-            transition_states.append(component)
+    # components are closed (with positive equilibrium distribution)
+    # or consist of transition states (with vanishing equilibrium distribution)
+    P_csr = csr_matrix(P)
+    components, closed = _components(P_csr)
+    closed_components = [components[i] for i in np.where(closed)[0]]
     n_closed_components = len(closed_components)
-    closed_states = np.array(closed_components, dtype=int).flatten()
-    transition_states = np.array(transition_states, dtype=int).flatten()
+    closed_states = np.concatenate(closed_components)
+    transition_states = np.setdiff1d(np.arange(n), closed_states)
 
     # check if we have enough clusters to support the disconnected sets
-    if (m < len(closed_components)):
+    if (m < n_closed_components):
         raise ValueError("Number of metastable states m = " + str(m) + " is too small. Transition matrix has " +
-                         str(len(closed_components)) + " disconnected components")
+                         str(n_closed_components) + " disconnected components")
+
+    # Every closed component gets one cluster, the remaining clusters go to the
+    # components with the largest subdominant eigenvalues
+    m_by_component = np.ones(n_closed_components, dtype=int)
+    if n_closed_components == 1:
+        m_by_component[0] = m
+    elif m > n_closed_components:
+        ev = _subdominant_eigenvalues(P_csr, closed_components, m - n_closed_components)
+        ev_flat = np.concatenate(ev)
+        enum_flat = np.concatenate([i * np.ones(ev[i].size, dtype=int) for i in range(n_closed_components)])
+        selected = enum_flat[np.argsort(-ev_flat, kind='mergesort')][0:m - n_closed_components]
+        m_by_component += np.bincount(selected, minlength=n_closed_components)
 
-    # We collect eigenvalues in order to decide which
-    closed_components_Psub = []
-    closed_components_ev = []
-    closed_components_enum = []
-    for i in range(n_closed_components):
-        component = closed_components[i]
-        # print "component ",i," ",component
-        # compute eigenvalues in submatrix
-        Psub = P[component, :][:, component]
-        closed_components_Psub.append(Psub)
-        closed_components_ev.append(eigenvalues(Psub))
-        closed_components_enum.append(i * np.ones((component.size), dtype=int))
-
-    # flatten
-    closed_components_ev_flat = np.array(closed_components_ev).flatten()
-    closed_components_enum_flat = np.array(closed_components_enum).flatten()
-    # which components should be clustered?
-    component_indexes = closed_components_enum_flat[np.argsort(closed_components_ev_flat)][0:m]
     # cluster each component
     ipcca = 0
     for i in range(n_closed_components):
         component = closed_components[i]
-        # how many PCCA states in this component?
-        m_by_component = np.shape(np.argwhere(component_indexes == i))[0]
 
         # if 1, then the result is trivial
-        if (m_by_component == 1):
+        if (m_by_component[i] == 1):
             chi[component, ipcca] = 1.0
-            ipcca += 1
-        elif (m_by_component > 1):
-            #print "submatrix: ",closed_components_Psub[i]
-            chi[component, ipcca:ipcca + m_by_component] = _pcca_connected(closed_components_Psub[i], m_by_component)
-            ipcca += m_by_component
         else:
-            raise RuntimeError("Component " + str(i) + " spuriously has " + str(m_by_component) + " pcca sets")
+            Psub = P_csr[component, :][:, component]
+            # small components are handled densely
+            if not issparse(P) or component.size <= 100:
+                Psub = Psub.toarray()
+            chi[component, ipcca:ipcca + m_by_component[i]] = _pcca_connected(Psub, m_by_component[i])
+        ipcca += m_by_component[i]
 
     # finally assign all transition states
-    # print "chi\n", chi
-    # print "transition states: ",transition_states
-    # print "closed states: ", closed_states    
     if (transition_states.size > 0):
-        # make all closed states absorbing, so we can see which closed state we hit first
-        Pabs = P.copy()
-        Pabs[closed_states, :] = 0.0
-        Pabs[closed_states, closed_states] = 1.0
-        for i in range(closed_states.size):
-            # hitting probability to each closed state
-            h = hitting_probability(Pabs, closed_states[i])
-            for j in range(transition_states.size):
-                # transition states belong to closed states with the hitting probability, and inherit their chi
-                chi[transition_states[j]] += h[transition_states[j]] * chi[closed_states[i]]
+        # transition states belong to the closed states with the probability of hitting them first,
+        # and inherit their chi: chi on the transition states solves (I - P_TT) chi_T = P_TC chi_C
+        P_T = P_csr[transition_states, :]
+        A = identity(transition_states.size, format='csc') - P_T[:, transition_states].tocsc()
+        b = P_T[:, closed_states].dot(chi[closed_states])
+        chi[transition_states] = splu(A).solve(b)
 
     # print "chi\n", chi
-    return chi
+    return chi[:, _canonical_order(chi)]
+
+
+def _canonical_order(chi):
+    """
+    Column order of the memberships chi by the first state that is assigned to each cluster
+
+    The order of the clusters found by PCCA+ depends on the signs and the basis of the computed
+    eigenvectors, which differ between the dense and the sparse eigensolvers. Clusters are ordered
+    by the first state that has its largest membership in them. Clusters that are not the largest
+    membership of any state are ordered by their dominant state, after all other clusters.
+
+    """
+    n, m = chi.shape
+    first = n + np.argmax(chi, axis=0)
+    labels, index = np.unique(np.argmax(chi, axis=1), return_index=True)
+    first[labels] = index
+    return np.argsort(first, kind='mergesort')
 
 
 def coarsegrain(P, n):
@@ -474,18 +561,30 @@ def coarsegrain(P, n):
         J. Chem. Phys. 139, 184114 (2013)
     """
     M = pcca(P, n)
-    # coarse-grained transition matrix
+    from msmtools.analysis import stationary_distribution
+    P_coarse, pi_coarse = _coarse_grain(P, M, stationary_distribution(P))
+    return P_coarse
+
+
+def _coarse_grain(P, M, pi):
+    """
+    Coarse-grained transition matrix M^T P M (M^T M)^{-1} and stationary distribution M^T pi
+
+    P may be sparse, it only enters through the product P M, so that the cost is O(nnz(P) m)
+    for n x m memberships M. The coarse-grained transition matrix is symmetrized with respect
+    to the coarse-grained stationary distribution and renormalized to eliminate numerical errors.
+
+    """
     W = np.linalg.inv(np.dot(M.T, M))
-    A = np.dot(np.dot(M.T, P), M)
+    A = np.dot(M.T, P.dot(M))
     P_coarse = np.dot(W, A)
 
     # symmetrize and renormalize to eliminate numerical errors
-    from msmtools.analysis import stationary_distribution
-    pi_coarse = np.dot(M.T, stationary_distribution(P))
-    X = np.dot(np.diag(pi_coarse), P_coarse)
+    pi_coarse = np.dot(M.T, pi)
+    X = pi_coarse[:, None] * P_coarse
     P_coarse = X / X.sum(axis=1)[:, None]
 
-    return P_coarse
+    return P_coarse, pi_coarse
 
 
 class PCCA:
@@ -498,8 +597,8 @@ class PCCA:
 
     Parameters
     ----------
-    P : ndarray (n,n)
-        Transition matrix.
+    P : ndarray (n,n) or scipy.sparse matrix
+        Transition matrix. Sparse matrices are never converted to dense ones.
     m : int
         Number of clusters to group to.
 
@@ -532,23 +631,13 @@ class PCCA:
 
         self._pi = _sd(P)
 
-        # coarse-grained stationary distribution
-        self._pi_coarse = np.dot(self._M.T, self._pi)
+        # coarse-grained transition matrix and stationary distribution
+        self._P_coarse, self._pi_coarse = _coarse_grain(P, self._M, self._pi)
 
         # HMM output matrix
-        self._B = np.dot(np.dot(np.diag(1.0 / self._pi_coarse), self._M.T), np.diag(self._pi))
+        self._B = (self._M * self._pi[:, None]).T / self._pi_coarse[:, None]
         # renormalize B to make it row-stochastic
         self._B /= self._B.sum(axis=1)[:, None]
-        self._B /= self._B.sum(axis=1)[:, None]
-
-        # coarse-grained transition matrix
-        W = np.linalg.inv(np.dot(self._M.T, self._M))
-        A = np.dot(np.dot(self._M.T, P), self._M)
-        self._P_coarse = np.dot(W, A)
-
-        # symmetrize and renormalize to eliminate numerical errors
-        X = np.dot(np.diag(self._pi_coarse), self._P_coarse)
-        self._P_coarse = X / X.sum(axis=1)[:, None]
 
     @property
     def transition_matrix(self):
@@ -35,7 +35,8 @@ import unittest
 import numpy as np
 
 from msmtools.util.numeric import assert_allclose
-from pcca import pcca
+from scipy.sparse import csr_matrix
+from pcca import pcca, _components, _pcca_eigenvectors, _pcca_connected_isa, _opt_soft, _fill_matrix
 
 
 class TestPCCA(unittest.TestCase):
@@ -190,5 +191,104 @@ class TestPCCA(unittest.TestCase):
         # test mass conservation
         assert np.allclose(p.coarse_grained_transition_matrix.sum(axis=1), np.ones(m))
 
+        """Sparse input gives the same coarse-grained model"""
+        assert_allclose(coarsegrain(csr_matrix(P), m), Pc_ref, atol=1e-10)
+        p_sparse = PCCA(csr_matrix(P), m)
+        assert_allclose(p_sparse.coarse_grained_transition_matrix, p.coarse_grained_transition_matrix, atol=1e-10)
+        assert_allclose(p_sparse.coarse_grained_stationary_probability, p.coarse_grained_stationary_probability,
+                        atol=1e-10)
+        assert_allclose(p_sparse.output_probabilities, p.output_probabilities, atol=1e-10)
+        assert_allclose(p_sparse.memberships, p.memberships, atol=1e-10)
+
+    def test_pcca_sparse(self):
+        import os
+
+        P = np.loadtxt(os.path.split(__file__)[0] + '/../tests/P_rev_251x251.dat')
+        chi = pcca(P, 2)
+        chi_sparse = pcca(csr_matrix(P), 2)
+        assert_allclose(chi_sparse, chi, atol=1e-8)
+
+        P = np.array([[0.9, 0.1, 0.0, 0.0, 0.0],
+                      [0.1, 0.9, 0.0, 0.0, 0.0],
+                      [0.0, 0.1, 0.8, 0.1, 0.0],
+                      [0.0, 0.0, 0.0, 0.8, 0.2],
+                      [0.0, 0.0, 0.0, 0.2, 0.8]])
+        assert_allclose(pcca(csr_matrix(P), 2), pcca(P, 2))
+
+    def test_pcca_column_order(self):
+        """Clusters are ordered by the first state assigned to them, for dense and sparse input"""
+        n, m = 300, 4
+        random_state = np.random.RandomState(0)
+        blocks = random_state.permutation(np.arange(n) % m)
+        same = blocks[:, None] == blocks[None, :]
+        C = random_state.rand(n, n) * (random_state.rand(n, n) < np.where(same, 0.1, 0.003))
+        C[~same] *= 0.01
+        C = C + C.T + np.eye(n)
+        P = C / C.sum(axis=1)[:, None]
+
+        chi = pcca(P, m)
+        chi_sparse = pcca(csr_matrix(P), m)
+        assert_allclose(chi_sparse, chi, atol=1e-4)
+
+        labels = np.argmax(chi, axis=1)
+        first = [np.flatnonzero(labels == i)[0] for i in range(m)]
+        assert_allclose(first, np.sort(first))
+        assert len(set(zip(blocks, labels))) == m
+
+    def test_pcca_components(self):
+        """Closed components of different size and transition states"""
+        P = np.array([[0.9, 0.1, 0.0, 0.0, 0.0, 0.0, 0.0],
+                      [0.1, 0.8, 0.1, 0.0, 0.0, 0.0, 0.0],
+                      [0.0, 0.1, 0.9, 0.0, 0.0, 0.0, 0.0],
+                      [0.0, 0.0, 0.0, 0.5, 0.5, 0.0, 0.0],
+                      [0.0, 0.0, 0.0, 0.5, 0.5, 0.0, 0.0],
+                      [0.2, 0.0, 0.0, 0.0, 0.6, 0.0, 0.2],
+                      [0.0, 0.0, 0.0, 0.0, 0.0, 0.5, 0.5]])
+        components, closed = _components(csr_matrix(P))
+        assert_allclose(components[0], [0, 1, 2])
+        assert_allclose(components[1], [3, 4])
+        assert_allclose(components[2], [5, 6])
+        assert_allclose(closed, [True, True, False])
+
+        """Transition states inherit the memberships of the closed states they hit first"""
+        chi = pcca(P, 2)
+        h = 0.2 / (1.0 - 0.5 * 0.2 / 0.5)
+        sol = np.array([[1., 0.],
+                        [1., 0.],
+                        [1., 0.],
+                        [0., 1.],
+                        [0., 1.],
+                        [h, 1.0 - h],
+                        [h, 1.0 - h]])
+        assert_allclose(chi, sol)
+        assert_allclose(pcca(csr_matrix(P), 2), sol)
+
+        """The third cluster goes to the component with the largest subdominant eigenvalue"""
+        chi = pcca(P, 3)
+        assert_allclose(chi[3:5], [[0., 0., 1.], [0., 0., 1.]])
+        assert_allclose(chi.sum(axis=1), 1.0)
+
+    def test_opt_soft(self):
+        """The optimized rotation does not decrease the target function"""
+        import os
+        from msmtools.analysis import stationary_distribution
+
+        P = np.loadtxt(os.path.split(__file__)[0] + '/../tests/P_rev_251x251.dat')
+        pi = stationary_distribution(P)
+        m = 4
+        evecs = np.real(_pcca_eigenvectors(P, pi, m))
+        evecs[:, 0] = np.abs(evecs[:, 0])
+        chi, rot = _pcca_connected_isa(evecs, m)
+
+        def target(rot):
+            rot = _fill_matrix(rot[1:, 1:], evecs)
+            return np.sum(rot ** 2 / rot[0, :])
+
+        rot_opt = _opt_soft(evecs, rot, m)
+        assert target(rot_opt) >= target(rot)
+        assert_allclose(np.dot(evecs, rot_opt).sum(axis=1), 1.0)
+        assert np.all(np.dot(evecs, rot_opt) > -1e-8)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -33,6 +33,13 @@ import numpy
 from decomposition import stationary_distribution_from_backward_iteration as stationary_distribution
 
 
+def _stack(x, sensitivity):
+    """Drop the leading axis of the stacked sensitivities for scalar indices"""
+    if numpy.ndim(x) == 0:
+        return sensitivity[0]
+    return sensitivity
+
+
 # TODO:make faster. So far not effectively programmed
 # Martin: done, but untested, since there is no testcase...
 def forward_committor_sensitivity(T, A, B, index):
@@ -46,12 +53,14 @@ def forward_committor_sensitivity(T, A, B, index):
         List of integer state labels for set A
     B : array like
         List of integer state labels for set B
-    index : entry of the committor for which the sensitivity is to be computed
+    index : int or array like
+        entry (or entries) of the committor for which the sensitivity is to be computed
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m indices the sensitivity matrices are stacked along the first axis.
     """
 
     n = len(T)
@@ -60,37 +69,28 @@ def forward_committor_sensitivity(T, A, B, index):
     set_B = numpy.unique(B)  # set(B)
     set_AB = numpy.union1d(set_A, set_B)  # set_A | set_B
     notAB = numpy.setdiff1d(set_X, set_AB, True)  # list(set_X - set_AB)
-    m = len(notAB)
 
     K = T - numpy.diag(numpy.ones(n))
 
     U = K[numpy.ix_(notAB, notAB)]
 
-    v = numpy.zeros(m)
-
-    # for i in xrange(0, m):
-    #   for k in xrange(0, len(set_B)):
-    #       v[i] = v[i] - K[notAB[i], B[k]]
-    v[:] = v[:] - K[notAB[:], B[:]]
+    v = -numpy.sum(K[numpy.ix_(notAB, set_B)], axis=1)
 
     qI = numpy.linalg.solve(U, v)
 
     q_forward = numpy.zeros(n)
-    #q_forward[set_A] = 0 # double assignment.
     q_forward[set_B] = 1
-    #for i in range(len(notAB)):
-    q_forward[notAB[:]] = qI[:]
+    q_forward[notAB] = qI
 
-    target = numpy.eye(1, n, index)
-    target = target[0, notAB]
+    indices = numpy.atleast_1d(index)
+    target = numpy.eye(n)[notAB][:, indices]
 
-    UinvVec = numpy.linalg.solve(U.T, target)
-    Siab = numpy.zeros((n, n))
+    UinvVec = numpy.zeros((n, len(indices)))
+    UinvVec[notAB] = numpy.linalg.solve(U.T, target)
 
-    for i in xrange(m):
-        Siab[notAB[i]] = - UinvVec[i] * q_forward
+    Siab = -UinvVec.T[:, :, numpy.newaxis] * q_forward[numpy.newaxis, numpy.newaxis, :]
 
-    return Siab
+    return _stack(index, Siab)
 
 
 def backward_committor_sensitivity(T, A, B, index):
@@ -104,12 +104,14 @@ def backward_committor_sensitivity(T, A, B, index):
         List of integer state labels for set A
     B : array like
         List of integer state labels for set B
-    index : entry of the committor for which the sensitivity is to be computed
+    index : int or array like
+        entry (or entries) of the committor for which the sensitivity is to be computed
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m indices the sensitivity matrices are stacked along the first axis.
     """
 
     # This is really ugly to compute. The problem is, that changes in T induce changes in
@@ -125,11 +127,10 @@ def backward_committor_sensitivity(T, A, B, index):
 
     mEQ = numpy.diag(eq)
     mIEQ = numpy.diag(1.0 / eq)
-    mSEQ = numpy.diag(1.0 / eq / eq)
 
     backT = numpy.dot(mIEQ, numpy.dot(trT, mEQ))
 
-    qMat = forward_committor_sensitivity(backT, A, B, index)
+    qMat = forward_committor_sensitivity(backT, A, B, numpy.atleast_1d(index))
 
     matA = trT - numpy.identity(n)
     matA = numpy.concatenate((matA, [one]))
@@ -138,24 +139,24 @@ def backward_committor_sensitivity(T, A, B, index):
 
     phiM = phiM[:, 0:n]
 
-    trQMat = numpy.transpose(qMat)
+    trQMat = numpy.transpose(qMat, (0, 2, 1))
 
-    d1 = numpy.dot(mSEQ, numpy.diagonal(numpy.dot(numpy.dot(trT, mEQ), trQMat), 0))
-    d2 = numpy.diagonal(numpy.dot(numpy.dot(trQMat, mIEQ), trT), 0)
+    d1 = numpy.einsum('ik,k,mki->mi', trT, eq, trQMat) / (eq * eq)[numpy.newaxis, :]
+    d2 = numpy.einsum('mik,k,ki->mi', trQMat, 1.0 / eq, trT)
 
     psi1 = numpy.dot(d1, phiM)
     psi2 = numpy.dot(-d2, phiM)
 
-    v1 = psi1 - one * numpy.dot(psi1, eq)
-    v3 = psi2 - one * numpy.dot(psi2, eq)
+    v1 = psi1 - numpy.dot(psi1, eq)[:, numpy.newaxis]
+    v3 = psi2 - numpy.dot(psi2, eq)[:, numpy.newaxis]
 
-    part1 = numpy.outer(eq, v1)
-    part2 = numpy.dot(numpy.dot(mEQ, trQMat), mIEQ)
-    part3 = numpy.outer(eq, v3)
+    part1 = eq[numpy.newaxis, :, numpy.newaxis] * v1[:, numpy.newaxis, :]
+    part2 = eq[numpy.newaxis, :, numpy.newaxis] * trQMat / eq[numpy.newaxis, numpy.newaxis, :]
+    part3 = eq[numpy.newaxis, :, numpy.newaxis] * v3[:, numpy.newaxis, :]
 
     sensitivity = part1 + part2 + part3
 
-    return sensitivity
+    return _stack(index, sensitivity)
 
 
 def eigenvalue_sensitivity(T, k):
@@ -165,13 +166,14 @@ def eigenvalue_sensitivity(T, k):
     ----------
     T : numpy.ndarray shape = (n, n)
         Transition matrix
-    k : int
-        eigenvalue index for eigenvalues order descending
+    k : int or array like
+        eigenvalue index (or indices) for eigenvalues order descending
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m indices the sensitivity matrices are stacked along the first axis.
     """
 
     eValues, rightEigenvectors = numpy.linalg.eig(T)
@@ -182,9 +184,10 @@ def eigenvalue_sensitivity(T, k):
     rightEigenvectors = rightEigenvectors[:, perm]
     leftEigenvectors = leftEigenvectors[perm]
 
-    sensitivity = numpy.outer(leftEigenvectors[k], rightEigenvectors[:, k])
+    kk = numpy.atleast_1d(k)
+    sensitivity = leftEigenvectors[kk][:, :, numpy.newaxis] * rightEigenvectors[:, kk].T[:, numpy.newaxis, :]
 
-    return sensitivity
+    return _stack(k, sensitivity)
 
 
 def timescale_sensitivity(T, k):
@@ -194,13 +197,14 @@ def timescale_sensitivity(T, k):
     ----------
     T : numpy.ndarray shape = (n, n)
         Transition matrix
-    k : int
-        timescale index for timescales of descending order (k = 0 for the infinite one)
+    k : int or array like
+        timescale index (or indices) for timescales of descending order (k = 0 for the infinite one)
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m indices the sensitivity matrices are stacked along the first axis.
     """
 
     eValues, rightEigenvectors = numpy.linalg.eig(T)
@@ -212,18 +216,18 @@ def timescale_sensitivity(T, k):
     rightEigenvectors = rightEigenvectors[:, perm]
     leftEigenvectors = leftEigenvectors[perm]
 
-    eVal = eValues[k]
+    kk = numpy.atleast_1d(k)
+    eVal = eValues[kk]
 
-    sensitivity = numpy.outer(leftEigenvectors[k], rightEigenvectors[:, k])
+    sensitivity = leftEigenvectors[kk][:, :, numpy.newaxis] * rightEigenvectors[:, kk].T[:, numpy.newaxis, :]
 
-    if eVal < 1.0:
-        factor = 1.0 / (numpy.log(eVal) ** 2) / eVal
-    else:
-        factor = 0.0
+    factor = numpy.zeros(len(kk), dtype=eVal.dtype)
+    finite = eVal < 1.0
+    factor[finite] = 1.0 / (numpy.log(eVal[finite]) ** 2) / eVal[finite]
 
-    sensitivity *= factor
+    sensitivity *= factor[:, numpy.newaxis, numpy.newaxis]
 
-    return sensitivity
+    return _stack(k, sensitivity)
 
 
 # TODO: The eigenvector sensitivity depends on the normalization, e.g. l^T r = 1 or norm(r) = 1
@@ -241,17 +245,19 @@ def eigenvector_sensitivity(T, k, j, right=True):
     ----------
     T : numpy.ndarray shape = (n, n)
         Transition matrix
-    k : int
+    k : int or array like
         eigenvector index ordered with descending eigenvalues
-    j : int
-        entry of eigenvector k for which the sensitivity is to be computed
+    j : int or array like
+        entry of eigenvector k for which the sensitivity is to be computed.
+        Arrays of k and j are broadcast against each other.
     right : boolean (default: True)
         If set to True (default) the right eigenvectors are considered, otherwise the left ones
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m pairs (k, j) the sensitivity matrices are stacked along the first axis.
     
     Remarks
     -------
@@ -278,26 +284,58 @@ def eigenvector_sensitivity(T, k, j, right=True):
     rightEigenvectors = rightEigenvectors[:, perm]
     leftEigenvectors = leftEigenvectors[perm]
 
-    rEV = rightEigenvectors[:, k]
-    lEV = leftEigenvectors[k]
-    eVal = eValues[k]
+    kk, jj = numpy.broadcast_arrays(numpy.atleast_1d(k), numpy.atleast_1d(j))
+    sensitivity = numpy.zeros((len(kk), n, n), dtype=rightEigenvectors.dtype)
 
-    vecA = numpy.zeros(n)
-    vecA[j] = 1.0
+    # one least squares problem for each eigenvector with all requested entries
+    for kval in numpy.unique(kk):
+        ind = numpy.where(kk == kval)[0]
+        rEV = rightEigenvectors[:, kval]
+        lEV = leftEigenvectors[kval]
+        eVal = eValues[kval]
 
-    matA = T - eVal * numpy.identity(n)
-    # Use here rEV as additional condition, means that we assume the vector to be
-    # orthogonal to rEV
-    matA = numpy.concatenate((matA, [rEV]))
+        vecA = numpy.zeros((n, len(ind)))
+        vecA[jj[ind], numpy.arange(len(ind))] = 1.0
 
-    phi = numpy.linalg.lstsq(numpy.transpose(matA), vecA)
+        matA = T - eVal * numpy.identity(n)
+        # Use here rEV as additional condition, means that we assume the vector to be
+        # orthogonal to rEV
+        matA = numpy.concatenate((matA, [rEV]))
 
-    phi = numpy.delete(phi[0], -1)
+        phi = numpy.linalg.lstsq(numpy.transpose(matA), vecA)
 
-    sensitivity = -numpy.outer(phi, rEV) + numpy.dot(phi, rEV) * numpy.outer(lEV, rEV)
+        phi = phi[0][0:n].T
+
+        sensitivity[ind] = -phi[:, :, numpy.newaxis] * rEV[numpy.newaxis, numpy.newaxis, :] + \
+            numpy.dot(phi, rEV)[:, numpy.newaxis, numpy.newaxis] * numpy.outer(lEV, rEV)[numpy.newaxis]
 
     if not right:
-        sensitivity = numpy.transpose(sensitivity)
+        sensitivity = numpy.transpose(sensitivity, (0, 2, 1))
+
+    return _stack(numpy.broadcast_arrays(k, j)[0], sensitivity)
+
+
+def _stationary_distribution_sensitivity(T, vecA):
+    r"""Stacked sensitivity matrices of the linear functionals a^T pi of the
+    stationary distribution, given as the columns of vecA."""
+
+    n = len(T)
+
+    lEV = numpy.ones(n)
+    rEV = stationary_distribution(T)
+    eVal = 1.0
+
+    T = numpy.transpose(T)
+
+    matA = T - eVal * numpy.identity(n)
+    # normalize s.t. sum is one using rEV which is constant
+    matA = numpy.concatenate((matA, [lEV]))
+
+    phi = numpy.linalg.lstsq(numpy.transpose(matA), vecA)
+    phi = phi[0][0:n].T
+
+    sensitivity = -rEV[numpy.newaxis, :, numpy.newaxis] * phi[:, numpy.newaxis, :] + \
+        numpy.dot(phi, rEV)[:, numpy.newaxis, numpy.newaxis] * numpy.outer(rEV, lEV)[numpy.newaxis]
 
     return sensitivity
 
@@ -310,13 +348,14 @@ def stationary_distribution_sensitivity(T, j):
     ----------
     T : numpy.ndarray shape = (n, n)
         Transition matrix
-    j : int
-        entry of stationary distribution for which the sensitivity is to be computed
+    j : int or array like
+        entry (or entries) of stationary distribution for which the sensitivity is to be computed
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m entries the sensitivity matrices are stacked along the first axis.
     
     Remark
     ------
@@ -326,25 +365,13 @@ def stationary_distribution_sensitivity(T, j):
 
     n = len(T)
 
-    lEV = numpy.ones(n)
-    rEV = stationary_distribution(T)
-    eVal = 1.0
+    jj = numpy.atleast_1d(j)
+    vecA = numpy.zeros((n, len(jj)))
+    vecA[jj, numpy.arange(len(jj))] = 1.0
 
-    T = numpy.transpose(T)
+    sensitivity = _stationary_distribution_sensitivity(T, vecA)
 
-    vecA = numpy.zeros(n)
-    vecA[j] = 1.0
-
-    matA = T - eVal * numpy.identity(n)
-    # normalize s.t. sum is one using rEV which is constant
-    matA = numpy.concatenate((matA, [lEV]))
-
-    phi = numpy.linalg.lstsq(numpy.transpose(matA), vecA)
-    phi = numpy.delete(phi[0], -1)
-
-    sensitivity = -numpy.outer(rEV, phi) + numpy.dot(phi, rEV) * numpy.outer(rEV, lEV)
-
-    return sensitivity
+    return _stack(j, sensitivity)
 
 
 def mfpt_sensitivity(T, target, j):
@@ -356,13 +383,14 @@ def mfpt_sensitivity(T, target, j):
         Transition matrix
     target : int
         target state to which the MFPT is computed
-    j : int
-        entry of the mfpt vector for which the sensitivity is to be computed
+    j : int or array like
+        entry (or entries) of the mfpt vector for which the sensitivity is to be computed
         
     Returns
     -------
-    x : ndarray, shape=(n, n)
+    x : ndarray, shape=(n, n) or shape=(m, n, n)
         Sensitivity matrix for entry index around transition matrix T. Reversibility is not assumed.
+        For m entries the sensitivity matrices are stacked along the first axis.
     """
 
     n = len(T)
@@ -375,17 +403,19 @@ def mfpt_sensitivity(T, target, j):
     tVec[target] = 0
 
     mfpt = numpy.linalg.solve(matA, tVec)
-    aVec = numpy.zeros(n)
-    aVec[j] = 1.0
 
-    phiVec = numpy.linalg.solve(numpy.transpose(matA), aVec)
+    jj = numpy.atleast_1d(j)
+    aVec = numpy.zeros((n, len(jj)))
+    aVec[jj, numpy.arange(len(jj))] = 1.0
+
+    phiVec = numpy.linalg.solve(numpy.transpose(matA), aVec).T
 
     # TODO: Check sign of sensitivity!
 
-    sensitivity = -1.0 * numpy.outer(phiVec, mfpt)
-    sensitivity[target] *= 0
+    sensitivity = -1.0 * phiVec[:, :, numpy.newaxis] * mfpt[numpy.newaxis, numpy.newaxis, :]
+    sensitivity[:, target] *= 0
 
-    return sensitivity
+    return _stack(j, sensitivity)
 
 
 def expectation_sensitivity(T, a):
@@ -404,8 +434,5 @@ def expectation_sensitivity(T, a):
         Sensitivity matrix of the expectation value.
     
     """
-    M = T.shape[0]
-    S = numpy.zeros((M, M))
-    for i in range(M):
-        S += a[i] * stationary_distribution_sensitivity(T, i)
-    return S
\ No newline at end of file
+    a = numpy.asarray(a, dtype=float)
+    return _stationary_distribution_sensitivity(T, a[:, numpy.newaxis])[0]
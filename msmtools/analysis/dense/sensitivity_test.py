@@ -176,6 +176,29 @@ class TestExpectations(unittest.TestCase):
         Sn = expectation_sensitivity(self.T4, a)
         assert_allclose(Sn, S)
 
+    def test_batched_sensitivities(self):
+        """Arrays of indices give the stacked single index sensitivities"""
+        S = eigenvalue_sensitivity(self.T4, [0, 1, 2])
+        self.assertEqual(S.shape, (3, 4, 4))
+        for i, k in enumerate([0, 1, 2]):
+            assert_allclose(S[i], eigenvalue_sensitivity(self.T4, k))
+        S = timescale_sensitivity(self.T4, np.array([1, 2]))
+        assert_allclose(S[1], timescale_sensitivity(self.T4, 2))
+        S = eigenvector_sensitivity(self.T4, [1, 2, 0], [1, 2, 3])
+        assert_allclose(S[0], self.mV11, atol=1e-5)
+        assert_allclose(S[1], self.mV22, atol=1e-5)
+        assert_allclose(S[2], self.mV03, atol=1e-5)
+        S = eigenvector_sensitivity(self.T4, 1, [0, 1])
+        assert_allclose(S[1], self.mV11, atol=1e-5)
+        S = stationary_distribution_sensitivity(self.T4, [1, 2])
+        assert_allclose(S[0], self.pS1, atol=1e-5)
+        S = mfpt_sensitivity(self.T4, 0, [0, 1, 2])
+        assert_allclose(S, np.array([self.S4zero, self.mS01, self.mS02]), atol=1e-2)
+        S = forward_committor_sensitivity(self.T4, [0], [3], [0, 1, 2, 3])
+        assert_allclose(S, np.array([self.S4zero, self.qS41, self.qS42, self.S4zero]), atol=1e-3)
+        S = backward_committor_sensitivity(self.T4, [0], [3], [1, 2])
+        assert_allclose(S[0], self.qSI41, atol=1e-5)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -131,7 +131,7 @@ def is_reversible(T, mu=None, tol=1e-15):
     T = T.tocsr()
 
     if mu is None:
-        from decomposition import stationary_distribution_from_backward_iteration as statdist
+        from decomposition import stationary_distribution_from_linear_system as statdist
 
         mu = statdist(T)
 
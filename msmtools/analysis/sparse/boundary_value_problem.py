@@ -0,0 +1,384 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""This module provides the assembly and solution of sparse Dirichlet
+boundary-value problems as they occur in the computation of committors
+and mean first passage times.
+
+All operations work directly on the CSR arrays (indptr, indices, data)
+and avoid conversions to the DOK or LIL formats. The linear systems can
+be solved by sparse LU decomposition or by iterative Krylov and algebraic
+multigrid methods for very large state spaces.
+
+"""
+import inspect
+import warnings
+
+import numpy as np
+
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import spsolve, gmres, bicgstab
+
+from msmtools.util.exceptions import NotConvergedWarning
+
+SOLVERS = ('direct', 'gmres', 'bicgstab', 'amg')
+
+
+def states_mask(n, states):
+    r"""Boolean indicator vector of a set of states.
+
+    Parameters
+    ----------
+    n : int
+        Number of states
+    states : int or array_like
+        Integer state labels
+
+    Returns
+    -------
+    mask : (n,) ndarray of bool
+        True for all states contained in states
+
+    """
+    mask = np.zeros(n, dtype=bool)
+    mask[np.asarray(states, dtype=int)] = True
+    return mask
+
+
+def replace_rows(A, rows, diag=1.0):
+    r"""Replace rows of a sparse matrix by (scaled) unit rows.
+
+    Parameters
+    ----------
+    A : (M, M) scipy.sparse matrix
+        Matrix
+    rows : (M,) ndarray of bool
+        Indicator of the rows to be replaced
+    diag : float (optional)
+        Diagonal element of the replaced rows
+
+    Returns
+    -------
+    W : (M, M) scipy.sparse.csr_matrix
+        Matrix with W[i, :] = diag * e_i for all replaced rows i
+
+    """
+    A = csr_matrix(A)
+    n = A.shape[0]
+    counts = np.diff(A.indptr)
+    """Number of entries per row after replacement"""
+    new_counts = np.where(rows, 1, counts)
+    indptr = np.zeros(n + 1, dtype=A.indptr.dtype)
+    np.cumsum(new_counts, out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=A.indices.dtype)
+    data = np.empty(indptr[-1], dtype=A.dtype)
+
+    """Shift the entries of the kept rows to their new positions"""
+    row_of_entry = np.repeat(np.arange(n), counts)
+    keep = ~rows[row_of_entry]
+    dest = (indptr[row_of_entry] + np.arange(A.indptr[-1]) - A.indptr[row_of_entry])[keep]
+    indices[dest] = A.indices[:A.indptr[-1]][keep]
+    data[dest] = A.data[:A.indptr[-1]][keep]
+
+    """Unit rows"""
+    replaced = np.where(rows)[0]
+    indices[indptr[replaced]] = replaced
+    data[indptr[replaced]] = diag
+    return csr_matrix((data, indices, indptr), shape=A.shape)
+
+
+def restrict(A, mask):
+    r"""Restriction of a sparse matrix onto a subset of states.
+
+    Parameters
+    ----------
+    A : (M, M) scipy.sparse matrix
+        Matrix
+    mask : (M,) ndarray of bool
+        Indicator of the subset
+
+    Returns
+    -------
+    A_S : (m, m) scipy.sparse.csr_matrix
+        Submatrix A[S, :][:, S] with S the states indicated by mask
+
+    """
+    A = csr_matrix(A)
+    n = A.shape[0]
+    counts = np.diff(A.indptr)
+    row_of_entry = np.repeat(np.arange(n), counts)
+    indices = A.indices[:A.indptr[-1]]
+    keep = mask[row_of_entry] & mask[indices]
+    """Relabel the states in the subset"""
+    relabel = np.cumsum(mask) - 1
+    m = relabel[-1] + 1 if n > 0 else 0
+    indptr = np.zeros(m + 1, dtype=A.indptr.dtype)
+    np.cumsum(np.bincount(relabel[row_of_entry[keep]], minlength=m), out=indptr[1:])
+    return csr_matrix((A.data[:A.indptr[-1]][keep], relabel[indices[keep]], indptr), shape=(m, m))
+
+
+def dirichlet_system(L, f, boundary, g):
+    r"""Linear system for a Dirichlet boundary-value problem.
+
+    Assembles the system W u = r for the problem
+
+    .. math::
+
+        \sum_j L_{ij} u_{j}=f_{i}    for i not in the boundary (I)
+                      u_{i}=g_{i}    for i in the boundary     (II)
+
+    Parameters
+    ----------
+    L : (M, M) scipy.sparse matrix
+        Operator of the boundary-value problem
+    f : (M,) ndarray
+        Right-hand side of equation (I)
+    boundary : (M,) ndarray of bool
+        Indicator of the boundary states
+    g : (M,) ndarray
+        Boundary values, only the entries of the boundary states are used
+
+    Returns
+    -------
+    W : (M, M) scipy.sparse.csr_matrix
+        Left-hand side of the linear system
+    r : (M,) ndarray
+        Right-hand side of the linear system
+
+    """
+    W = replace_rows(L, boundary)
+    r = np.where(boundary, g, f).astype(float)
+    return W, r
+
+
+def interior_system(L, f, boundary, g):
+    r"""Linear system for a Dirichlet boundary-value problem with the
+    boundary states eliminated.
+
+    The boundary values are moved to the right-hand side, the
+    resulting system is
+
+    .. math::
+
+        L_{II} u_{I} = f_{I} - L_{IB} g_{B}
+
+    with I the interior and B the boundary states.
+
+    Parameters
+    ----------
+    L : (M, M) scipy.sparse matrix
+        Operator of the boundary-value problem
+    f : (M,) ndarray
+        Right-hand side for the interior states
+    boundary : (M,) ndarray of bool
+        Indicator of the boundary states
+    g : (M,) ndarray
+        Boundary values, only the entries of the boundary states are used
+
+    Returns
+    -------
+    W : (m, m) scipy.sparse.csr_matrix
+        Left-hand side of the linear system
+    r : (m,) ndarray
+        Right-hand side of the linear system
+    interior : (m,) ndarray
+        Labels of the interior states
+
+    """
+    L = csr_matrix(L)
+    interior = np.where(~boundary)[0]
+    gB = np.where(boundary, g, 0.0)
+    r = (f - L.dot(gB))[interior]
+    W = restrict(L, ~boundary)
+    return W, r, interior
+
+
+def linear_solve(W, r, solver='direct', tol=1e-10, x0=None, maxiter=None):
+    r"""Solve a sparse linear system W x = r.
+
+    Parameters
+    ----------
+    W : (M, M) scipy.sparse matrix
+        Left-hand side
+    r : (M,) ndarray
+        Right-hand side
+    solver : str (optional)
+        One of 'direct' (sparse LU decomposition), 'gmres', 'bicgstab'
+        or 'amg' (algebraic multigrid, requires pyamg)
+    tol : float (optional)
+        Relative residual tolerance of the iterative solvers
+    x0 : (M,) ndarray (optional)
+        Initial guess for the iterative solvers
+    maxiter : int (optional)
+        Maximum number of iterations of the iterative solvers
+
+    Returns
+    -------
+    x : (M,) ndarray
+        Solution of the linear system
+    resnorms : ndarray
+        Relative residual norms ||r - W x_k|| / ||r||, one for each
+        iteration (each restart cycle for 'gmres'). The direct solver
+        reports the residual of its solution. For 'gmres' with scipy
+        older than 1.1, these are the preconditioned residual norms of
+        the inner iterations.
+
+    """
+    W = csr_matrix(W)
+    r = np.asarray(r, dtype=float)
+    rnorm = np.linalg.norm(r)
+    if rnorm == 0.0:
+        return np.zeros(r.shape[0]), np.zeros(1)
+
+    if solver == 'direct':
+        x = np.atleast_1d(spsolve(W, r))
+        resnorms = np.array([np.linalg.norm(r - W.dot(x)) / rnorm])
+        return x, resnorms
+
+    resnorms = []
+    if solver == 'gmres' or solver == 'bicgstab':
+        """Jacobi preconditioner"""
+        d = W.diagonal()
+        d[d == 0.0] = 1.0
+        M = diags(1.0 / d, 0)
+
+        def callback(xk):
+            resnorms.append(np.linalg.norm(r - W.dot(xk)) / rnorm)
+
+        if solver == 'gmres':
+            """gmres reports the iterate only if it supports callback_type, else the preconditioned residual norm"""
+            kwargs = _krylov_kwargs(gmres, tol)
+            if 'callback_type' in _arguments(gmres):
+                kwargs['callback_type'] = 'x'
+                x, info = gmres(W, r, x0=x0, maxiter=maxiter, M=M, callback=callback, **kwargs)
+            else:
+                x, info = gmres(W, r, x0=x0, maxiter=maxiter, M=M,
+                                callback=lambda rk: resnorms.append(rk), **kwargs)
+        else:
+            x, info = bicgstab(W, r, x0=x0, maxiter=maxiter, M=M, callback=callback,
+                               **_krylov_kwargs(bicgstab, tol))
+        converged = (info == 0)
+    elif solver == 'amg':
+        try:
+            import pyamg
+        except ImportError:
+            raise ImportError("The 'amg' solver requires the pyamg package.")
+        """Multigrid requires a positive diagonal"""
+        s = -1.0 if np.sum(W.diagonal()) < 0.0 else 1.0
+        ml = pyamg.smoothed_aggregation_solver(s * W, symmetry='nonsymmetric')
+        if maxiter is None:
+            maxiter = 100
+        x = ml.solve(s * r, x0=x0, tol=tol, maxiter=maxiter, accel='gmres', residuals=resnorms)
+        resnorms = [res / rnorm for res in resnorms]
+        converged = (np.linalg.norm(r - W.dot(x)) <= tol * rnorm)
+    else:
+        raise ValueError("Unknown solver '%s', use one of %s" % (solver, ', '.join(SOLVERS)))
+
+    if not converged:
+        warnings.warn("Iterative solver '%s' did not converge to tol=%g." % (solver, tol),
+                      NotConvergedWarning)
+    return x, np.array(resnorms)
+
+
+def _arguments(func):
+    r"""Names of the arguments of func"""
+    try:
+        return list(inspect.signature(func).parameters)
+    except AttributeError:
+        return inspect.getargspec(func).args
+
+
+def _krylov_kwargs(func, tol):
+    r"""Relative tolerance and, where supported, zero absolute tolerance for a scipy Krylov solver"""
+    args = _arguments(func)
+    kwargs = {}
+    if 'rtol' in args:
+        kwargs['rtol'] = tol
+    else:
+        kwargs['tol'] = tol
+    if 'atol' in args:
+        kwargs['atol'] = 0.0
+    return kwargs
+
+
+def solve_dirichlet(L, f, boundary, g, eliminate=True, solver='direct', tol=1e-10, x0=None,
+                    maxiter=None, return_conv=False):
+    r"""Solve a Dirichlet boundary-value problem.
+
+    Parameters
+    ----------
+    L : (M, M) scipy.sparse matrix
+        Operator of the boundary-value problem
+    f : (M,) ndarray
+        Right-hand side for the interior states
+    boundary : (M,) ndarray of bool
+        Indicator of the boundary states
+    g : (M,) ndarray
+        Boundary values, only the entries of the boundary states are used
+    eliminate : bool (optional)
+        If True, the boundary states are eliminated and only the smaller
+        interior system is solved. Otherwise the full system with unit
+        rows for the boundary states is solved.
+    solver : str (optional)
+        Linear solver, one of 'direct', 'gmres', 'bicgstab' or 'amg'
+    tol : float (optional)
+        Relative residual tolerance of the iterative solvers
+    x0 : (M,) ndarray (optional)
+        Initial guess for the iterative solvers, e.g. the solution of
+        the problem for a neighbouring lag time
+    maxiter : int (optional)
+        Maximum number of iterations of the iterative solvers
+    return_conv : bool (optional)
+        If True, the residual history of the solver is also returned
+
+    Returns
+    -------
+    u : (M,) ndarray
+        Solution of the boundary-value problem
+    (resnorms) : ndarray
+        Relative residual norms, one for each iteration. Only returned
+        if return_conv = True
+
+    See also
+    --------
+    dirichlet_system, interior_system, linear_solve
+
+    """
+    if x0 is not None:
+        x0 = np.asarray(x0, dtype=float)
+    if not eliminate:
+        W, r = dirichlet_system(L, f, boundary, g)
+        u, resnorms = linear_solve(W, r, solver=solver, tol=tol, x0=x0, maxiter=maxiter)
+    else:
+        W, r, interior = interior_system(L, f, boundary, g)
+        u = np.where(boundary, g, 0.0).astype(float)
+        resnorms = np.zeros(0)
+        if interior.size > 0:
+            if x0 is not None:
+                x0 = x0[interior]
+            u[interior], resnorms = linear_solve(W, r, solver=solver, tol=tol, x0=x0,
+                                                 maxiter=maxiter)
+    if return_conv:
+        return u, resnorms
+    return u
@@ -0,0 +1,142 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Unit tests for the boundary_value_problem module
+
+"""
+import unittest
+import warnings
+import numpy as np
+from msmtools.util.numeric import assert_allclose
+
+import scipy.sparse
+
+from msmtools.util.exceptions import NotConvergedWarning
+from boundary_value_problem import states_mask, replace_rows, restrict, linear_solve, solve_dirichlet
+
+try:
+    import pyamg
+except ImportError:
+    pyamg = None
+
+
+class TestBoundaryValueProblem(unittest.TestCase):
+    def setUp(self):
+        self.n = 20
+        A = np.random.rand(self.n, self.n)
+        A[A < 0.6] = 0.0
+        A += np.eye(self.n)
+        self.A_dense = A
+        self.A = scipy.sparse.csr_matrix(A)
+        self.boundary = states_mask(self.n, [0, 3, 4, 17])
+
+    def tearDown(self):
+        pass
+
+    def test_states_mask(self):
+        mask = states_mask(5, [1, 3])
+        assert_allclose(mask, np.array([False, True, False, True, False]))
+        mask = states_mask(5, 2)
+        assert_allclose(mask, np.array([False, False, True, False, False]))
+
+    def test_replace_rows(self):
+        W = replace_rows(self.A, self.boundary, diag=2.0)
+        W_ref = 1.0 * self.A_dense
+        W_ref[self.boundary, :] = 0.0
+        W_ref[self.boundary, self.boundary] = 2.0
+        self.assertTrue(scipy.sparse.isspmatrix_csr(W))
+        assert_allclose(W.toarray(), W_ref)
+
+    def test_restrict(self):
+        S = restrict(scipy.sparse.coo_matrix(self.A_dense), ~self.boundary)
+        S_ref = self.A_dense[~self.boundary, :][:, ~self.boundary]
+        assert_allclose(S.toarray(), S_ref)
+
+    def test_solve_dirichlet(self):
+        f = np.random.rand(self.n)
+        g = np.random.rand(self.n)
+        W_ref = 1.0 * self.A_dense
+        W_ref[self.boundary, :] = 0.0
+        W_ref[self.boundary, self.boundary] = 1.0
+        u_ref = np.linalg.solve(W_ref, np.where(self.boundary, g, f))
+        u = solve_dirichlet(self.A, f, self.boundary, g, eliminate=True)
+        assert_allclose(u, u_ref)
+        u = solve_dirichlet(self.A, f, self.boundary, g, eliminate=False)
+        assert_allclose(u, u_ref)
+
+    def test_solve_dirichlet_no_interior(self):
+        g = np.random.rand(self.n)
+        boundary = np.ones(self.n, dtype=bool)
+        u = solve_dirichlet(self.A, np.zeros(self.n), boundary, g)
+        assert_allclose(u, g)
+
+
+class TestLinearSolve(unittest.TestCase):
+    def setUp(self):
+        self.n = 100
+        """Diagonally dominant discrete Laplacian with drift"""
+        W = 4.0 * np.eye(self.n) - 1.5 * np.eye(self.n, k=1) - 0.5 * np.eye(self.n, k=-1)
+        self.W = scipy.sparse.csr_matrix(W)
+        self.x = np.random.rand(self.n)
+        self.r = self.W.dot(self.x)
+
+    def tearDown(self):
+        pass
+
+    def test_direct(self):
+        x, resnorms = linear_solve(self.W, self.r, solver='direct')
+        assert_allclose(x, self.x)
+        self.assertEqual(resnorms.shape, (1,))
+
+    def test_krylov(self):
+        for solver in ['gmres', 'bicgstab']:
+            x, resnorms = linear_solve(self.W, self.r, solver=solver, tol=1e-12)
+            assert_allclose(x, self.x)
+            self.assertTrue(resnorms.shape[0] > 0)
+
+    def test_warm_start(self):
+        x, resnorms = linear_solve(self.W, self.r, solver='bicgstab', tol=1e-12)
+        x0 = self.x + 1e-8 * np.random.rand(self.n)
+        x, resnorms_warm = linear_solve(self.W, self.r, solver='bicgstab', tol=1e-12, x0=x0)
+        assert_allclose(x, self.x)
+        self.assertTrue(resnorms_warm.shape[0] < resnorms.shape[0])
+
+    def test_not_converged(self):
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            linear_solve(self.W, self.r, solver='gmres', tol=1e-14, maxiter=1)
+            self.assertTrue(any(issubclass(wi.category, NotConvergedWarning) for wi in w))
+
+    @unittest.skipIf(pyamg is None, 'pyamg is not installed')
+    def test_amg(self):
+        x, resnorms = linear_solve(self.W, self.r, solver='amg', tol=1e-12)
+        assert_allclose(x, self.x)
+
+    def test_unknown_solver(self):
+        with self.assertRaises(ValueError):
+            linear_solve(self.W, self.r, solver='cholesky')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,13 +31,16 @@ backward comittors using sparse linear algebra.
 """
 import numpy as np
 
-from scipy.sparse import eye, coo_matrix, diags
-from scipy.sparse.linalg import spsolve
+from scipy.sparse import eye, diags, csr_matrix
+from scipy.sparse.linalg import splu
 
-from decomposition import stationary_distribution_from_backward_iteration as statdist
+from decomposition import stationary_distribution_from_linear_system as statdist
+from decomposition import stationary_distribution_from_rate_matrix
+from boundary_value_problem import states_mask, solve_dirichlet, interior_system, replace_rows
 
 
-def forward_committor(T, A, B):
+def forward_committor(T, A, B, solver='direct', tol=1e-10, x0=None, maxiter=None,
+                      return_conv=False, rate_matrix=False):
     r"""Forward committor between given sets.
 
     The forward committor u(x) between sets A and B is the probability
@@ -51,11 +54,28 @@ def forward_committor(T, A, B):
         List of integer state labels for set A
     B : array_like
         List of integer state labels for set B
+    solver : str (optional)
+        Linear solver, one of 'direct' (sparse LU decomposition),
+        'gmres', 'bicgstab' or 'amg' (requires pyamg)
+    tol : float (optional)
+        Relative residual tolerance of the iterative solvers
+    x0 : (M, ) ndarray (optional)
+        Initial guess for the iterative solvers, e.g. the committor
+        at a neighbouring lag time
+    maxiter : int (optional)
+        Maximum number of iterations of the iterative solvers
+    return_conv : bool (optional)
+        If True, the residual history of the solver is also returned
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix and used as the generator L
 
     Returns
     -------
     u : (M, ) ndarray
         Vector of forward committor probabilities
+    (resnorms) : ndarray
+        Relative residual norms, one for each solver iteration. Only
+        returned if return_conv = True
 
     Notes
     -----
@@ -68,45 +88,26 @@ def forward_committor(T, A, B):
                       u_{i}=0    for i \in A        (II)
                       u_{i}=1    for i \in B        (III)
 
-    with generator matrix L=(P-I).
+    with generator matrix L=(P-I), or L=K for a rate matrix K.
 
     """
-    X = set(range(T.shape[0]))
-    A = set(A)
-    B = set(B)
-    AB = A.intersection(B)
-    notAB = X.difference(A).difference(B)
-    if len(AB) > 0:
+    n = T.shape[0]
+    A = states_mask(n, A)
+    B = states_mask(n, B)
+    if np.any(A & B):
         raise ValueError("Sets A and B have to be disjoint")
-    L = T - eye(T.shape[0], T.shape[0])
+    L = _generator(T, rate_matrix)
 
-    """Assemble left hand-side W for linear system"""
-    """Equation (I)"""
-    W = 1.0 * L
-
-    """Equation (II)"""
-    W = W.todok()
-    W[list(A), :] = 0.0
-    W.tocsr()
-    W = W + coo_matrix((np.ones(len(A)), (list(A), list(A))), shape=W.shape).tocsr()
-
-    """Equation (III)"""
-    W = W.todok()
-    W[list(B), :] = 0.0
-    W.tocsr()
-    W = W + coo_matrix((np.ones(len(B)), (list(B), list(B))), shape=W.shape).tocsr()
+    """Boundary values, equations (II) and (III)"""
+    g = np.where(B, 1.0, 0.0)
 
-    """Assemble right hand side r for linear system"""
-    """Equation (I+II)"""
-    r = np.zeros(T.shape[0])
-    """Equation (III)"""
-    r[list(B)] = 1.0
-
-    u = spsolve(W, r)
-    return u
+    """Equation (I)"""
+    return solve_dirichlet(L, np.zeros(n), A | B, g, solver=solver, tol=tol, x0=x0,
+                           maxiter=maxiter, return_conv=return_conv)
 
 
-def backward_committor(T, A, B):
+def backward_committor(T, A, B, solver='direct', tol=1e-10, x0=None, maxiter=None,
+                       return_conv=False, rate_matrix=False):
     r"""Backward committor between given sets.
 
     The backward committor u(x) between sets A and B is the
@@ -121,11 +122,28 @@ def backward_committor(T, A, B):
         List of integer state labels for set A
     B : array_like
         List of integer state labels for set B
+    solver : str (optional)
+        Linear solver, one of 'direct' (sparse LU decomposition),
+        'gmres', 'bicgstab' or 'amg' (requires pyamg)
+    tol : float (optional)
+        Relative residual tolerance of the iterative solvers
+    x0 : (M, ) ndarray (optional)
+        Initial guess for the iterative solvers, e.g. the committor
+        at a neighbouring lag time
+    maxiter : int (optional)
+        Maximum number of iterations of the iterative solvers
+    return_conv : bool (optional)
+        If True, the residual history of the solver is also returned
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix and used as the generator L
 
     Returns
     -------
     u : (M, ) ndarray
-        Vector of forward committor probabilities    
+        Vector of forward committor probabilities
+    (resnorms) : ndarray
+        Relative residual norms, one for each solver iteration. Only
+        returned if return_conv = True
 
     Notes
     -----
@@ -138,43 +156,197 @@ def backward_committor(T, A, B):
                                   u_{i}=1    for i \in A        (II)
                                   u_{i}=0    for i \in B        (III)
 
-    with adjoint of the generator matrix K=(D_pi(P-I))'.
+    with adjoint of the generator matrix K=(D_pi L)' and L=(P-I), or
+    L equal to the rate matrix.
 
     """
-    X = set(range(T.shape[0]))
-    A = set(A)
-    B = set(B)
-    AB = A.intersection(B)
-    notAB = X.difference(A).difference(B)
-    if len(AB) > 0:
+    n = T.shape[0]
+    A = states_mask(n, A)
+    B = states_mask(n, B)
+    if np.any(A & B):
         raise ValueError("Sets A and B have to be disjoint")
-    pi = statdist(T)
-    L = T - eye(T.shape[0], T.shape[0])
+    pi = stationary_distribution_from_rate_matrix(T) if rate_matrix else statdist(T)
+    L = _generator(T, rate_matrix)
     D = diags([pi, ], [0, ])
     K = (D.dot(L)).T
 
-    """Assemble left-hand side W for linear system"""
+    """Boundary values, equations (II) and (III)"""
+    g = np.where(A, 1.0, 0.0)
+
     """Equation (I)"""
-    W = 1.0 * K
+    return solve_dirichlet(K, np.zeros(n), A | B, g, solver=solver, tol=tol, x0=x0,
+                           maxiter=maxiter, return_conv=return_conv)
+
+
+def committors(T, A, B, mu=None, rate_matrix=False):
+    r"""Forward and backward committor from a single LU factorization.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    A : array_like
+        List of integer state labels for set A
+    B : array_like
+        List of integer state labels for set B
+    mu : (M, ) ndarray (optional)
+        Stationary distribution of T
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix and used as the generator L
+
+    Returns
+    -------
+    qplus : (M, ) ndarray
+        Vector of forward committor probabilities
+    qminus : (M, ) ndarray
+        Vector of backward committor probabilities
+
+    Notes
+    -----
+    Both boundary-value problems live on the interior states
+    I=X\(A u B). The forward committor solves
+
+    .. math:: L_{II} u_{I} = -L_{IB} g_{B}
+
+    and the backward committor solves the transposed system
+
+    .. math:: L_{II}^T D_{\pi, I} u_{I} = -(L^T D_{\pi} g)_{I}
+
+    with generator L=(P-I), or L=K for a rate matrix K. The sparse LU factors of L_{II} are computed
+    once and used for both solves.
+
+    """
+    n = T.shape[0]
+    A = states_mask(n, A)
+    B = states_mask(n, B)
+    if np.any(A & B):
+        raise ValueError("Sets A and B have to be disjoint")
+    if mu is None:
+        mu = stationary_distribution_from_rate_matrix(T) if rate_matrix else statdist(T)
+    L = _generator(T, rate_matrix)
 
-    """Equation (II)"""
-    W = W.todok()
-    W[list(A), :] = 0.0
-    W.tocsr()
-    W = W + coo_matrix((np.ones(len(A)), (list(A), list(A))), shape=W.shape).tocsr()
+    """Boundary values"""
+    qplus = np.where(B, 1.0, 0.0)
+    qminus = np.where(A, 1.0, 0.0)
 
-    """Equation (III)"""
-    W = W.todok()
-    W[list(B), :] = 0.0
-    W.tocsr()
-    W = W + coo_matrix((np.ones(len(B)), (list(B), list(B))), shape=W.shape).tocsr()
+    W, r, interior = interior_system(L, np.zeros(n), A | B, qplus)
+    if interior.size > 0:
+        lu = splu(W.tocsc())
+        qplus[interior] = lu.solve(r)
+        """Backward problem with the transposed factors"""
+        rb = -(L.transpose().dot(mu * qminus))[interior]
+        qminus[interior] = lu.solve(rb, trans='T') / mu[interior]
+    return qplus, qminus
 
-    """Assemble right-hand side r for linear system"""
-    """Equation (I)+(III)"""
-    r = np.zeros(T.shape[0])
-    """Equation (II)"""
-    r[list(A)] = 1.0
 
-    u = spsolve(W, r)
+class CommittorSolver(object):
+    r"""Forward and backward committors for many pairs of sets A, B.
+
+    The generator L is factorized once, with the row of a single
+    reference state r replaced by a unit row. The Dirichlet system for a
+    pair of sets differs from this reference system only in the rows of
+    A u B u {r}, the committors are obtained from the reference factors
+    by a low-rank (Woodbury) update.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Irreducible transition matrix (default) or rate matrix
+    mu : (M, ) ndarray (optional)
+        Stationary distribution of T
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix and used as the generator L
+    max_rank : int (optional)
+        Largest rank of the update. For pairs with more than max_rank
+        boundary states, the interior system of the pair is factorized
+        directly instead.
+
+    Notes
+    -----
+    For the boundary B'=A u B the Dirichlet system is
+    :math:`W_{B'} = W_r + E_D C` with the changed rows D=B' u {r}. Both
+    the forward problem with :math:`W_{B'}` and the backward problem
+    with :math:`W_{B'}^T` are solved from the factors of :math:`W_r`
+    and the |D| solutions :math:`Z=W_r^{-1} E_D`.
+
+    """
 
-    return u
\ No newline at end of file
+    def __init__(self, T, mu=None, rate_matrix=False, max_rank=100):
+        self.rate_matrix = rate_matrix
+        self.max_rank = max_rank
+        self.T = csr_matrix(T)
+        self.n = self.T.shape[0]
+        if mu is None:
+            mu = stationary_distribution_from_rate_matrix(self.T) if rate_matrix else statdist(self.T)
+        self.mu = mu
+        self.L = _generator(self.T, rate_matrix)
+        self.Lt = self.L.transpose().tocsr()
+        """Reference state with the largest escape rate"""
+        self.r = int(np.argmax(np.abs(self.L.diagonal())))
+        self.lu = splu(replace_rows(self.L, states_mask(self.n, self.r)).tocsc())
+
+    def committors(self, A, B):
+        r"""Forward and backward committor between sets A and B.
+
+        Parameters
+        ----------
+        A : array_like
+            List of integer state labels for set A
+        B : array_like
+            List of integer state labels for set B
+
+        Returns
+        -------
+        qplus : (M, ) ndarray
+            Vector of forward committor probabilities
+        qminus : (M, ) ndarray
+            Vector of backward committor probabilities
+
+        """
+        n = self.n
+        A = states_mask(n, A)
+        B = states_mask(n, B)
+        if np.any(A & B):
+            raise ValueError("Sets A and B have to be disjoint")
+        boundary = A | B
+        changed = boundary.copy()
+        changed[self.r] = True
+        d = np.where(changed)[0]
+        if d.shape[0] > self.max_rank:
+            return committors(self.T, np.where(A)[0], np.where(B)[0], mu=self.mu,
+                              rate_matrix=self.rate_matrix)
+
+        """Rows of the update C=W_B'[D, :] - W_r[D, :]"""
+        Ld = self.L[d, :]
+        E = csr_matrix((np.ones(d.shape[0]), (np.arange(d.shape[0]), d)), shape=(d.shape[0], n))
+        sign = np.where(boundary[d], 1.0, -1.0)
+        sign[d == self.r] = 0.0 if boundary[self.r] else -1.0
+        C = diags(sign, 0).dot(E - Ld).tocsr()
+
+        """Z=W_r^{-1} E_D and the capacitance matrix S=I+C Z"""
+        Z = self.lu.solve(E.transpose().toarray())
+        S = np.eye(d.shape[0]) + C.dot(Z)
+
+        """Forward committor, W_B' u = g"""
+        g = np.where(B, 1.0, 0.0)
+        y = self.lu.solve(g)
+        qplus = y - Z.dot(np.linalg.solve(S, C.dot(y)))
+        qplus[boundary] = g[boundary]
+
+        """Backward committor, interior rows of W_B'^T z = c give L_II^T D_I u_I = c_I"""
+        h = np.where(A, 1.0, 0.0)
+        c = -self.Lt.dot(self.mu * h)
+        c[boundary] = 0.0
+        z = self.lu.solve(c - C.transpose().dot(np.linalg.solve(S.T, Z.T.dot(c))), trans='T')
+        qminus = h
+        interior = ~boundary
+        qminus[interior] = z[interior] / self.mu[interior]
+        return qplus, qminus
+
+
+def _generator(T, rate_matrix):
+    r"""Generator L=(P-I) of a transition matrix, or the rate matrix itself"""
+    T = csr_matrix(T)
+    if rate_matrix:
+        return T
+    return T - eye(T.shape[0], T.shape[0], format='csr')
@@ -32,7 +32,7 @@ import unittest
 import numpy as np
 from msmtools.util.numeric import assert_allclose
 
-from scipy.sparse import diags
+from scipy.sparse import diags, csr_matrix
 
 import committor
 
@@ -223,6 +223,52 @@ class TestCommittor(unittest.TestCase):
         u = self.bdc.committor_backward(9, 90)
         assert_allclose(un, u)
 
+    def test_forward_comittor_iterative(self):
+        P = self.bdc.transition_matrix_sparse()
+        u = self.bdc.committor_forward(9, 90)
+        for solver in ['gmres', 'bicgstab']:
+            un, resnorms = committor.forward_committor(P, range(10), range(90, 100), solver=solver,
+                                                       tol=1e-12, maxiter=10000, return_conv=True)
+            assert_allclose(un, u)
+            self.assertTrue(resnorms.shape[0] > 0)
+
+    def test_backward_comittor_warm_start(self):
+        P = self.bdc.transition_matrix_sparse()
+        u = self.bdc.committor_backward(9, 90)
+        un, resnorms = committor.backward_committor(P, range(10), range(90, 100), solver='bicgstab',
+                                                    tol=1e-12, maxiter=10000, return_conv=True)
+        assert_allclose(un, u)
+        un, resnorms_warm = committor.backward_committor(P, range(10), range(90, 100), solver='bicgstab',
+                                                         tol=1e-12, maxiter=10000, x0=u, return_conv=True)
+        assert_allclose(un, u)
+        self.assertTrue(resnorms_warm.shape[0] <= resnorms.shape[0])
+
+
+    def test_committors(self):
+        P = self.bdc.transition_matrix_sparse()
+        uplus, uminus = committor.committors(P, range(10), range(90, 100))
+        assert_allclose(uplus, self.bdc.committor_forward(9, 90))
+        assert_allclose(uminus, self.bdc.committor_backward(9, 90))
+
+    def test_committors_nonreversible(self):
+        C = np.random.RandomState(42).rand(20, 20)
+        P = csr_matrix(C / C.sum(axis=1)[:, np.newaxis])
+        A = [0, 1]
+        B = [18, 19]
+        uplus, uminus = committor.committors(P, A, B)
+        assert_allclose(uplus, committor.forward_committor(P, A, B))
+        assert_allclose(uminus, committor.backward_committor(P, A, B))
+
+
+    def test_committor_solver(self):
+        C = np.random.RandomState(42).rand(20, 20)
+        P = csr_matrix(C / C.sum(axis=1)[:, np.newaxis])
+        solver = committor.CommittorSolver(P)
+        for A, B in [([0, 1], [18, 19]), ([solver.r], [5]), ([3, 4], [solver.r, 7])]:
+            uplus, uminus = solver.committors(A, B)
+            assert_allclose(uplus, committor.forward_committor(P, A, B))
+            assert_allclose(uminus, committor.backward_committor(P, A, B))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
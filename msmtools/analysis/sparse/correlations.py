@@ -0,0 +1,160 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""This module provides sparse implementations of time-correlations and
+relaxations, evaluated by propagation of the observables.
+
+"""
+
+import numpy as np
+
+from msmtools.util import propagation
+
+from decomposition import stationary_distribution_from_linear_system as statdist
+
+
+def correlation(P, obs1, obs2=None, times=[1], mu=None):
+    r"""Time-correlation for equilibrium experiment - via propagation.
+
+    Parameters
+    ----------
+    P : (M, M) scipy.sparse matrix
+        Transition matrix
+    obs1 : (M,) or (M, m) ndarray
+        Observable, represented as vector on state space, or m observables
+        in the columns of a matrix
+    obs2 : (M,) or (M, m) ndarray (optional)
+        Second observable, for cross-correlations
+    times : list of int (optional)
+        List of times (in tau) at which to compute correlation
+    mu : (M,) ndarray (optional)
+        Stationary distribution of P, computed if not given
+
+    Returns
+    -------
+    correlations : (n_t,) or (n_t, m) ndarray
+        Correlation values at given times
+
+    """
+    if obs2 is None:
+        obs2 = obs1
+    if mu is None:
+        mu = statdist(P)
+    obs1 = np.asarray(obs1)
+    if obs1.ndim == 2:
+        l = mu[:, np.newaxis] * obs1
+    else:
+        l = mu * obs1
+    return time_products(P, l, obs2, times)
+
+
+def relaxation(P, p0, obs, times=[1]):
+    r"""Relaxation experiment - via propagation.
+
+    Parameters
+    ----------
+    P : (M, M) scipy.sparse matrix
+        Transition matrix
+    p0 : (M,) ndarray
+        Initial distribution for a relaxation experiment
+    obs : (M,) or (M, m) ndarray
+        Observable, represented as vector on state space, or m observables
+        in the columns of a matrix
+    times : list of int (optional)
+        List of times at which to compute expectation
+
+    Returns
+    -------
+    res : (n_t,) or (n_t, m) ndarray
+        Array of expectation value at given times
+
+    """
+    return time_products(P, p0, obs, times)
+
+
+def time_products(P, l, r, times=[1]):
+    r"""Compute the products l' P^k r for all given times k at once.
+
+    The times are sorted and a single (block) vector is propagated from one
+    requested time to the next, up to the largest time. The side with fewer
+    columns is the one being propagated.
+
+    Parameters
+    ----------
+    P : (M, M) scipy.sparse matrix
+        Transition matrix
+    l : (M,) or (M, m) ndarray
+        Left vector, or m left vectors in the columns of a matrix
+    r : (M,) or (M, m) ndarray
+        Right vector, or m right vectors in the columns of a matrix
+    times : array-like, shape(n_t)
+        Vector of non-negative integer time points
+
+    Returns
+    -------
+    products : (n_t,) or (n_t, m) ndarray
+        Products l' P^k r in the order of the given times, one column per
+        pair of columns of l and r
+
+    """
+    l, r, times, single = _check_products(P, l, r, times)
+    f = _time_products_by_mtx_vec_prod(P, l, r, times)
+    if single:
+        f = f[:, 0]
+    return f
+
+
+def _check_products(P, l, r, times):
+    r"""Validated (M, m) blocks l and r, integer times and whether both sides were vectors"""
+    n = P.shape[0]
+    l = np.asarray(l)
+    r = np.asarray(r)
+    if l.shape[0] != n or r.shape[0] != n:
+        raise ValueError("observable shape not compatible with given matrix")
+    single = l.ndim == 1 and r.ndim == 1
+    l = l.reshape((n, -1))
+    r = r.reshape((n, -1))
+    if l.shape[1] != r.shape[1] and l.shape[1] != 1 and r.shape[1] != 1:
+        raise ValueError("number of left (%d) and right (%d) vectors do not match" % (l.shape[1], r.shape[1]))
+    times = np.asarray(times, dtype=int).reshape(-1)
+    if np.any(times < 0):
+        raise ValueError("Times can not be negative")
+    return l, r, times, single
+
+
+def _time_products_by_mtx_vec_prod(P, l, r, times):
+    r"""Products l' P^k r by propagation, for dense and sparse P alike"""
+    # propagate the side with fewer columns, from the left if it is l
+    if l.shape[1] < r.shape[1]:
+        A, y, other = P.T, l, r
+    else:
+        A, y, other = P, r, l
+    y = np.array(y, dtype=float)
+    f = np.empty((times.size, max(l.shape[1], r.shape[1])))
+    t = 0
+    for i in np.argsort(times, kind='mergesort'):
+        y = propagation.propagate(A, y, times[i] - t)
+        t = times[i]
+        f[i] = (other * y).sum(axis=0)
+    return f
@@ -0,0 +1,116 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Test package for the correlations module
+
+"""
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from msmtools.util.numeric import assert_allclose
+
+from birth_death_chain import BirthDeathChain
+
+import correlations
+
+
+class TestCorrelations(unittest.TestCase):
+    def setUp(self):
+        p = np.zeros(10)
+        q = np.zeros(10)
+        p[0:-1] = 0.5
+        q[1:] = 0.5
+        p[4] = 0.01
+        q[6] = 0.1
+
+        self.bdc = BirthDeathChain(q, p)
+
+        self.mu = self.bdc.stationary_distribution()
+        self.T = self.bdc.transition_matrix()
+        self.P = csr_matrix(self.T)
+
+    def test_correlation(self):
+        obs = np.random.random((10, 3))
+        times = [20, 0, 3, 7, 3, 1000]
+        """results are returned in the order of the given times"""
+        expected = np.array([np.dot(self.mu * obs[:, j], np.dot(np.linalg.matrix_power(self.T, t), obs[:, j]))
+                             for t in times for j in range(3)]).reshape(len(times), 3)
+        assert_allclose(correlations.correlation(self.P, obs, times=times), expected)
+        assert_allclose(correlations.correlation(self.P, obs, times=times, mu=self.mu), expected)
+        for j in range(3):
+            assert_allclose(correlations.correlation(self.P, obs[:, j], times=times), expected[:, j])
+        """Cross-correlation"""
+        expected = np.array([np.dot(self.mu * obs[:, 0], np.dot(np.linalg.matrix_power(self.T, t), obs[:, 1]))
+                             for t in times])
+        assert_allclose(correlations.correlation(self.P, obs[:, 0], obs2=obs[:, 1], times=times), expected)
+
+    def test_relaxation(self):
+        obs = np.random.random((10, 3))
+        p0 = np.random.random(10)
+        p0 /= p0.sum()
+        times = [20, 0, 3, 7, 3, 1000]
+        expected = np.array([np.dot(np.dot(p0, np.linalg.matrix_power(self.T, t)), obs) for t in times])
+        assert_allclose(correlations.relaxation(self.P, p0, obs, times=times), expected)
+        for j in range(3):
+            assert_allclose(correlations.relaxation(self.P, p0, obs[:, j], times=times), expected[:, j])
+
+    def test_time_products(self):
+        """the side with fewer columns is propagated, from the left or from the right"""
+        l = np.random.random((10, 3))
+        r = np.random.random(10)
+        times = [5, 2]
+        expected = np.array([np.dot(l.T, np.dot(np.linalg.matrix_power(self.T, t), r)) for t in times])
+        assert_allclose(correlations.time_products(self.P, l, r, times), expected)
+        assert_allclose(correlations.time_products(self.P.T, r, l, times), expected)
+        self.assertEqual(correlations.time_products(self.P, r, r, []).shape, (0,))
+        with self.assertRaises(ValueError):
+            correlations.time_products(self.P, l, r, [-1])
+        with self.assertRaises(ValueError):
+            correlations.time_products(self.P, l[1:], r, times)
+        with self.assertRaises(ValueError):
+            correlations.time_products(self.P, l, np.random.random((10, 2)), times)
+
+    def test_relaxation_long_times(self):
+        """long times on a sparse chain with 500 states, far beyond any invariant Krylov subspace"""
+        n = 500
+        p = 0.3 * np.ones(n)
+        q = 0.3 * np.ones(n)
+        p[-1] = 0.0
+        q[0] = 0.0
+        p[n // 2] = 0.01
+        T = diags([q[1:], 1.0 - p - q, p[:-1]], [-1, 0, 1], format='csr')
+        p0 = np.zeros(n)
+        p0[0] = 1.0
+        obs = np.column_stack((np.ones(n), np.arange(n) < n // 2, np.linspace(0.0, 1.0, n)))
+        times = [100000]
+        rel_expected = np.dot(np.dot(p0, np.linalg.matrix_power(T.toarray(), times[0])), obs)
+        rel = correlations.relaxation(T, p0, obs, times=times)
+        assert_allclose(rel[0], rel_expected)
+        assert_allclose(rel[0, 0], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -36,12 +36,14 @@ Matrices are represented by scipy.sparse matrices throughout this module.
 import numpy as np
 import scipy.sparse.linalg
 
-from scipy.sparse import eye
-from scipy.sparse.linalg import factorized
+from scipy.sparse import eye, diags
+from scipy.sparse.linalg import factorized, splu
+from scipy.sparse.linalg import ArpackNoConvergence
 
 import warnings
 
 from msmtools.util.exceptions import ImaginaryEigenValueWarning, SpectralWarning
+from boundary_value_problem import replace_rows, states_mask
 
 
 def backward_iteration(A, mu, x0, tol=1e-15, maxiter=100):
@@ -110,6 +112,72 @@ def stationary_distribution_from_backward_iteration(P, eps=1e-15):
     return pi
 
 
+def stationary_distribution_from_rate_matrix(K):
+    r"""Fast computation of the stationary vector of a rate matrix
+    using a single sparse LU decomposition.
+
+    Parameters
+    ----------
+    K : (M, M) scipy.sparse matrix
+        Rate matrix
+
+    Returns
+    -------
+    pi : (M,) ndarray
+        Stationary vector, pi^T K = 0
+
+    Notes
+    -----
+    For an irreducible K one equation of the singular system
+    K^T pi = 0 is redundant. The equation of the state r with the
+    largest escape rate is replaced by pi_r = 1, the solution is then
+    normalized.
+
+    """
+    return _stationary_distribution_from_generator(K)
+
+
+def stationary_distribution_from_linear_system(P):
+    r"""Computation of the stationary vector of a transition matrix
+    using a single sparse LU decomposition.
+
+    Parameters
+    ----------
+    P : (M, M) scipy.sparse matrix
+        Transition matrix
+
+    Returns
+    -------
+    pi : (M,) ndarray
+        Stationary vector, pi^T P = pi^T
+
+    Notes
+    -----
+    The stationary vector solves the singular system (P^T - I) pi = 0.
+    As for a rate matrix, the equation of the state r with the largest
+    escape probability 1 - P_rr is replaced by pi_r = 1, the solution
+    is then normalized. Unlike backward iteration with a shift close to
+    one, this does not depend on a convergence criterion at the level
+    of the rounding error.
+
+    """
+    n = P.shape[0]
+    K = P - eye(n, n)
+    return _stationary_distribution_from_generator(K)
+
+
+def _stationary_distribution_from_generator(K):
+    r"""Left null vector of the irreducible generator K, rows of K sum to zero"""
+    n = K.shape[0]
+    r = np.argmax(np.abs(K.diagonal()))
+    A = replace_rows(K.transpose(), states_mask(n, [r]))
+    b = np.zeros(n)
+    b[r] = 1.0
+    y = splu(A.tocsc()).solve(b)
+    pi = y / y.sum()
+    return pi
+
+
 def stationary_distribution_from_eigenvector(T, ncv=None):
     r"""Compute stationary distribution of stochastic matrix T. 
       
@@ -136,7 +204,113 @@ def stationary_distribution_from_eigenvector(T, ncv=None):
     return mu
 
 
-def eigenvalues(T, k=None, ncv=None):
+def eigensolver(T, k, v0=None, ncv=None, method='arpack', mu=None, tol=0, maxiter=None, random_state=None):
+    r"""Compute the eigenvalues of largest magnitude and the right eigenvectors.
+
+    The solver can be warm-started with the eigenvectors of a previous
+    solve for a similar matrix, e.g. a bootstrap sample, a posterior
+    sample or the transition matrix at a neighbouring lag time.
+
+    Parameters
+    ----------
+    T : scipy.sparse matrix
+        Transition matrix
+    k : int
+        Number of eigenvalues to compute.
+    v0 : (M,) or (M, m) ndarray (optional)
+        Starting vector, or a block of m approximate eigenvectors, for
+        instance the eigenvectors returned by a previous call. ARPACK
+        starts from the sum of the columns of a block. LOBPCG starts from
+        the block, completed by random vectors if m < k.
+    ncv : int (optional)
+        The number of Lanczos vectors generated, `ncv` must be greater than k;
+        it is recommended that ncv > 2*k. If not given, ncv starts at
+        max(2*k+1, 20) and is doubled whenever ARPACK does not converge.
+    method : {'arpack', 'lobpcg'} (optional)
+        arpack: implicitly restarted Arnoldi method via scipy.sparse.linalg.eigs.
+        lobpcg: locally optimal block preconditioned conjugate gradient
+            method applied to the symmetrized matrix. T has to be
+            reversible, and the algebraically largest eigenvalues are
+            computed.
+    mu : (M,) ndarray (optional)
+        Stationary distribution of T, only used with method='lobpcg'.
+        Computed if not given.
+    tol : float (optional)
+        Solver tolerance, the default 0 means machine precision for
+        ARPACK and the LOBPCG default.
+    maxiter : int (optional)
+        Maximum number of iterations, defaults to 10*M for ARPACK and to
+        max(100, M) for LOBPCG.
+    random_state : int or numpy.random.RandomState (optional)
+        Seed or generator for the random start vectors of LOBPCG. The
+        default is a fixed seed, so that repeated solves give the same
+        result. If LOBPCG breaks down, it is restarted once from a new
+        random block and ARPACK is used if it breaks down again.
+
+    Returns
+    -------
+    w : (k,) ndarray
+        Eigenvalues ordered with decreasing magnitude
+    R : (M, k) ndarray
+        Right eigenvectors, R[:, i] corresponds to w[i]
+
+    """
+    n = T.shape[0]
+    if v0 is not None:
+        v0 = np.asarray(v0)
+    if method == 'arpack':
+        if v0 is not None:
+            v0 = v0.reshape((n, -1))
+            v0 = v0.real.sum(axis=1) + v0.imag.sum(axis=1)
+        adaptive = ncv is None
+        if adaptive:
+            ncv = min(n, max(2 * k + 1, 20))
+        while True:
+            try:
+                w, R = scipy.sparse.linalg.eigs(T, k=k, which='LM', v0=v0, ncv=ncv, tol=tol, maxiter=maxiter)
+                break
+            except ArpackNoConvergence as e:
+                if not adaptive or ncv >= n:
+                    raise
+                """Restart with a larger subspace from the converged Ritz vectors"""
+                if e.eigenvectors.shape[1] > 0:
+                    v0 = e.eigenvectors.real.sum(axis=1) + e.eigenvectors.imag.sum(axis=1)
+                ncv = min(n, 2 * ncv)
+    elif method == 'lobpcg':
+        if mu is None:
+            mu = stationary_distribution_from_linear_system(T)
+        """Symmetric matrix S = D^(1/2) T D^(-1/2) with D = diag(mu)"""
+        sqrt_mu = np.sqrt(mu)
+        S = diags(sqrt_mu, 0).dot(T).dot(diags(1.0 / sqrt_mu, 0))
+        if not isinstance(random_state, np.random.RandomState):
+            random_state = np.random.RandomState(0 if random_state is None else random_state)
+        X = random_state.random_sample((n, k))
+        if v0 is not None:
+            X0 = sqrt_mu[:, np.newaxis] * v0.real.reshape((n, -1))[:, 0:k]
+            X[:, 0:X0.shape[1]] = X0
+        if maxiter is None:
+            maxiter = max(100, n)
+        try:
+            w, Y = scipy.sparse.linalg.lobpcg(S, X, largest=True, tol=(tol if tol > 0 else None), maxiter=maxiter)
+        except (np.linalg.LinAlgError, ValueError):
+            """LOBPCG breaks down for a (nearly) linearly dependent block, restart
+            from a new random block and fall back to ARPACK"""
+            try:
+                X = random_state.random_sample((n, k))
+                w, Y = scipy.sparse.linalg.lobpcg(S, X, largest=True, tol=(tol if tol > 0 else None),
+                                                  maxiter=maxiter)
+            except (np.linalg.LinAlgError, ValueError):
+                return eigensolver(T, k, v0=v0, method='arpack', tol=tol)
+        R = Y / sqrt_mu[:, np.newaxis]
+        R = R / np.sqrt(np.sum(R * R, axis=0))[np.newaxis, :]
+    else:
+        raise ValueError("Keyword 'method' has to be either 'arpack' or 'lobpcg'")
+    """Sort by decreasing magnitude"""
+    ind = np.argsort(np.abs(w))[::-1]
+    return w[ind], R[:, ind]
+
+
+def eigenvalues(T, k=None, ncv=None, v0=None):
     r"""Compute the eigenvalues of a sparse transition matrix
 
     The first k eigenvalues of largest magnitude are computed.
@@ -150,6 +324,9 @@ def eigenvalues(T, k=None, ncv=None):
     ncv : int (optional)
         The number of Lanczos vectors generated, `ncv` must be greater than k;
         it is recommended that ncv > 2*k
+    v0 : (M,) or (M, m) ndarray (optional)
+        Starting vector or block of approximate right eigenvectors, e.g.
+        from a previous solve, see eigensolver
     
     Returns
     -------
@@ -160,12 +337,11 @@ def eigenvalues(T, k=None, ncv=None):
     if k is None:
         raise ValueError("Number of eigenvalues required for decomposition of sparse matrix")
     else:
-        v = scipy.sparse.linalg.eigs(T, k=k, which='LM', return_eigenvectors=False, ncv=ncv)
-        ind = np.argsort(np.abs(v))[::-1]
-        return v[ind]
+        v, R = eigensolver(T, k, v0=v0, ncv=ncv)
+        return v
 
 
-def eigenvectors(T, k=None, right=True, ncv=None):
+def eigenvectors(T, k=None, right=True, ncv=None, v0=None):
     r"""Compute eigenvectors of given transition matrix.
 
     Eigenvectors are computed using the scipy interface 
@@ -181,6 +357,9 @@ def eigenvectors(T, k=None, right=True, ncv=None):
     ncv : int (optional)
         The number of Lanczos vectors generated, `ncv` must be greater than k;
         it is recommended that ncv > 2*k
+    v0 : (M,) or (M, m) ndarray (optional)
+        Starting vector or block of approximate eigenvectors (right or
+        left, as requested), e.g. from a previous solve, see eigensolver
 
 
     Returns
@@ -195,16 +374,14 @@ def eigenvectors(T, k=None, right=True, ncv=None):
         raise ValueError("Number of eigenvectors required for decomposition of sparse matrix")
     else:
         if right:
-            val, vecs = scipy.sparse.linalg.eigs(T, k=k, which='LM', ncv=ncv)
-            ind = np.argsort(np.abs(val))[::-1]
-            return vecs[:, ind]
+            val, vecs = eigensolver(T, k, v0=v0, ncv=ncv)
+            return vecs
         else:
-            val, vecs = scipy.sparse.linalg.eigs(T.transpose(), k=k, which='LM', ncv=ncv)
-            ind = np.argsort(np.abs(val))[::-1]
-            return vecs[:, ind]
+            val, vecs = eigensolver(T.transpose(), k, v0=v0, ncv=ncv)
+            return vecs
 
 
-def rdl_decomposition(T, k=None, norm='auto', ncv=None):
+def rdl_decomposition(T, k=None, norm='auto', ncv=None, v0=None):
     r"""Compute the decomposition into left and right eigenvectors.
 
     Parameters
@@ -222,6 +399,9 @@ def rdl_decomposition(T, k=None, norm='auto', ncv=None):
     ncv : int (optional)
         The number of Lanczos vectors generated, `ncv` must be greater than k;
         it is recommended that ncv > 2*k
+    v0 : (M,) or (M, m) ndarray (optional)
+        Starting vector or block of approximate right eigenvectors, e.g.
+        from a previous solve, see eigensolver
 
     Returns
     -------
@@ -250,18 +430,9 @@ def rdl_decomposition(T, k=None, norm='auto', ncv=None):
             norm = 'standard'
     # Standard norm: Euclidean norm is 1 for r and LR = I.
     if norm == 'standard':
-        v, R = scipy.sparse.linalg.eigs(T, k=k, which='LM', ncv=ncv)
-        r, L = scipy.sparse.linalg.eigs(T.transpose(), k=k, which='LM', ncv=ncv)
-
-        """Sort right eigenvectors"""
-        ind = np.argsort(np.abs(v))[::-1]
-        v = v[ind]
-        R = R[:, ind]
-
-        """Sort left eigenvectors"""
-        ind = np.argsort(np.abs(r))[::-1]
-        r = r[ind]
-        L = L[:, ind]
+        """Eigenvectors sorted by decreasing magnitude of the eigenvalues"""
+        v, R = eigensolver(T, k, v0=v0, ncv=ncv)
+        r, L = eigensolver(T.transpose(), k, ncv=ncv)
 
         """l1-normalization of L[:, 0]"""
         L[:, 0] = L[:, 0] / np.sum(L[:, 0])
@@ -277,13 +448,9 @@ def rdl_decomposition(T, k=None, norm='auto', ncv=None):
 
     # Reversible norm:
     elif norm == 'reversible':
-        v, R = scipy.sparse.linalg.eigs(T, k=k, which='LM', ncv=ncv)
-        mu = stationary_distribution_from_backward_iteration(T)
-
-        """Sort right eigenvectors"""
-        ind = np.argsort(np.abs(v))[::-1]
-        v = v[ind]
-        R = R[:, ind]
+        """Right eigenvectors sorted by decreasing magnitude of the eigenvalues"""
+        v, R = eigensolver(T, k, v0=v0, ncv=ncv)
+        mu = stationary_distribution_from_linear_system(T)
 
         """Ensure that R[:,0] is positive"""
         R[:, 0] = R[:, 0] / np.sign(R[0, 0])
@@ -306,7 +473,7 @@ def rdl_decomposition(T, k=None, norm='auto', ncv=None):
         raise ValueError("Keyword 'norm' has to be either 'standard' or 'reversible'")
 
 
-def timescales(T, tau=1, k=None, ncv=None):
+def timescales(T, tau=1, k=None, ncv=None, v0=None):
     r"""Compute implied time scales of given transition matrix
     
     Parameters
@@ -318,6 +485,9 @@ def timescales(T, tau=1, k=None, ncv=None):
     ncv : int (optional)
         The number of Lanczos vectors generated, `ncv` must be greater than k;
         it is recommended that ncv > 2*k
+    v0 : (M,) or (M, m) ndarray (optional)
+        Starting vector or block of approximate right eigenvectors, e.g.
+        from a previous solve, see eigensolver
 
     Returns
     -------
@@ -326,11 +496,8 @@ def timescales(T, tau=1, k=None, ncv=None):
     """
     if k is None:
         raise ValueError("Number of time scales required for decomposition of sparse matrix")
-    values = scipy.sparse.linalg.eigs(T, k=k, which='LM', return_eigenvectors=False, ncv=ncv)
-
-    """Sort by absolute value"""
-    ind = np.argsort(np.abs(values))[::-1]
-    values = values[ind]
+    """Sorted by absolute value"""
+    values, R = eigensolver(T, k, v0=v0, ncv=ncv)
 
     """Check for dominant eigenvalues with large imaginary part"""
     if not np.allclose(values.imag, 0.0):
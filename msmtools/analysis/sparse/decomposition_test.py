@@ -34,13 +34,16 @@ import numpy as np
 from msmtools.util.numeric import assert_allclose
 
 from scipy.linalg import eig, eigvals
+from scipy.sparse import csr_matrix
 
 from birth_death_chain import BirthDeathChain
 
 from decomposition import stationary_distribution_from_eigenvector
 from decomposition import stationary_distribution_from_backward_iteration
+from decomposition import stationary_distribution_from_linear_system
 from decomposition import eigenvalues, eigenvectors, rdl_decomposition
 from decomposition import timescales
+from decomposition import eigensolver
 
 
 class TestDecomposition(unittest.TestCase):
@@ -73,6 +76,19 @@ class TestDecomposition(unittest.TestCase):
         mun = stationary_distribution_from_backward_iteration(P)
         assert_allclose(mu, mun)
 
+    def test_statdist_linear_system(self):
+        P = self.bdc.transition_matrix_sparse()
+        mu = self.bdc.stationary_distribution()
+        mun = stationary_distribution_from_linear_system(P)
+        assert_allclose(mu, mun)
+        """Generic sparse matrix, backward iteration stalls at the rounding level"""
+        C = np.random.RandomState(42).rand(12, 12)
+        C[C < 0.3] = 0.0
+        P = csr_matrix(C / C.sum(axis=1)[:, np.newaxis])
+        mun = stationary_distribution_from_linear_system(P)
+        assert_allclose(P.T.dot(mun), mun)
+        assert_allclose(mun.sum(), 1.0)
+
     def test_eigenvalues(self):
         P = self.bdc.transition_matrix()
         P_dense = self.bdc.transition_matrix()
@@ -218,6 +234,72 @@ class TestDecomposition(unittest.TestCase):
         assert_allclose(7 * ts[1:self.k], tsn[1:])
 
 
+class TestEigensolver(unittest.TestCase):
+    def setUp(self):
+        self.dim = 200
+        self.k = 5
+
+        """Set up lazy meta-stable birth-death chain, all eigenvalues are positive"""
+        p = np.zeros(self.dim)
+        p[0:-1] = 0.3
+
+        q = np.zeros(self.dim)
+        q[1:] = 0.3
+
+        p[self.dim / 2 - 1] = 0.001
+        q[self.dim / 2 + 1] = 0.001
+
+        self.bdc = BirthDeathChain(q, p)
+        self.P = self.bdc.transition_matrix_sparse().tocsr()
+        ev = eigvals(self.bdc.transition_matrix())
+        self.ev = ev[np.argsort(np.abs(ev))[::-1]][0:self.k]
+
+    def test_arpack(self):
+        w, R = eigensolver(self.P, self.k)
+        assert_allclose(w, self.ev)
+        assert_allclose(self.P.dot(R), w[np.newaxis, :] * R)
+
+    def test_arpack_warm_start(self):
+        w, R = eigensolver(self.P, self.k)
+        """Block of eigenvectors and single vector"""
+        wn, Rn = eigensolver(self.P, self.k, v0=R)
+        assert_allclose(wn, self.ev)
+        wn, Rn = eigensolver(self.P, self.k, v0=R[:, 1])
+        assert_allclose(wn, self.ev)
+        """Start vector from a previous solve passed through the public functions"""
+        assert_allclose(eigenvalues(self.P, k=self.k, v0=R), self.ev)
+        Rn = eigenvectors(self.P, k=self.k, v0=R)
+        assert_allclose(self.P.dot(Rn), self.ev[np.newaxis, :] * Rn)
+
+    def test_lobpcg(self):
+        mu = self.bdc.stationary_distribution()
+        """A cold start needs many iterations for the nearly degenerate eigenvalues of the metastable chain"""
+        w, R = eigensolver(self.P, self.k, method='lobpcg', mu=mu, tol=1e-10, maxiter=1000, random_state=42)
+        assert_allclose(w, self.ev, atol=1e-6)
+        """The default start block is reproducible"""
+        w1, R1 = eigensolver(self.P, self.k, method='lobpcg', mu=mu)
+        w2, R2 = eigensolver(self.P, self.k, method='lobpcg', mu=mu)
+        assert_allclose(w1, w2)
+        assert_allclose(R1, R2)
+        """Warm start from eigenvectors of the ARPACK solve"""
+        wa, Ra = eigensolver(self.P, self.k)
+        w, R = eigensolver(self.P, self.k, v0=Ra, method='lobpcg', mu=mu)
+        assert_allclose(w, self.ev)
+        assert_allclose(self.P.dot(R), w[np.newaxis, :] * R, atol=1e-6)
+
+    def test_lobpcg_breakdown(self):
+        mu = self.bdc.stationary_distribution()
+        wa, Ra = eigensolver(self.P, self.k)
+        """A linearly dependent start block, LOBPCG restarts from a random block"""
+        V = np.repeat(Ra[:, 0:1], self.k, axis=1)
+        w, R = eigensolver(self.P, self.k, v0=V, method='lobpcg', mu=mu, tol=1e-10, maxiter=1000)
+        assert_allclose(w, self.ev, atol=1e-6)
+
+    def test_method(self):
+        with self.assertRaises(ValueError):
+            eigensolver(self.P, self.k, method='lanczos')
+
+
 if __name__ == "__main__":
     unittest.main()
 
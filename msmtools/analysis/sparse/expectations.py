@@ -31,8 +31,11 @@ expectation values for a given transition matrix.
 
 import numpy as np
 
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix, csc_matrix, identity
 from scipy.sparse.construct import diags
+from scipy.sparse.linalg import splu
+
+from msmtools.util.propagation import _krylov_approximation, _krylov_dimension, _power_weights
 
 import decomposition
 
@@ -46,8 +49,9 @@ def expected_counts(p0, T, N):
 
     Parameters
     ----------
-    p0 : (M,) ndarray
-        Starting (probability) vector of the chain.
+    p0 : (M,) or (M, K) ndarray
+        Starting (probability) vector of the chain, or K starting
+        vectors in the columns of a matrix.
     T : (M, M) sparse matrix
         Transition matrix of the chain.
     N : int
@@ -55,28 +59,122 @@ def expected_counts(p0, T, N):
 
     Returns
     --------
-    EC : (M, M) sparse matrix
+    EC : (M, M) sparse matrix or list of K (M, M) sparse matrices
         Expected value for transition counts after N steps. 
 
     """
+    p0 = np.asarray(p0)
     if (N <= 0):
         EC = coo_matrix(T.shape, dtype=float)
+        if p0.ndim == 2:
+            return [EC.copy() for i in range(p0.shape[1])]
         return EC
     else:
+        p_sum = propagated_sum(p0, T, N)
+        if p_sum.ndim == 2:
+            return [diags(p_sum[:, i], 0).dot(T) for i in range(p_sum.shape[1])]
+        D_psum = diags(p_sum, 0)
+        EC = D_psum.dot(T)
+        return EC
+
+
+def propagated_sum(p0, T, N, tol=1e-10, maxiter=None):
+    r"""Sum of the propagated vectors p_0^T T^k for k=0,...,N-1.
+
+    The vectors are propagated and summed up one step after the other,
+    unless a Krylov subspace is cheaper. Then the action of the finite
+    geometric series on p0 is computed in a shift-inverted Krylov
+    subspace of T^T, which resolves the slow processes of T with few
+    sparse solves. The series of the projected matrix is evaluated by
+    binary splitting, so that the cost grows only with log(N). The
+    Krylov subspace is enlarged until an a-posteriori bound of the error
+    is below tol.
+
+    Parameters
+    ----------
+    p0 : (M,) or (M, K) ndarray
+        Starting vector, or K starting vectors in the columns of a matrix.
+    T : (M, M) sparse matrix
+        Transition matrix of the chain.
+    N : int
+        Number of terms in the sum.
+    tol : float (optional)
+        Relative tolerance of the Krylov approximation.
+    maxiter : int (optional)
+        Maximum dimension of the Krylov subspace, defaults to min(M, 500).
+        It is further limited such that a subspace which does not meet
+        tol costs at most a quarter of the step-by-step sum, and the sum
+        is then computed step by step.
+
+    Returns
+    -------
+    p_sum : (M,) or (M, K) ndarray
+        Sum of propagated vectors.
+
+    """
+    M = T.shape[0]
+    if maxiter is None:
+        maxiter = min(M, 500)
+    p0 = np.asarray(p0)
+    K = 1 if p0.ndim == 1 else p0.shape[1]
+    p_sum = None
+    """The sparse LU factors are at least as dense as T, a subspace of less than 10 extra vectors is not worth them"""
+    if N > 1 and _krylov_dimension(T, N * K, maxiter, 0.25) >= K + 10:
+        p_sum = _propagated_sum_krylov(p0, T, N, tol, maxiter)
+    if p_sum is None:
         """Probability vector after (k=0) propagations"""
         p_k = 1.0 * p0
         """Sum of vectors after (k=0) propagations"""
         p_sum = 1.0 * p_k
         """Transpose T to use sparse dot product"""
         Tt = T.transpose()
-        for k in np.arange(N - 1):
+        for k in xrange(N - 1):
             """Propagate one step p_{k} -> p_{k+1}"""
             p_k = Tt.dot(p_k)
             """Update sum"""
             p_sum += p_k
-        D_psum = diags(p_sum, 0)
-        EC = D_psum.dot(T)
-        return EC
+    return p_sum
+
+
+def _propagated_sum_krylov(p0, T, N, tol, maxiter, sigma=1.0 + 1e-8):
+    r"""Krylov approximation of sum_{k<N} (T^T)^k p0, None if its error bound does not meet tol"""
+    M = T.shape[0]
+    A = csr_matrix(T.transpose())
+    lu = splu(csc_matrix(sigma * identity(M) - A))
+    P0 = 1.0 * p0.reshape((M, -1))
+    """Subspace that costs at most a quarter of the step-by-step sum, with the actual size of the LU factors"""
+    maxiter = min(maxiter, _krylov_dimension(T, N * P0.shape[1], maxiter, 0.25, nnz=lu.nnz))
+    if maxiter < P0.shape[1] + 4:
+        return None
+    """Terms of size up to N are summed, so rounding errors of relative size N eps can not be resolved"""
+    rtol = max(tol, 10.0 * N * np.finfo(float).eps)
+    """
+    The error of the k-th power is bounded with weights that increase with k for a norm of A of at
+    least one, the error of the sum of N powers is therefore bounded by N times that of the N-th power.
+
+    """
+    Y = _krylov_approximation(A, P0, lambda H: _geometric_series_matrix(H, N),
+                              lambda gamma, mu: N * _power_weights(max(gamma, 1.0), mu, N),
+                              rtol, maxiter, extend=lu.solve)
+    if Y is None:
+        return None
+    return Y.reshape(p0.shape)
+
+
+def _geometric_series_matrix(H, N):
+    r"""Computes sum_{k<N} H^k by binary splitting in O(log N) matrix products"""
+    I = np.eye(H.shape[0])
+    S = np.zeros(H.shape)
+    Hk = I
+    for bit in bin(N)[2:]:
+        """Double the number of terms, S_{2k} = S_k + H^k S_k"""
+        S = S + np.dot(Hk, S)
+        Hk = np.dot(Hk, Hk)
+        if bit == '1':
+            """Add one term, S_{k+1} = I + H S_k"""
+            S = I + np.dot(H, S)
+            Hk = np.dot(H, Hk)
+    return S
 
 
 def expected_counts_stationary(T, n, mu=None):
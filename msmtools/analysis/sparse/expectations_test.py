@@ -129,6 +129,111 @@ class TestExpectedCounts(unittest.TestCase):
         self.assertTrue(sparse_allclose(EC_true, EC_n))
 
 
+class TestPropagatedSum(unittest.TestCase):
+    def setUp(self):
+        self.k = 20
+        """Generate a random kxk sparse transition matrix"""
+        C = np.random.random_integers(0, 100, size=(self.k, self.k))
+        C = C + np.transpose(C)
+        T = 1.0 * C / np.sum(C, axis=1)[:, np.newaxis]
+        T[T < 0.05 / self.k] = 0.0
+        T = T / np.sum(T, axis=1)[:, np.newaxis]
+        self.T = scipy.sparse.csr_matrix(T)
+        self.T_dense = T
+        P0 = np.random.random((self.k, 3))
+        self.P0 = P0 / np.sum(P0, axis=0)[np.newaxis, :]
+
+    def propagated_sum_dense(self, p0, N):
+        p_k = 1.0 * p0
+        p_sum = 1.0 * p0
+        for k in range(N - 1):
+            p_k = np.dot(self.T_dense.T, p_k)
+            p_sum += p_k
+        return p_sum
+
+    def test_propagated_sum(self):
+        p0 = self.P0[:, 0]
+        for N in [1, 5, 200, 5000]:
+            p_sum = expectations.propagated_sum(p0, self.T, N)
+            self.assertTrue(np.allclose(p_sum, self.propagated_sum_dense(p0, N)))
+
+    def test_propagated_sum_krylov(self):
+        p0 = self.P0[:, 0]
+        N = 5000
+        p_sum = expectations.propagated_sum(p0, self.T, N, tol=1e-12, maxiter=8)
+        self.assertTrue(np.allclose(p_sum, self.propagated_sum_dense(p0, N)))
+        """Each term is a probability vector"""
+        self.assertTrue(np.allclose(np.sum(p_sum), N))
+        """The subspace of all states is invariant, its error bound is met"""
+        p_sum = expectations._propagated_sum_krylov(p0, self.T, N, 1e-12, self.k)
+        self.assertTrue(np.allclose(p_sum, self.propagated_sum_dense(p0, N), rtol=1e-10, atol=0.0))
+
+    def test_propagated_sum_batch(self):
+        N = 1000
+        p_sum = expectations.propagated_sum(self.P0, self.T, N)
+        self.assertEqual(p_sum.shape, self.P0.shape)
+        for i in range(self.P0.shape[1]):
+            self.assertTrue(np.allclose(p_sum[:, i], self.propagated_sum_dense(self.P0[:, i], N)))
+
+    def test_expected_counts_batch(self):
+        N = 1000
+        EC = expectations.expected_counts(self.P0, self.T, N)
+        self.assertEqual(len(EC), self.P0.shape[1])
+        for i in range(self.P0.shape[1]):
+            EC_true = expectations.expected_counts(self.P0[:, i], self.T, N)
+            self.assertTrue(np.allclose(EC[i].toarray(), EC_true.toarray()))
+        EC = expectations.expected_counts(self.P0, self.T, 0)
+        self.assertEqual(len(EC), self.P0.shape[1])
+        self.assertEqual(EC[0].nnz, 0)
+
+
+class TestPropagatedSumLarge(unittest.TestCase):
+    def setUp(self):
+        """Birth-death chain without metastable states, its Krylov subspaces are far from invariant"""
+        n = 1000
+        p = 0.3 * np.ones(n)
+        q = 0.3 * np.ones(n)
+        p[-1] = 0.0
+        q[0] = 0.0
+        self.T = scipy.sparse.diags([q[1:], 1.0 - p - q, p[:-1]], [-1, 0, 1], format='csr')
+        self.p0 = np.zeros(n)
+        self.p0[0] = 1.0
+
+    def propagated_sum_steps(self, T, p0, N):
+        Tt = T.transpose().tocsr()
+        p_k = 1.0 * p0
+        p_sum = 1.0 * p0
+        for k in range(N - 1):
+            p_k = Tt.dot(p_k)
+            p_sum += p_k
+        return p_sum
+
+    def test_propagated_sum_tol(self):
+        for N in [600, 5000]:
+            p_sum_true = self.propagated_sum_steps(self.T, self.p0, N)
+            p_sum = expectations.propagated_sum(self.p0, self.T, N, tol=1e-10)
+            self.assertTrue(np.abs(p_sum - p_sum_true).sum() <= 1e-10 * N)
+            p_sum = expectations._propagated_sum_krylov(self.p0, self.T, N, 1e-10, 500)
+            if p_sum is not None:
+                self.assertTrue(np.abs(p_sum - p_sum_true).sum() <= 1e-10 * N)
+
+    def test_propagated_sum_closed_block(self):
+        """Only a small block of a large matrix is visited, its Krylov subspace is invariant"""
+        n, k = self.T.shape[0], 20
+        C = np.random.random_integers(0, 100, size=(k, k))
+        C = C + C.T
+        T = scipy.sparse.block_diag([scipy.sparse.csr_matrix(1.0 * C / np.sum(C, axis=1)[:, np.newaxis]),
+                                     scipy.sparse.identity(n - k)], format='csr')
+        p0 = np.zeros(n)
+        p0[0:k] = 1.0 / k
+        N = 20000
+        p_sum_true = self.propagated_sum_steps(T, p0, N)
+        p_sum = expectations._propagated_sum_krylov(p0, T, N, 1e-10, 500)
+        self.assertTrue(p_sum is not None)
+        self.assertTrue(np.abs(p_sum - p_sum_true).sum() <= 1e-10 * N)
+        self.assertTrue(np.allclose(expectations.propagated_sum(p0, T, N), p_sum_true))
+
+
 class TestExpectedCountsStationary(unittest.TestCase):
     def setUp(self):
         self.k = 20
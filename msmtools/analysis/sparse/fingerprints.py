@@ -31,8 +31,10 @@ r"""This module contains sparse implementation of the fingerprint module
 
 import numpy as np
 
+from msmtools.util import propagation
+
 from decomposition import rdl_decomposition, timescales_from_eigenvalues
-from decomposition import stationary_distribution_from_backward_iteration as statdist
+from decomposition import stationary_distribution_from_linear_system as statdist
 
 ################################################################################
 # Fingerprints
@@ -50,9 +52,10 @@ def fingerprint_correlation(P, obs1, obs2=None, tau=1, k=None, ncv=None):
     ----------
     P : ndarray, shape=(n, n) or scipy.sparse matrix
         Transition matrix
-    obs1 : ndarray, shape=(n,)
-        Vector representing observable 1 on discrete states
-    obs2 : ndarray, shape=(n,)
+    obs1 : ndarray, shape=(n,) or (n, K)
+        Vector representing observable 1 on discrete states, or K
+        observables in the columns of a matrix
+    obs2 : ndarray, shape=(n,) or (n, K)
         Vector representing observable 2 on discrete states. 
         If none, obs2=obs1, i.e. the autocorrelation is used
     tau : lag time of the the transition matrix. Used for 
@@ -68,8 +71,8 @@ def fingerprint_correlation(P, obs1, obs2=None, tau=1, k=None, ncv=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the correlation experiment
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the correlation experiment, one column per observable
     
     """
     return fingerprint(P, obs1, obs2=obs2, tau=tau, k=k, ncv=ncv)
@@ -88,9 +91,9 @@ def fingerprint_relaxation(P, p0, obs, tau=1, k=None, ncv=None):
         Transition matrix
     p0 : ndarray, shape=(n)
         starting distribution
-    obs : ndarray, shape=(n)
-        Vector representing observable 2 on discrete states. 
-        If none, obs2=obs1, i.e. the autocorrelation is used
+    obs : ndarray, shape=(n) or (n, K)
+        Vector representing observable on discrete states, or K
+        observables in the columns of a matrix
     tau : lag time of the the transition matrix. Used for 
         computing the timescales returned
     k : int (optional)
@@ -103,8 +106,8 @@ def fingerprint_relaxation(P, p0, obs, tau=1, k=None, ncv=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the relaxation experiment
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the relaxation experiment, one column per observable
     
     """
     one_vec = np.ones(P.shape[0])
@@ -121,9 +124,10 @@ def fingerprint(P, obs1, obs2=None, p0=None, tau=1, k=None, ncv=None):
     ----------
     P : (M, M) scipy.sparse matrix
         Transition matrix
-    obs1 : (M,) ndarray
-        Observable, represented as vector on state space
-    obs2 : (M,) ndarray (optional)
+    obs1 : (M,) or (M, K) ndarray
+        Observable, represented as vector on state space, or K observables
+        in the columns of a matrix
+    obs2 : (M,) or (M, K) ndarray (optional)
         Second observable, for cross-correlations
     p0 : (M,) ndarray (optional)
         Initial distribution for a relaxation experiment
@@ -140,8 +144,8 @@ def fingerprint(P, obs1, obs2=None, p0=None, tau=1, k=None, ncv=None):
     -------
     timescales : (N,) ndarray
         Time-scales of the transition matrix
-    amplitudes : (N,) ndarray
-        Amplitudes for the given observable(s)
+    amplitudes : (N,) or (N, K) ndarray
+        Amplitudes for the given observable(s), one column per observable
         
     """
     if obs2 is None:
@@ -156,10 +160,16 @@ def fingerprint(P, obs1, obs2=None, p0=None, tau=1, k=None, ncv=None):
     if p0 is None:
         """Use stationary distribution - we can not use only left
         eigenvectors since the system might be non-reversible"""
-        amplitudes = np.dot(mu * obs1, R) * np.dot(L, obs2)
+        w = mu
     else:
         """Use initial distribution"""
-        amplitudes = np.dot(p0 * obs1, R) * np.dot(L, obs2)
+        w = p0
+    if obs1.ndim == 2 or obs2.ndim == 2:
+        """Observables in the columns of a matrix, all amplitudes by matrix-matrix products"""
+        obs1 = obs1.reshape((obs1.shape[0], -1))
+        obs2 = obs2.reshape((obs2.shape[0], -1))
+        w = w[:, np.newaxis]
+    amplitudes = np.dot(R.T, w * obs1) * np.dot(L, obs2)
     return timescales, amplitudes
 
 
@@ -447,18 +457,15 @@ def propagate(A, x, N):
     ----------
     A : (M, M) scipy.sparse matrix
         Matrix of propagator
-    x : (M, ) ndarray or scipy.sparse matrix
+    x : (M, ) ndarray
         Vector to propagate
     N : int
         Number of steps to propagate
         
     Returns
     -------
-    y : (M, ) ndarray or scipy.sparse matrix
+    y : (M, ) ndarray
         Propagated vector
     
     """
-    y = 1.0 * x
-    for i in range(N):
-        y = A.dot(y)
-    return y
\ No newline at end of file
+    return propagation.propagate(A, x, N)
@@ -131,6 +131,22 @@ class TestFingerprint(unittest.TestCase):
         assert_allclose(tsn, self.ts)
         assert_allclose(ampn, amp)
 
+    def test_fingerprint_many_observables(self):
+        """Columns of an observable matrix give the amplitudes of the individual observables"""
+        obs = np.column_stack((self.obs1, self.obs2, self.p0))
+        tsn, ampn = fingerprint_correlation(self.T, obs, k=self.k)
+        assert ampn.shape == (len(tsn), 3)
+        for j in range(3):
+            assert_allclose(ampn[:, j], fingerprint_correlation(self.T, obs[:, j], k=self.k)[1])
+
+        tsn, ampn = fingerprint_correlation(self.T, obs, obs2=obs[:, ::-1], k=self.k)
+        for j in range(3):
+            assert_allclose(ampn[:, j], fingerprint_correlation(self.T, obs[:, j], obs2=obs[:, 2 - j], k=self.k)[1])
+
+        tsn, ampn = fingerprint_relaxation(self.T, self.p0, obs, k=self.k)
+        for j in range(3):
+            assert_allclose(ampn[:, j], fingerprint_relaxation(self.T, self.p0, obs[:, j], k=self.k)[1])
+
     ################################################################################
 
 
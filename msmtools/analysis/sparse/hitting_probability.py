@@ -0,0 +1,142 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Sparse implementation of hitting probabilities
+
+"""
+
+import numpy as np
+from scipy.sparse import coo_matrix, eye
+from scipy.sparse.csgraph import breadth_first_order
+from scipy.sparse.linalg import splu
+
+from boundary_value_problem import states_mask, restrict, linear_solve
+
+
+def reaching_states(T, target):
+    r"""Indicator of the states from which the target set can be reached.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    target : (M,) ndarray of bool
+        Indicator of the target states
+
+    Returns
+    -------
+    reaching : (M,) ndarray of bool
+        True for all states with a path into the target set
+
+    """
+    T = coo_matrix(T)
+    n = T.shape[0]
+    nz = T.data != 0.0
+    """Reversed graph with an additional node n pointing to all target states"""
+    targets = np.where(target)[0]
+    rows = np.concatenate((T.col[nz], n * np.ones(targets.size, dtype=int)))
+    cols = np.concatenate((T.row[nz], targets))
+    G = coo_matrix((np.ones(rows.size), (rows, cols)), shape=(n + 1, n + 1)).tocsr()
+    order = breadth_first_order(G, n, directed=True, return_predecessors=False)
+    reaching = np.zeros(n + 1, dtype=bool)
+    reaching[order] = True
+    return reaching[:n]
+
+
+def hitting_probability(T, target, solver='direct', tol=1e-10, maxiter=None):
+    r"""Hitting probabilities for all states to one or several target sets.
+
+    The hitting probability of state i to set A is defined as the minimal,
+    non-negative solution of:
+
+    .. math::
+        h_i^A &= 1                    \:\:\:\:  i\in A \\
+        h_i^A &= \sum_j p_{ij} h_j^A  \:\:\:\:  i \notin A
+
+    States from which A can not be reached have zero hitting probability,
+    all other states form the interior of a Dirichlet problem.
+
+    For several disjoint target sets A_1, ..., A_k the probabilities
+    to hit A_j before any other target set are computed. The interior
+    is the same for all sets so that a single factorization is used for
+    all right-hand sides. For a single target set this is the hitting
+    probability.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    target : int, array_like or list of array_like
+        Target set, or list of mutually disjoint target sets
+    solver : str (optional)
+        Linear solver, one of 'direct' (sparse LU decomposition),
+        'gmres', 'bicgstab' or 'amg' (requires pyamg)
+    tol : float (optional)
+        Relative residual tolerance of the iterative solvers
+    maxiter : int (optional)
+        Maximum number of iterations of the iterative solvers
+
+    Returns
+    -------
+    h : (M,) ndarray or (M, k) ndarray
+        Hitting probabilities for a single target set or, for k
+        target sets, one column per target set
+
+    """
+    n = T.shape[0]
+    if not np.isscalar(target) and len(target) == 0:
+        raise ValueError("Target set is empty")
+    multiple = not (np.isscalar(target) or np.ndim(target[0]) == 0)
+    for A in (target if multiple else [target]):
+        if np.size(A) == 0:
+            raise ValueError("Target sets must not be empty")
+        if np.any(np.asarray(A) < 0) or np.any(np.asarray(A) >= n):
+            raise ValueError("Target states must be in the range [0, %d)" % n)
+    if multiple:
+        masks = np.array([states_mask(n, A) for A in target])
+    else:
+        masks = states_mask(n, target)[np.newaxis, :]
+    if np.any(np.sum(masks, axis=0) > 1):
+        raise ValueError("Target sets have to be disjoint")
+    union = np.any(masks, axis=0)
+
+    """States that can not reach any target set have zero probability"""
+    boundary = union | ~reaching_states(T, union)
+    L = T - eye(n, n)
+
+    H = masks.T.astype(float)
+    interior = np.where(~boundary)[0]
+    if interior.size > 0:
+        """Interior system, the boundary values enter the right-hand side"""
+        W = restrict(L, ~boundary)
+        R = -L.dot(H)[interior, :]
+        if solver == 'direct':
+            H[interior, :] = splu(W.tocsc()).solve(R)
+        else:
+            for j in range(H.shape[1]):
+                H[interior, j] = linear_solve(W, R[:, j], solver=solver, tol=tol, maxiter=maxiter)[0]
+
+    if multiple:
+        return H
+    return H[:, 0]
@@ -0,0 +1,98 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Unit test, sparse implementation of hitting probabilities
+
+"""
+import unittest
+
+import numpy as np
+from msmtools.util.numeric import assert_allclose
+from scipy.sparse import csr_matrix
+
+from hitting_probability import hitting_probability
+
+
+class TestHitting(unittest.TestCase):
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_hitting1(self):
+        P = csr_matrix(np.array([[0., 1., 0.],
+                                 [0., 1., 0.],
+                                 [0., 0., 1.]]))
+        sol = np.array([1, 1, 0])
+        assert_allclose(hitting_probability(P, 1), sol)
+        sol = np.array([1, 1, 1])
+        assert_allclose(hitting_probability(P, [1, 2]), sol)
+
+    def test_hitting2(self):
+        P = csr_matrix(np.array([[1.0, 0.0, 0.0, 0.0],
+                                 [0.1, 0.8, 0.1, 0.0],
+                                 [0.0, 0.0, 0.8, 0.2],
+                                 [0.0, 0.0, 0.2, 0.8]]))
+        sol = np.array([0., 0.5, 1., 1.])
+        assert_allclose(hitting_probability(P, [2, 3]), sol)
+        assert_allclose(hitting_probability(P, [2, 3], solver='gmres'), sol)
+
+    def test_hitting3(self):
+        P = csr_matrix(np.array([[0.9, 0.1, 0.0, 0.0, 0.0],
+                                 [0.1, 0.9, 0.0, 0.0, 0.0],
+                                 [0.0, 0.1, 0.4, 0.5, 0.0],
+                                 [0.0, 0.0, 0.0, 0.8, 0.2],
+                                 [0.0, 0.0, 0.0, 0.2, 0.8]]))
+        sol = np.array([0.0, 0.0, 8.33333333e-01, 1.0, 1.0])
+        assert_allclose(hitting_probability(P, 3), sol)
+        assert_allclose(hitting_probability(P, [3, 4]), sol)
+
+    def test_multiple_targets(self):
+        P = csr_matrix(np.array([[1.0, 0.0, 0.0, 0.0, 0.0],
+                                 [0.3, 0.5, 0.2, 0.0, 0.0],
+                                 [0.0, 0.4, 0.2, 0.4, 0.0],
+                                 [0.0, 0.0, 0.3, 0.5, 0.2],
+                                 [0.0, 0.0, 0.0, 0.0, 1.0]]))
+        H = hitting_probability(P, [[0], [4]])
+        self.assertEqual(H.shape, (5, 2))
+        assert_allclose(H.sum(axis=1), np.ones(5))
+        assert_allclose(H[:, 1], hitting_probability(P, 4))
+        assert_allclose(H[:, 0], hitting_probability(P, 0))
+        with self.assertRaises(ValueError):
+            hitting_probability(P, [[0, 1], [1, 4]])
+
+    def test_invalid_target(self):
+        P = csr_matrix(np.array([[0.9, 0.1],
+                                 [0.1, 0.9]]))
+        with self.assertRaises(ValueError):
+            hitting_probability(P, [])
+        with self.assertRaises(ValueError):
+            hitting_probability(P, [[0], []])
+        with self.assertRaises(ValueError):
+            hitting_probability(P, [2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -31,11 +31,13 @@ r"""Sparse implementation of mean first passage time computation
 """
 import numpy as np
 from scipy.sparse import eye
-from scipy.sparse.linalg import spsolve
-from decomposition import stationary_distribution_from_backward_iteration as stationary_distribution
+from decomposition import stationary_distribution_from_linear_system as stationary_distribution
+from decomposition import stationary_distribution_from_rate_matrix
+from boundary_value_problem import states_mask, solve_dirichlet
 
 
-def mfpt(T, target):
+def mfpt(T, target, solver='direct', tol=1e-10, x0=None, maxiter=None, return_conv=False,
+         rate_matrix=False):
     r"""Mean first passage times to a set of target states.
     
     Parameters
@@ -44,11 +46,29 @@ def mfpt(T, target):
         Transition matrix.
     target : int or list of int
         Target states for mfpt calculation.
+    solver : str (optional)
+        Linear solver, one of 'direct' (sparse LU decomposition),
+        'gmres', 'bicgstab' or 'amg' (requires pyamg)
+    tol : float (optional)
+        Relative residual tolerance of the iterative solvers
+    x0 : ndarray, shape=(n,) (optional)
+        Initial guess for the iterative solvers
+    maxiter : int (optional)
+        Maximum number of iterations of the iterative solvers
+    return_conv : bool (optional)
+        If True, the residual history of the solver is also returned
+    rate_matrix : bool (optional)
+        If True, T is a rate matrix K and the mean first passage times
+        solve :math:`\sum_{z} K_{x,z} \mathbb{E}_z[T_Y] = -1` for
+        :math:`x \notin Y`
     
     Returns
     -------
     m_t : ndarray, shape=(n,)
          Vector of mean first passage times to target states.
+    (resnorms) : ndarray
+        Relative residual norms, one for each solver iteration. Only
+        returned if return_conv = True
     
     Notes
     -----
@@ -86,24 +106,17 @@ def mfpt(T, target):
     
     """
     dim = T.shape[0]
-    A = eye(dim, dim) - T
+    if rate_matrix:
+        A = -T
+    else:
+        A = eye(dim, dim) - T
+    target = states_mask(dim, target)
+    """Zero boundary values for the target states"""
+    return solve_dirichlet(A, np.ones(dim), target, np.zeros(dim), solver=solver, tol=tol,
+                           x0=x0, maxiter=maxiter, return_conv=return_conv)
 
-    """Convert to DOK (dictionary of keys) matrix to enable
-    row-slicing and assignement"""
-    A = A.todok()
-    D = A.diagonal()
-    A[target, :] = 0.0
-    D[target] = 1.0
-    A.setdiag(D)
-    """Convert back to CSR-format for fast sparse linear algebra"""
-    A = A.tocsr()
-    b = np.ones(dim)
-    b[target] = 0.0
-    m_t = spsolve(A, b)
-    return m_t
 
-
-def mfpt_between_sets(T, target, origin, mu=None):
+def mfpt_between_sets(T, target, origin, mu=None, **kwargs):
     """Compute mean-first-passage time between subsets of state space.
 
     Parameters
@@ -116,11 +129,16 @@ def mfpt_between_sets(T, target, origin, mu=None):
         Set of starting states.
     mu : (M,) ndarray (optional)
         The stationary distribution of the transition matrix T.
+    **kwargs : optional
+        Solver options passed on to :func:`mfpt`.
        
     Returns
     -------
     tXY : float
         Mean first passage time between set X and Y.
+    (resnorms) : ndarray
+        Relative residual norms, one for each solver iteration. Only
+        returned if return_conv = True
     
     Notes
     -----
@@ -133,15 +151,23 @@ def mfpt_between_sets(T, target, origin, mu=None):
     
     """
     if mu is None:
-        mu = stationary_distribution(T)
+        if kwargs.get('rate_matrix', False):
+            mu = stationary_distribution_from_rate_matrix(T)
+        else:
+            mu = stationary_distribution(T)
 
     """Stationary distribution restriced on starting set X"""
     nuX = mu[origin]
     muX = nuX / np.sum(nuX)
 
     """Mean first-passage time to Y (for all possible starting states)"""
-    tY = mfpt(T, target)
+    if kwargs.get('return_conv', False):
+        tY, resnorms = mfpt(T, target, **kwargs)
+    else:
+        tY = mfpt(T, target, **kwargs)
 
     """Mean first-passage time from X to Y"""
     tXY = np.dot(muX, tY[origin])
+    if kwargs.get('return_conv', False):
+        return tXY, resnorms
     return tXY
\ No newline at end of file
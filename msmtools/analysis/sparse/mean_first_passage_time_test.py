@@ -103,5 +103,15 @@ class TestMfpt(unittest.TestCase):
         assert_allclose(x, self.o12t0)
 
 
+    def test_mfpt_rate_matrix(self):
+        """Rate matrix with the same jump chain as P and twice its jump rate"""
+        K = 2.0 * (self.P - scipy.sparse.eye(3, 3))
+        x = mfpt(K, 0, rate_matrix=True)
+        assert_allclose(x, self.m0 / 2.0)
+
+        x = mfpt_between_sets(K, 0, [1, 2], rate_matrix=True)
+        assert_allclose(x, self.o12t0 / 2.0)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
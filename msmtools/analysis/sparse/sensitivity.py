@@ -0,0 +1,427 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Sparse implementation of the sensitivity analysis.
+
+Sensitivities with respect to the elements of a sparse transition
+matrix are only evaluated for the nonzero elements of T, i.e. for
+perturbations that preserve the sparsity pattern. All sensitivity
+matrices are returned as scipy.sparse.csr_matrix with the sparsity
+pattern of T.
+
+Eigenvalue and eigenvector sensitivities use only the required
+eigenpairs, committor and mean first passage time sensitivities use a
+single factorization for the solution and the adjoint problem. Arrays
+of indices share the decomposition or factorization and give a list of
+sensitivity matrices.
+
+"""
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse.linalg
+
+from scipy.sparse import csr_matrix, diags, eye, bmat
+from scipy.sparse.linalg import splu
+
+from decomposition import stationary_distribution_from_linear_system as stationary_distribution
+from boundary_value_problem import states_mask, replace_rows, restrict
+
+
+def outer_on_pattern(T, u, v):
+    r"""Outer product u v^T evaluated on the sparsity pattern of T.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Matrix defining the sparsity pattern
+    u : (M,) ndarray
+        Left factor
+    v : (M,) ndarray
+        Right factor
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix
+        Matrix with S_ij = u_i v_j for all nonzero T_ij
+
+    """
+    T = csr_matrix(T)
+    rows = np.repeat(np.arange(T.shape[0]), np.diff(T.indptr))
+    data = u[rows] * v[T.indices]
+    return csr_matrix((data, T.indices.copy(), T.indptr.copy()), shape=T.shape)
+
+
+def _unstack(x, sensitivities):
+    """Single sensitivity matrix for scalar indices, list otherwise"""
+    if np.ndim(x) == 0:
+        return sensitivities[0]
+    return sensitivities
+
+
+def _real(x):
+    """Drop a vanishing imaginary part"""
+    return np.real_if_close(x, tol=1000)
+
+
+def _eigenpairs(T, k, ncv=None):
+    r"""Eigenvalues, right and left eigenvectors with indices k.
+
+    Eigenvalues are ordered by decreasing real part, the eigenvectors
+    are normalized such that ||r||=1 and l^T r = 1.
+
+    """
+    n = T.shape[0]
+    kmax = np.max(k)
+    if kmax + 1 < n - 1:
+        v, R = scipy.sparse.linalg.eigs(T, k=kmax + 1, which='LR', ncv=ncv)
+        w, L = scipy.sparse.linalg.eigs(T.transpose(), k=kmax + 1, which='LR', ncv=ncv)
+    else:
+        """ARPACK can not compute (almost) all eigenpairs of small matrices"""
+        v, R = scipy.linalg.eig(T.toarray())
+        w, L = scipy.linalg.eig(T.toarray().T)
+    iv = np.argsort(v)[::-1][k]
+    iw = np.argsort(w)[::-1][k]
+    R = R[:, iv]
+    L = L[:, iw]
+    R = R / np.linalg.norm(R, axis=0)[np.newaxis, :]
+    L = L / np.sum(L * R, axis=0)[np.newaxis, :]
+    return _real(v[iv]), _real(R), _real(L)
+
+
+def _bordered_solve(A, u, b):
+    r"""Solve the bordered system [[A, u], [u^T, 0]] [x, mu] = [b, 0].
+
+    A is singular with left null vector u, the bordered system selects
+    the solution x orthogonal to u. For a matrix b all columns are
+    solved with a single factorization.
+
+    """
+    n = A.shape[0]
+    U = csr_matrix(u.reshape((n, 1)))
+    M = bmat([[A, U], [U.transpose(), None]], format='csc')
+    lu = splu(M)
+    b = np.asarray(b)
+    rhs = np.zeros((n + 1,) + b.shape[1:], dtype=np.result_type(b, M.dtype))
+    rhs[0:n] = b
+    return lu.solve(rhs)[0:n]
+
+
+def eigenvalue_sensitivity(T, k, ncv=None):
+    r"""Sensitivity matrix of the k-th eigenvalue.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    k : int or array like
+        Eigenvalue index (or indices) for eigenvalues ordered descending
+    ncv : int (optional)
+        The number of Lanczos vectors generated, `ncv` must be greater than k;
+        it is recommended that ncv > 2*k
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several indices
+
+    """
+    kk = np.atleast_1d(k)
+    eVal, R, L = _eigenpairs(T, kk, ncv=ncv)
+    return _unstack(k, [outer_on_pattern(T, L[:, i], R[:, i]) for i in range(len(kk))])
+
+
+def timescale_sensitivity(T, k, ncv=None):
+    r"""Sensitivity matrix of the k-th timescale.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    k : int or array like
+        Timescale index (or indices) for timescales of descending order (k = 0 for the infinite one)
+    ncv : int (optional)
+        The number of Lanczos vectors generated, `ncv` must be greater than k;
+        it is recommended that ncv > 2*k
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several indices
+
+    """
+    kk = np.atleast_1d(k)
+    eVal, R, L = _eigenpairs(T, kk, ncv=ncv)
+    factor = np.zeros(len(kk), dtype=eVal.dtype)
+    finite = eVal < 1.0
+    factor[finite] = 1.0 / (np.log(eVal[finite]) ** 2) / eVal[finite]
+    return _unstack(k, [outer_on_pattern(T, factor[i] * L[:, i], R[:, i]) for i in range(len(kk))])
+
+
+def eigenvector_sensitivity(T, k, j, right=True, ncv=None):
+    r"""Sensitivity matrix for entry j of the left or right eigenvector k.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    k : int or array like
+        Eigenvector index ordered with descending eigenvalues
+    j : int or array like
+        Entry of eigenvector k for which the sensitivity is computed.
+        Arrays of k and j are broadcast against each other.
+    right : boolean (default: True)
+        If True the right eigenvectors are considered, otherwise the left ones
+    ncv : int (optional)
+        The number of Lanczos vectors generated, `ncv` must be greater than k;
+        it is recommended that ncv > 2*k
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several pairs (k, j)
+
+    Notes
+    -----
+    The same normalization norm(vector) = 1 as in the dense
+    implementation is used. The least-squares problem of the dense
+    implementation is replaced by a sparse bordered system, whose
+    solution phi is orthogonal to the left eigenvector.
+
+    """
+    T = csr_matrix(T)
+    n = T.shape[0]
+    if not right:
+        T = T.transpose().tocsr()
+    kk, jj = np.broadcast_arrays(np.atleast_1d(k), np.atleast_1d(j))
+    kval = np.unique(kk)
+    eVal, R, L = _eigenpairs(T, kval, ncv=ncv)
+
+    sensitivities = [None] * len(kk)
+    for i in range(len(kval)):
+        ind = np.where(kk == kval[i])[0]
+        rEV = R[:, i]
+        lEV = L[:, i]
+
+        """Minimum norm solutions of [T - eVal I, rEV]^T phi = e_j"""
+        b = -np.outer(rEV, rEV[jj[ind]]) / np.dot(rEV, rEV)
+        b[jj[ind], np.arange(len(ind))] += 1.0
+        phi = _bordered_solve((T - eVal[i] * eye(n, n)).transpose(), lEV / np.linalg.norm(lEV), b)
+
+        for m in range(len(ind)):
+            S = outer_on_pattern(T, np.dot(phi[:, m], rEV) * lEV - phi[:, m], rEV)
+            if not right:
+                S = S.transpose().tocsr()
+            sensitivities[ind[m]] = S
+    return _unstack(np.broadcast_arrays(k, j)[0], sensitivities)
+
+
+def _stationary_adjoint(T, mu, a):
+    r"""Minimum norm solution of [T^T - I, 1]^T phi = a"""
+    n = T.shape[0]
+    one = np.ones(n)
+    b = a - np.outer(one, np.dot(mu, a)).reshape(a.shape)
+    return _bordered_solve(T - eye(n, n), one / np.sqrt(n), b)
+
+
+def stationary_distribution_sensitivity(T, j):
+    r"""Sensitivity matrix for entry j of the stationary distribution.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    j : int or array like
+        Entry (or entries) of the stationary distribution for which the sensitivity is computed
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several entries
+
+    """
+    T = csr_matrix(T)
+    n = T.shape[0]
+    mu = stationary_distribution(T)
+    jj = np.atleast_1d(j)
+    a = np.zeros((n, len(jj)))
+    a[jj, np.arange(len(jj))] = 1.0
+    phi = _stationary_adjoint(T, mu, a)
+    return _unstack(j, [outer_on_pattern(T, mu, np.dot(phi[:, m], mu) - phi[:, m])
+                        for m in range(len(jj))])
+
+
+def expectation_sensitivity(T, a):
+    r"""Sensitivity of expectation value of observable A=(a_i).
+
+    The sensitivity is linear in the observable, a single adjoint
+    solve is required.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    a : (M,) ndarray
+        Observable, a[i] is the value of the observable at state i.
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix
+        Sensitivity matrix of the expectation value.
+
+    """
+    T = csr_matrix(T)
+    mu = stationary_distribution(T)
+    phi = _stationary_adjoint(T, mu, np.asarray(a, dtype=float))
+    return outer_on_pattern(T, mu, np.dot(phi, mu) - phi)
+
+
+def mfpt_sensitivity(T, target, j):
+    r"""Sensitivity matrix for entry j of the mean first passage time.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    target : int or list of int
+        Target states to which the MFPT is computed
+    j : int or array like
+        Entry (or entries) of the mfpt vector for which the sensitivity is computed
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several entries
+
+    """
+    T = csr_matrix(T)
+    n = T.shape[0]
+    target = states_mask(n, target)
+    matA = replace_rows(T - eye(n, n), target)
+    lu = splu(matA.tocsc())
+
+    tVec = np.where(target, 0.0, -1.0)
+    mfpt = lu.solve(tVec)
+    jj = np.atleast_1d(j)
+    aVec = np.zeros((n, len(jj)))
+    aVec[jj, np.arange(len(jj))] = 1.0
+    """Adjoint problems with the same factorization"""
+    phiVec = lu.solve(aVec, trans='T')
+    phiVec[target, :] = 0.0
+    return _unstack(j, [outer_on_pattern(T, -phiVec[:, m], mfpt) for m in range(len(jj))])
+
+
+def _forward_committor_adjoint(T, A, B, index):
+    r"""Forward committor q and adjoint solutions w such that the
+    committor sensitivity for entry index[m] is -w[:, m] q^T"""
+    T = csr_matrix(T)
+    n = T.shape[0]
+    A = states_mask(n, A)
+    B = states_mask(n, B)
+    notAB = ~(A | B)
+    K = T - eye(n, n)
+    lu = splu(restrict(K, notAB).tocsc())
+
+    q = np.where(B, 1.0, 0.0)
+    q[notAB] = lu.solve(-K.dot(q)[notAB])
+    E = np.zeros((n, len(index)))
+    E[index, np.arange(len(index))] = 1.0
+    w = np.zeros((n, len(index)))
+    w[notAB] = lu.solve(np.ascontiguousarray(E[notAB]), trans='T')
+    return q, w
+
+
+def forward_committor_sensitivity(T, A, B, index):
+    r"""Sensitivity matrix for entry index of the forward committor from A to B.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    A : array like
+        List of integer state labels for set A
+    B : array like
+        List of integer state labels for set B
+    index : int or array like
+        Entry (or entries) of the committor for which the sensitivity is computed
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several entries
+
+    """
+    ind = np.atleast_1d(index)
+    q, w = _forward_committor_adjoint(T, A, B, ind)
+    return _unstack(index, [outer_on_pattern(T, -w[:, m], q) for m in range(len(ind))])
+
+
+def backward_committor_sensitivity(T, A, B, index):
+    r"""Sensitivity matrix for entry index of the backward committor from A to B.
+
+    Parameters
+    ----------
+    T : (M, M) scipy.sparse matrix
+        Transition matrix
+    A : array like
+        List of integer state labels for set A
+    B : array like
+        List of integer state labels for set B
+    index : int or array like
+        Entry (or entries) of the committor for which the sensitivity is computed
+
+    Returns
+    -------
+    S : (M, M) scipy.sparse.csr_matrix or list of scipy.sparse.csr_matrix
+        Sensitivity matrix on the sparsity pattern of T, a list for
+        several entries
+
+    Notes
+    -----
+    The sensitivity is assembled from the forward committor sensitivity
+    Q = -w q^T of the time-reversed chain and the sensitivity of the
+    stationary distribution, without forming Q explicitly.
+
+    """
+    T = csr_matrix(T)
+    ind = np.atleast_1d(index)
+    eq = stationary_distribution(T)
+    backT = diags(1.0 / eq, 0).dot(T.transpose()).dot(diags(eq, 0))
+    q, w = _forward_committor_adjoint(backT, A, B, ind)
+
+    """Diagonals of T^T D Q^T and Q^T D^-1 T^T for Q = -w q^T"""
+    d1 = -w / (eq ** 2)[:, np.newaxis] * T.transpose().dot(eq * q)[:, np.newaxis]
+    d2 = -q[:, np.newaxis] * T.dot(w / eq[:, np.newaxis])
+
+    """Contribution through the stationary distribution"""
+    phi = _stationary_adjoint(T, eq, d1 - d2)
+    v = phi - np.dot(eq, phi)[np.newaxis, :]
+    return _unstack(index, [outer_on_pattern(T, eq, v[:, m]) + outer_on_pattern(T, -eq * q, w[:, m] / eq)
+                            for m in range(len(ind))])
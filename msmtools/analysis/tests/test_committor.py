@@ -91,5 +91,12 @@ class TestCommittorSparse(unittest.TestCase):
         u = self.bdc.committor_backward(9, 90)
         assert_allclose(un, u)
 
+    def test_backward_comittor_iterative(self):
+        P = self.bdc.transition_matrix_sparse()
+        u = self.bdc.committor_backward(9, 90)
+        un, resnorms = committor(P, range(10), range(90, 100), forward=False, solver='gmres',
+                                 tol=1e-12, maxiter=10000, x0=u, return_conv=True)
+        assert_allclose(un, u)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -95,6 +95,18 @@ class TestExpectedCountsDense(unittest.TestCase):
         EC_true = np.zeros(T.shape)
         assert_allclose(EC_true, EC_n)
 
+    def test_expected_counts_many(self):
+        """One count matrix per starting vector in the columns of p0, for dense and sparse T"""
+        P0 = np.random.random((self.dim, 3))
+        P0 /= np.sum(P0, axis=0)[np.newaxis, :]
+        N = 200
+        for T in (self.T, scipy.sparse.csr_matrix(self.T)):
+            EC_n = expected_counts(T, P0, N)
+            self.assertEqual(len(EC_n), 3)
+            for i in range(3):
+                EC_true = expected_counts(self.T, P0[:, i], N)
+                assert_allclose(EC_n[i].toarray() if scipy.sparse.issparse(EC_n[i]) else EC_n[i], EC_true)
+
 
 class TestExpectedCountsStationaryDense(unittest.TestCase):
     def setUp(self):
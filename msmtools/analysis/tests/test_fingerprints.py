@@ -157,6 +157,20 @@ class TestFingerprintDense(unittest.TestCase):
         assert_allclose(tsn, self.ts[0:k])
         assert_allclose(relax_ampn, relax_amp)
 
+    def test_fingerprint_many_observables(self):
+        obs = np.column_stack((self.obs1, self.obs2))
+        tsn, corr_ampn = fingerprint_correlation(self.T, obs, obs2=obs[:, ::-1])
+        corr_amp = np.dot(self.mu * self.obs1, self.R) * np.dot(self.L, self.obs2)
+        assert_allclose(tsn, self.ts)
+        assert_allclose(corr_ampn[:, 0], corr_amp)
+
+        tsn, relax_ampn = fingerprint_relaxation(self.T, self.p0, obs)
+        relax_amp = np.dot(self.p0, self.R) * np.dot(self.L, self.obs2)
+        assert_allclose(relax_ampn[:, 1], relax_amp)
+
+        with self.assertRaises(AssertionError):
+            fingerprint_correlation(self.T, obs[1:, :])
+
 
 class TestExpectation(unittest.TestCase):
     def setUp(self):
@@ -437,6 +451,16 @@ class TestCorrelationSparse(unittest.TestCase):
         corrn = correlation(self.T, self.obs1, obs2=self.obs2, k=self.k, times=self.times)
         assert_allclose(corrn, corr)
 
+    def test_correlation_propagation(self):
+        """k=None, all times by propagation"""
+        P = self.T.toarray()
+        acorr = [np.dot(self.mu * self.obs1, np.dot(np.linalg.matrix_power(P, t), self.obs1)) for t in self.times]
+        acorrn = correlation(self.T, self.obs1, times=self.times)
+        assert_allclose(acorrn, acorr)
+        corr = [np.dot(self.mu * self.obs1, np.dot(np.linalg.matrix_power(P, t), self.obs2)) for t in self.times]
+        corrn = correlation(self.T, self.obs1, obs2=self.obs2, times=self.times)
+        assert_allclose(corrn, corr)
+
 
 class TestRelaxationSparse(unittest.TestCase):
     def setUp(self):
@@ -481,6 +505,13 @@ class TestRelaxationSparse(unittest.TestCase):
         relaxn = relaxation(self.T, self.p0, self.obs, k=self.k, times=self.times)
         assert_allclose(relaxn, relax)
 
+    def test_relaxation_propagation(self):
+        """k=None, all times by propagation"""
+        P = self.T.toarray()
+        relax = [np.dot(np.dot(self.p0, np.linalg.matrix_power(P, t)), self.obs) for t in self.times]
+        relaxn = relaxation(self.T, self.p0, self.obs, times=self.times)
+        assert_allclose(relaxn, relax)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
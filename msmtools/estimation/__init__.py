@@ -64,6 +64,15 @@ Estimation
    tmatrix_cov
    error_perturbation
 
+Implied time scales
+===================
+
+.. autosummary::
+   :toctree: generated/
+
+   implied_timescales - Implied time scales for a series of lag times
+   its
+
 
 Sampling
 ========
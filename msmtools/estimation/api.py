@@ -49,6 +49,7 @@ import sparse.transition_matrix
 import sparse.prior
 import sparse.mle_trev_given_pi
 import sparse.mle_trev
+import sparse.covariance
 
 import dense.bootstrapping
 import dense.transition_matrix
@@ -75,6 +76,7 @@ __all__ = ['bootstrap_trajectories',
            'count_states',
            'connected_sets',
            'error_perturbation',
+           'implied_timescales',
            'is_connected',
            'largest_connected_set',
            'largest_connected_submatrix',
@@ -902,6 +904,130 @@ def transition_matrix(C, reversible=False, mu=None, method='auto', **kwargs):
         return T
 
 
+################################################################################
+# Implied time scales
+################################################################################
+
+@shortcut('its')
+def implied_timescales(dtrajs, lags, k=5, reversible=False, n_jobs=1):
+    r"""Implied time scales of transition matrices estimated at several lag times.
+
+    For every lag time the count matrix is estimated, restricted to its
+    largest connected set, and the transition matrix on that set is
+    estimated. The implied time scales are computed from its eigenvalues.
+
+    Parameters
+    ----------
+    dtrajs : array_like or list of array_like
+        Discretized trajectory or list of discretized trajectories
+    lags : array_like of int
+        Lag times in trajectory steps
+    k : int (optional)
+        Number of implied time scales to compute for each lag time
+    reversible : bool (optional)
+        If True, estimate reversible transition matrices
+    n_jobs : int (optional)
+        Number of worker processes. If None, use one per CPU.
+
+    Returns
+    -------
+    ts : (len(lags), k) ndarray
+        Implied time scales in trajectory steps, ts[i] for lag time
+        lags[i]. Entries are nan if the largest connected set at that lag
+        time has less than k+1 states.
+
+    Notes
+    -----
+    The number of states is determined once for all lag times, so that
+    all count matrices share the same state indices. The lag times are
+    processed in increasing order, split into n_jobs contiguous chunks.
+    Within a chunk, the eigensolver for one lag time is started from the
+    dominant eigenvectors found at the previous lag time.
+
+    Examples
+    --------
+
+    >>> from msmtools.estimation import implied_timescales
+
+    >>> dtraj = np.array([0, 0, 1, 0, 1, 1, 0, 0, 0, 1, 1, 1, 0, 1, 0, 0])
+    >>> ts = implied_timescales(dtraj, [1, 2, 3], k=1)
+
+    """
+    dtrajs = _ensure_dtraj_list(dtrajs)
+    nstates = _number_of_states(dtrajs)
+    lags = np.asarray(lags, dtype=int)
+    if lags.ndim != 1:
+        raise ValueError("lags must be a one-dimensional array of lag times")
+    if np.any(lags < 1):
+        raise ValueError("lag times must be positive")
+    maxlength = max(np.size(dtraj) for dtraj in dtrajs)
+    if np.any(lags >= maxlength):
+        raise ValueError('Lag time %d is longer or equal than all trajectories. Reduce lag time.' % lags.max())
+    if n_jobs is None:
+        import multiprocessing
+        n_jobs = multiprocessing.cpu_count()
+
+    ts = np.empty((lags.shape[0], k))
+    ts.fill(np.nan)
+    order = np.argsort(lags, kind='mergesort')
+    chunks = [c for c in np.array_split(order, min(n_jobs, order.shape[0])) if c.shape[0] > 0]
+    args = [(dtrajs, lags[c], nstates, k, reversible) for c in chunks]
+    if len(chunks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(len(chunks))
+        try:
+            results = pool.map(_implied_timescales_chunk, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_implied_timescales_chunk(a) for a in args]
+    for c, ts_chunk in zip(chunks, results):
+        ts[c] = ts_chunk
+    return ts
+
+
+def _implied_timescales_chunk(args):
+    r"""Implied time scales for increasing lag times, warm-starting each eigensolve from the previous one"""
+    dtrajs, lags, nstates, k, reversible = args
+    ts = np.empty((lags.shape[0], k))
+    ts.fill(np.nan)
+    # dominant right eigenvectors of the previous lag time on the full state space
+    v_prev = None
+    for i, lag in enumerate(lags):
+        C = count_matrix(dtrajs, lag, nstates=nstates)
+        lcc = largest_connected_set(C)
+        C_cc = largest_connected_submatrix(C, lcc=lcc)
+        T = transition_matrix(C_cc, reversible=reversible)
+        v0 = None
+        if v_prev is not None:
+            v0 = v_prev[lcc]
+            if not np.any(v0):
+                v0 = None
+        ev, R = _dominant_eigenvalues(T, min(k + 1, lcc.shape[0]), v0=v0)
+        ev = np.abs(ev[1:])
+        # eigenvalues of magnitude one imply infinite time scales
+        ind_abs_one = np.isclose(ev, 1.0, rtol=0.0, atol=1e-14)
+        ev[ind_abs_one] = 0.5
+        ts[i, 0:ev.shape[0]] = np.where(ind_abs_one, np.inf, -1.0 * lag / np.log(ev))
+        if R is not None:
+            v_prev = np.zeros((nstates, R.shape[1]), dtype=R.dtype)
+            v_prev[lcc] = R
+    return ts
+
+
+def _dominant_eigenvalues(T, nev, v0=None):
+    r"""Eigenvalues of largest magnitude in decreasing order, and eigenvectors to warm-start the next solve"""
+    n = T.shape[0]
+    if nev < n - 1:
+        from msmtools.analysis.sparse.decomposition import eigensolver
+        return eigensolver(csr_matrix(T), nev, v0=v0)
+    else:
+        T = T.toarray() if issparse(T) else T
+        ev = np.linalg.eigvals(T)
+        return ev[np.argsort(np.abs(ev))[::-1][0:nev]], None
+
+
 # DONE: FN+Jan+Ben Implement in Python directly
 def log_likelihood(C, T):
     r"""Log-likelihood of the count matrix given a transition matrix.
@@ -1020,11 +1146,13 @@ def error_perturbation(C, S):
 
     Parameters
     ----------
-    C : (M, M) ndarray
+    C : (M, M) ndarray or scipy.sparse matrix
         Count matrix
     S : (M, M) ndarray or (K, M, M) ndarray
         Sensitivity matrix (for scalar observable) or sensitivity
-        tensor for vector observable
+        tensor for vector observable. Sparse sensitivities can be
+        given as scipy.sparse matrix or as list of K scipy.sparse
+        matrices.
         
     Returns
     -------
@@ -1034,6 +1162,12 @@ def error_perturbation(C, S):
 
     Notes
     -----
+    The covariance tensor of the transition matrix posterior is not
+    formed. The block diagonal row covariances are applied
+    analytically, the memory requirement is that of the sensitivities.
+    For sparse count matrices or sparse sensitivities only the nonzero
+    elements of the sensitivities are visited.
+
 
     **Scalar observable**
 
@@ -1062,9 +1196,8 @@ def error_perturbation(C, S):
     
     """
 
-    if issparse(C):
-        warnings.warn("Error-perturbation will be dense for sparse input")
-        C = C.toarray()
+    if issparse(C) or issparse(S) or isinstance(S, (list, tuple)):
+        return sparse.covariance.error_perturbation(C, S)
     return dense.covariance.error_perturbation(C, S)
 
 
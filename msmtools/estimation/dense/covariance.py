@@ -107,6 +107,46 @@ def dirichlet_covariance(alpha):
     return cov
 
 
+def _error_perturbation(C, S, R):
+    r"""Covariance of observables with sensitivities S and R.
+
+    The covariance of the non-reversible transition matrix ensemble is
+    block diagonal with one Dirichlet covariance
+
+    .. math:: \Sigma_i = \frac{\alpha_{i0} \text{diag}(\alpha_i) - \alpha_i \alpha_i^T}{\alpha_{i0}^2 (\alpha_{i0}+1)}
+
+    per row. The sum over rows of S_i^T \Sigma_i R_i is accumulated
+    row by row so that the (M, M, M) covariance tensor is never
+    formed.
+
+    Parameters
+    ----------
+    C : (M, M) ndarray
+        Count matrix
+    S : (K, M, M) ndarray
+        Sensitivity tensor
+    R : (L, M, M) ndarray
+        Sensitivity tensor
+
+    Returns
+    -------
+    X : (K, L) ndarray
+        Covariance matrix of the observables
+
+    """
+    alpha = C + 1.0
+    alpha0 = alpha.sum(axis=1)
+    norm = alpha0 ** 2 * (alpha0 + 1.0)
+
+    X = np.zeros((S.shape[0], R.shape[0]))
+    for i in range(C.shape[0]):
+        Si = S[:, i, :]
+        Ri = R[:, i, :]
+        X += (alpha0[i] * np.dot(Si * alpha[i, :], Ri.T) -
+              np.outer(np.dot(Si, alpha[i, :]), np.dot(Ri, alpha[i, :]))) / norm[i]
+    return X
+
+
 def error_perturbation_single(C, S, R=None):
     r"""Error-perturbation arising from a given sensitivity
 
@@ -125,11 +165,9 @@ def error_perturbation_single(C, S, R=None):
          Variance (covariance) of observable(s)
 
     """
-    cov = tmatrix_cov(C)  # (M, M, M)
     if R is None:
         R = S
-    X = S[:, :, np.newaxis] * cov * R[:, np.newaxis, :]
-    return X.sum()
+    return _error_perturbation(C, S[np.newaxis, :, :], R[np.newaxis, :, :])[0, 0]
 
 
 def error_perturbation_var(C, S):
@@ -142,12 +180,20 @@ def error_perturbation_var(C, S):
     S : (K, M, M) ndarray
         Sensitivity tensor
 
+    Returns
+    -------
+    X : (K,) ndarray
+        Variances of the observables
+
     """
-    K = S.shape[0]
-    cov = tmatrix_cov(C)
-    for i in range(K):
-        R = S[i, :, :]
-        X[i] = (R[:, :, np.newaxis] * cov * R[:, np.newaxis, :]).sum()
+    alpha = C + 1.0
+    alpha0 = alpha.sum(axis=1)
+    norm = alpha0 ** 2 * (alpha0 + 1.0)
+
+    """Diagonal and rank one part of the row covariances"""
+    X = np.einsum('kij,kij,ij->k', S, S, alpha * (alpha0 / norm)[:, np.newaxis])
+    X -= np.dot(np.einsum('kij,ij->ki', S, alpha) ** 2, 1.0 / norm)
+    return X
 
 
 def error_perturbation_cov(C, S):
@@ -166,15 +212,7 @@ def error_perturbation_cov(C, S):
         Covariance matrix for given sensitivity
 
     """
-    K = S.shape[0]
-    X = np.zeros((K, K))
-    cov = tmatrix_cov(C)
-    for i in range(K):
-        for j in range(K):
-            Q = S[i, :, :]
-            R = S[j, :, :]
-            X[i, j] = (Q[:, :, np.newaxis] * cov * R[:, np.newaxis, :]).sum()
-    return X
+    return _error_perturbation(C, S, S)
 
 
 def error_perturbation(C, S):
@@ -33,7 +33,7 @@ import unittest
 import numpy as np
 from msmtools.util.numeric import assert_allclose
 
-from covariance import tmatrix_cov, dirichlet_covariance, error_perturbation
+from covariance import tmatrix_cov, dirichlet_covariance, error_perturbation, error_perturbation_var
 
 
 class TestCovariance(unittest.TestCase):
@@ -127,6 +127,20 @@ class TestErrorPerturbation(unittest.TestCase):
         Xn = error_perturbation(self.C, self.S2)
         assert_allclose(Xn, self.X)
 
+    def test_error_perturbation_var(self):
+        Xn = error_perturbation_var(self.C, self.S2)
+        assert_allclose(Xn, np.diag(self.X))
+
+    def test_error_perturbation_random(self):
+        """Compare with the full covariance tensor"""
+        np.random.seed(42)
+        C = np.random.randint(0, 10, size=(10, 10)).astype(float)
+        S = np.random.randn(4, 10, 10)
+        cov = tmatrix_cov(C)
+        X = np.einsum('kij,ijl,mil->km', S, cov, S)
+        assert_allclose(error_perturbation(C, S), X)
+        assert_allclose(error_perturbation(C, S[2]), X[2, 2])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""This module implements the error perturbation for sparse count matrices
+
+The covariance of the non-reversible transition matrix ensemble is
+block diagonal with one Dirichlet covariance per row. The error
+perturbation only requires the Dirichlet parameters at the nonzero
+elements of the sensitivities, neither the count matrix nor the
+covariance is densified.
+
+"""
+
+import numpy as np
+
+from scipy.sparse import csr_matrix, coo_matrix, diags, issparse, vstack
+
+
+def _sensitivity_rows(S, n):
+    r"""Flattened sensitivities as rows of a (K, M*M) csr matrix."""
+    if issparse(S) or (isinstance(S, np.ndarray) and S.ndim == 2):
+        S = [S]
+    rows = [coo_matrix(Sk).reshape((1, n * n)) for Sk in S]
+    return vstack(rows, format='csr')
+
+
+def error_perturbation(C, S):
+    r"""Error perturbation for given sensitivity matrix.
+
+    Parameters
+    ----------
+    C : (M, M) scipy.sparse matrix
+        Count matrix
+    S : (M, M) ndarray or scipy.sparse matrix, (K, M, M) ndarray or list of K scipy.sparse matrices
+        Sensitivity matrix (for scalar observable) or sensitivities
+        for vector observable
+
+    Returns
+    -------
+    X : float or (K, K) ndarray
+        error-perturbation (for scalar observables) or covariance matrix
+        (for vector-valued observable)
+
+    """
+    C = csr_matrix(C)
+    n = C.shape[0]
+    scalar = issparse(S) or (isinstance(S, np.ndarray) and S.ndim == 2)
+    Y = _sensitivity_rows(S, n)
+
+    """Restrict to elements with nonzero sensitivity"""
+    cols = np.unique(Y.indices)
+    Y = Y[:, cols]
+    rows = cols // n
+    alpha = np.asarray(C[rows, cols % n]).ravel() + 1.0
+    alpha0 = np.asarray(C.sum(axis=1)).ravel() + n
+    norm = alpha0 ** 2 * (alpha0 + 1.0)
+
+    """Diagonal part of the row covariances"""
+    W = Y.dot(diags(alpha * alpha0[rows] / norm[rows], 0))
+    X = W.dot(Y.transpose()).toarray()
+
+    """Rank one part of the row covariances"""
+    A = csr_matrix((alpha, (np.arange(len(cols)), rows)), shape=(len(cols), n))
+    s = Y.dot(A).toarray()
+    X -= np.dot(s / norm[np.newaxis, :], s.T)
+
+    if scalar:
+        return X[0, 0]
+    return X
@@ -0,0 +1,71 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Unit tests for the sparse covariance module
+
+"""
+
+import unittest
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from msmtools.util.numeric import assert_allclose
+
+from covariance import error_perturbation
+import msmtools.estimation.dense.covariance as dense_covariance
+
+
+class TestErrorPerturbation(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(42)
+        n = 12
+        C = np.random.randint(0, 10, size=(n, n)) * (np.random.rand(n, n) < 0.3)
+        self.C = C.astype(float)
+        self.S = np.random.randn(3, n, n) * (np.random.rand(3, n, n) < 0.2)
+
+        """Reference from the full covariance tensor"""
+        cov = dense_covariance.tmatrix_cov(self.C)
+        self.X = np.einsum('kij,ijl,mil->km', self.S, cov, self.S)
+
+    def tearDown(self):
+        pass
+
+    def test_error_perturbation_dense_sensitivity(self):
+        Xn = error_perturbation(csr_matrix(self.C), self.S)
+        assert_allclose(Xn, self.X)
+
+        xn = error_perturbation(csr_matrix(self.C), self.S[1])
+        assert_allclose(xn, self.X[1, 1])
+
+    def test_error_perturbation_sparse_sensitivity(self):
+        Xn = error_perturbation(csr_matrix(self.C), [csr_matrix(Sk) for Sk in self.S])
+        assert_allclose(Xn, self.X)
+
+        xn = error_perturbation(csr_matrix(self.C), csr_matrix(self.S[2]))
+        assert_allclose(xn, self.X[2, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Unit tests for the implied time scales API function
+
+"""
+
+import unittest
+
+import numpy as np
+from msmtools.util.numeric import assert_allclose
+
+from msmtools.generation import generate_traj
+from msmtools.estimation import count_matrix, largest_connected_submatrix, transition_matrix
+from msmtools.estimation import implied_timescales
+from msmtools.analysis import timescales
+
+
+class TestImpliedTimescales(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(42)
+        P = np.array([[0.90, 0.05, 0.05, 0.00, 0.00],
+                      [0.10, 0.80, 0.05, 0.05, 0.00],
+                      [0.05, 0.05, 0.80, 0.05, 0.05],
+                      [0.00, 0.05, 0.05, 0.80, 0.10],
+                      [0.00, 0.00, 0.05, 0.05, 0.90]])
+        self.dtrajs = [generate_traj(P, 5000, start=0), generate_traj(P, 5000, start=4)]
+        self.lags = np.array([5, 1, 2, 10, 3])
+
+    def its_reference(self, k, reversible):
+        ts = np.empty((len(self.lags), k))
+        for i, lag in enumerate(self.lags):
+            C = largest_connected_submatrix(count_matrix(self.dtrajs, lag))
+            T = transition_matrix(C, reversible=reversible).toarray()
+            ts[i] = timescales(T, tau=lag)[1:k + 1]
+        return ts
+
+    def test_implied_timescales(self):
+        ts = implied_timescales(self.dtrajs, self.lags, k=2)
+        self.assertEqual(ts.shape, (len(self.lags), 2))
+        assert_allclose(ts, self.its_reference(2, False))
+
+    def test_implied_timescales_reversible(self):
+        ts = implied_timescales(self.dtrajs, self.lags, k=2, reversible=True)
+        assert_allclose(ts, self.its_reference(2, True), rtol=1e-4)
+
+    def test_implied_timescales_all(self):
+        """Dense eigensolver, nan beyond the number of states"""
+        ts = implied_timescales(self.dtrajs, self.lags, k=5)
+        assert_allclose(ts[:, 0:4], self.its_reference(4, False))
+        self.assertTrue(np.all(np.isnan(ts[:, 4])))
+
+    def test_implied_timescales_n_jobs(self):
+        ts = implied_timescales(self.dtrajs, self.lags, k=2, n_jobs=2)
+        assert_allclose(ts, implied_timescales(self.dtrajs, self.lags, k=2, n_jobs=1))
+
+    def test_lag_too_long(self):
+        with self.assertRaises(ValueError):
+            implied_timescales(self.dtrajs, [1, 5000], k=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
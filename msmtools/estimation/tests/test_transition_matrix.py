@@ -159,6 +159,11 @@ class TestErrorPerturbation(unittest.TestCase):
             Xn = error_perturbation(Csparse, self.S2)
             assert_allclose(Xn, self.X)
 
+    def test_error_perturbation_sparse_sensitivity(self):
+        S2 = [scipy.sparse.csr_matrix(Sk) for Sk in self.S2]
+        Xn = error_perturbation(self.C, S2)
+        assert_allclose(Xn, self.X)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
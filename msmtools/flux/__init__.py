@@ -41,6 +41,7 @@ TPT-object
    :toctree: generated/
 
    tpt
+   tpt_many
    ReactiveFlux
 
 Reactive flux
@@ -74,6 +75,7 @@ Pathway decomposition
    :toctree: generated/
 
    pathways
+   iter_pathways
 
 """
 from .api import *
@@ -35,6 +35,7 @@ __docformat__ = "restructuredtext en"
 from scipy.sparse.base import issparse
 from scipy.sparse.sputils import isdense
 from scipy.sparse import csr_matrix
+import numpy as np
 
 import dense
 import sparse
@@ -48,6 +49,7 @@ __maintainer__ = "Martin Scherer"
 __email__ = "m.scherer AT fu-berlin DOT de"
 
 __all__ = ['tpt',
+           'tpt_many',
            'flux_matrix',
            'to_netflux',
            'flux_production',
@@ -57,7 +59,8 @@ __all__ = ['tpt',
            'total_flux',
            'rate',
            'mfpt',
-           'pathways']
+           'pathways',
+           'iter_pathways']
 
 _type_not_supported = \
     TypeError("T is not a numpy.ndarray or a scipy.sparse matrix.")
@@ -105,6 +108,11 @@ def tpt(T, A, B, mu=None, qminus=None, qplus=None, rate_matrix=False):
     discrete version outlined in [2]. Here, we use the transition
     matrix formulation described in [3].
 
+    For a rate matrix K (rate_matrix=True) the generator boundary-value
+    problems are solved with K directly in sparse form, without
+    computing a transition matrix. Fluxes and the rate are then given
+    in the inverse time unit of K.
+
     See also
     --------
     msmtools.analysis.committor, ReactiveFlux
@@ -127,18 +135,25 @@ def tpt(T, A, B, mu=None, qminus=None, qplus=None, rate_matrix=False):
     if len(A) == 0 or len(B) == 0:
         raise ValueError('set A or B is empty')
     n = T.shape[0]
-    if len(A) > n or len(B) > n or max(A) > n or max(B) > n:
+    if issparse(T):
+        T = T.tocsr()
+    if len(A) > n or len(B) > n or max(A) >= n or max(B) >= n:
         raise ValueError('set A or B defines more states, than given transition matrix.')
     if (rate_matrix is False) and (not msmana.is_transition_matrix(T)):
         raise ValueError('given matrix T is not a transition matrix')
     if (rate_matrix is True):
-        raise NotImplementedError(
-            'TPT with rate matrix is not yet implemented - But it is very simple, so feel free to do it.')
+        if not msmana.is_rate_matrix(T):
+            raise ValueError('given matrix T is not a rate matrix')
+        return _tpt_rate_matrix(T, A, B, mu=mu, qminus=qminus, qplus=qplus)
 
     # we can compute the following properties from either dense or sparse T
     # stationary dist
     if mu is None:
         mu = msmana.stationary_distribution(T)
+    # sparse T: forward and backward committor share one LU factorization
+    if issparse(T) and qplus is None and qminus is None:
+        from msmtools.analysis.sparse.committor import committors
+        qplus, qminus = committors(T, A, B, mu=mu)
     # forward committor
     if qplus is None:
         qplus = msmana.committor(T, A, B, forward=True)
@@ -161,6 +176,139 @@ def tpt(T, A, B, mu=None, qminus=None, qplus=None, rate_matrix=False):
     return F
 
 
+def _tpt_rate_matrix(K, A, B, mu=None, qminus=None, qplus=None):
+    r"""Reactive flux of a continuous-time Markov chain with rate matrix K.
+
+    The rate matrix takes the place of the generator T-I, all
+    boundary-value problems are solved sparse. For a dense K the
+    fluxes are returned as ndarrays.
+
+    """
+    import msmtools.analysis as msmana
+    from msmtools.analysis.sparse.committor import committors
+
+    dense_input = not issparse(K)
+    K = csr_matrix(K)
+    if mu is None:
+        mu = msmana.stationary_distribution(K, rate_matrix=True)
+    if qplus is None or qminus is None:
+        qp, qm = committors(K, A, B, mu=mu, rate_matrix=True)
+        qplus = qp if qplus is None else qplus
+        qminus = qm if qminus is None else qminus
+    # gross flux f_ij = mu_i qminus_i K_ij qplus_j, the diagonal is removed
+    grossflux = sparse.tpt.flux_matrix(K, mu, qminus, qplus, netflux=False)
+    # net flux
+    netflux = sparse.tpt.to_netflux(grossflux)
+    if dense_input:
+        grossflux = grossflux.toarray()
+        netflux = netflux.toarray()
+
+    # construct flux object
+    from reactive_flux import ReactiveFlux
+
+    return ReactiveFlux(A, B, netflux, mu=mu, qminus=qminus, qplus=qplus, gross_flux=grossflux)
+
+
+def tpt_many(T, pairs, mu=None, rate_matrix=False, n_jobs=1, max_rank=100):
+    r"""Computes the A->B reactive flux for many pairs of sets A, B.
+
+    Parameters
+    ----------
+    T : (M, M) ndarray or scipy.sparse matrix
+        Transition matrix (default) or Rate matrix (if rate_matrix=True)
+    pairs : list of (array_like, array_like)
+        Pairs (A, B) of lists of integer state labels
+    mu : (M,) ndarray (optional)
+        Stationary vector
+    rate_matrix = False : boolean
+        By default (False), T is a transition matrix. 
+        If set to True, T is a rate matrix.
+    n_jobs : int (optional)
+        Number of worker processes. If None, use one per CPU.
+    max_rank : int (optional)
+        Pairs with at most max_rank states in A and B are solved by a
+        low-rank update of a shared factorization, larger pairs by a
+        factorization of their own.
+
+    Returns
+    -------
+    tpts : list of msmtools.flux.ReactiveFlux objects
+        Reactive fluxes, one for each pair. The total flux and the rate
+        are computed on first access, the flux matrices are assembled on
+        first access and then cached.
+
+    Notes
+    -----
+    T is validated and the stationary vector is computed only once. The
+    generator is factorized once per worker with the row of a single
+    reference state replaced by a unit row. The forward and backward
+    committor of every pair are obtained from these factors by a
+    low-rank (Woodbury) update in the rows of A and B, see
+    :class:`msmtools.analysis.sparse.committor.CommittorSolver`.
+
+    The pairs are split into n_jobs contiguous chunks, each worker
+    factorizes the generator once.
+
+    See also
+    --------
+    tpt, ReactiveFlux
+
+    """
+    import msmtools.analysis as msmana
+
+    n = T.shape[0]
+    for (A, B) in pairs:
+        if len(A) == 0 or len(B) == 0:
+            raise ValueError('set A or B is empty')
+        if max(A) >= n or max(B) >= n:
+            raise ValueError('set A or B defines more states, than given transition matrix.')
+    if rate_matrix:
+        if not msmana.is_rate_matrix(T):
+            raise ValueError('given matrix T is not a rate matrix')
+    elif not msmana.is_transition_matrix(T):
+        raise ValueError('given matrix T is not a transition matrix')
+    if mu is None:
+        mu = msmana.stationary_distribution(T, rate_matrix=rate_matrix)
+    dense_input = not issparse(T)
+    T = csr_matrix(T)
+    if n_jobs is None:
+        import multiprocessing
+        n_jobs = multiprocessing.cpu_count()
+
+    pairs = [(list(A), list(B)) for (A, B) in pairs]
+    chunks = [c for c in np.array_split(np.arange(len(pairs)), min(n_jobs, max(len(pairs), 1)))
+              if c.shape[0] > 0]
+    args = [(T, [pairs[i] for i in c], mu, rate_matrix, max_rank) for c in chunks]
+    if len(chunks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(len(chunks))
+        try:
+            results = pool.map(_tpt_many_chunk, args)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_tpt_many_chunk(a) for a in args]
+
+    from reactive_flux import _LazyReactiveFlux
+
+    tpts = []
+    for c, committors in zip(chunks, results):
+        for i, (qplus, qminus) in zip(c, committors):
+            A, B = pairs[i]
+            tpts.append(_LazyReactiveFlux(T, A, B, mu, qminus, qplus, dense=dense_input))
+    return tpts
+
+
+def _tpt_many_chunk(args):
+    r"""Forward and backward committors for a chunk of pairs from one factorization"""
+    from msmtools.analysis.sparse.committor import CommittorSolver
+
+    T, pairs, mu, rate_matrix, max_rank = args
+    solver = CommittorSolver(T, mu=mu, rate_matrix=rate_matrix, max_rank=max_rank)
+    return [solver.committors(A, B) for (A, B) in pairs]
+
+
 # ======================================================================
 # Flux matrix operations
 # ======================================================================
@@ -544,4 +692,49 @@ def pathways(F, A, B, fraction=1.0, maxiter=1000):
     elif isdense(F):
         return sparse.pathways.pathways(csr_matrix(F), A, B, fraction=fraction, maxiter=maxiter)
     else:
-        raise _type_not_supported
\ No newline at end of file
+        raise _type_not_supported
+
+
+def iter_pathways(F, A, B):
+    r"""Iterate over the dominant reaction paths of a flux network.
+
+    Parameters
+    ----------
+    F : (M, M) ndarray or scipy.sparse matrix
+        The flux network (matrix of netflux values)
+    A : array_like
+        The set of starting states
+    B : array_like
+        The set of end states
+
+    Returns
+    -------
+    iterator : generator
+        Yields tuples (path, capacity, fraction) in order of decreasing
+        capacity, where fraction is the cumulative fraction of the total
+        flux carried by the pathways found so far.
+
+    Notes
+    -----
+    Pathways are computed lazily. Stopping the iteration early avoids
+    the cost of decomposing the rest of the network, which makes this
+    the preferred way to inspect the dominant pathways of large flux
+    networks.
+
+    See also
+    --------
+    pathways
+
+    References
+    ----------
+    .. [1] P. Metzner, C. Schuette and E. Vanden-Eijnden.
+        Transition Path Theory for Markov Jump Processes. 
+        Multiscale Model Simul 7: 1192-1219 (2009)    
+
+    """
+    if issparse(F):
+        return sparse.pathways.iter_pathways(F, A, B)
+    elif isdense(F):
+        return sparse.pathways.iter_pathways(csr_matrix(F), A, B)
+    else:
+        raise _type_not_supported
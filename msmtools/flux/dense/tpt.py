@@ -31,6 +31,8 @@ __moduleauthor__ = "Benjamin Trendelkamp-Schroer, Frank Noe"
 """
 import numpy as np
 
+from msmtools.flux.sparse.tpt import membership_matrix
+
 # ======================================================================
 # Flux matrix operations
 # ======================================================================
@@ -201,16 +203,19 @@ def coarsegrain(F, sets):
         Matrix of flux values between pairs of states.
     sets : list of array-like of ints
         The sets of states onto which the flux is coarse-grained.
+
+    Returns
+    -------
+    Fc : (m, m) ndarray
+        The coarse-grained flux, Fc = M^T F M with the set membership
+        matrix M. The diagonal (flux within a set) is removed.
     
     """
-    nnew = len(sets)
-    Fc = np.zeros((nnew, nnew))
-    for i in range(0, nnew - 1):
-        for j in range(i + 1, nnew):
-            I = list(sets[i])
-            J = list(sets[j])
-            Fc[i, j] = np.sum(F[I, :][:, J])
-            Fc[j, i] = np.sum(F[J, :][:, I])
+    M = membership_matrix(sets, F.shape[0])
+    """Fc = M^T F M, with the products taken by the sparse M"""
+    Fc = M.T.dot(M.T.dot(F).T).T
+    """Remove self-fluxes"""
+    np.fill_diagonal(Fc, 0.0)
     return Fc
 
 
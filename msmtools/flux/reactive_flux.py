@@ -30,7 +30,10 @@ __moduleauthor__ = "Benjamin Trendelkamp-Schroer, Frank Noe"
 
 """
 import numpy as np
+from scipy.sparse import coo_matrix, issparse
+
 import api as tptapi
+import sparse
 
 __all__ = ['ReactiveFlux']
 
@@ -116,7 +119,10 @@ class ReactiveFlux(object):
         r"""Returns the set of intermediate states
         
         """
-        return list(set(range(self.nstates)) - set(self._A) - set(self._B))
+        mask = np.ones(self.nstates, dtype=bool)
+        mask[np.asarray(self._A, dtype=int)] = False
+        mask[np.asarray(self._B, dtype=int)] = False
+        return np.where(mask)[0].tolist()
 
     @property
     def stationary_distribution(self):
@@ -205,6 +211,19 @@ class ReactiveFlux(object):
         return tptapi.pathways(self.net_flux, self.A, self.B,
                                fraction=fraction, maxiter=maxiter)
 
+    def iter_pathways(self):
+        r"""Iterate over the dominant reaction paths of the net flux.
+
+        Returns
+        -------
+        iterator : generator
+            Yields tuples (path, capacity, fraction) in order of decreasing
+            capacity, where fraction is the cumulative fraction of the total
+            flux carried by the pathways found so far.
+
+        """
+        return tptapi.iter_pathways(self.net_flux, self.A, self.B)
+
     def _pathways_to_flux(self, paths, pathfluxes, n=None):
         r"""Sums up the flux from the pathways given
 
@@ -221,8 +240,9 @@ class ReactiveFlux(object):
 
         Returns
         -------
-        flux : (n,n) ndarray of float
-            the flux containing the summed path fluxes
+        flux : (n,n) ndarray or scipy.sparse matrix of float
+            the flux containing the summed path fluxes. Sparse if the
+            net flux of this object is sparse.
 
         """
         if (n is None):
@@ -231,20 +251,27 @@ class ReactiveFlux(object):
                 n = max(n, np.max(p))
             n += 1
 
-        # initialize flux
-        F = np.zeros((n, n))
-        for i in range(len(paths)):
-            p = paths[i]
-            for t in range(len(p) - 1):
-                F[p[t], p[t + 1]] += pathfluxes[i]
-        return F
+        # one entry per edge of every path, duplicates are summed up
+        rows = [np.asarray(p[:-1], dtype=int) for p in paths] + [np.zeros(0, dtype=int)]
+        cols = [np.asarray(p[1:], dtype=int) for p in paths] + [np.zeros(0, dtype=int)]
+        data = [np.repeat(float(pathfluxes[i]), len(paths[i]) - 1) for i in range(len(paths))] + [np.zeros(0)]
+        F = coo_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))), shape=(n, n)).tocsr()
+        if issparse(self._flux):
+            return F
+        return F.toarray()
 
     def major_flux(self, fraction=0.9):
         r"""Returns the main pathway part of the net flux comprising
         at most the requested fraction of the full flux.
         
         """
-        (paths, pathfluxes) = self.pathways(fraction=fraction)
+        paths = []
+        pathfluxes = []
+        for path, c, f in self.iter_pathways():
+            paths.append(path)
+            pathfluxes.append(c)
+            if f >= fraction:
+                break
         return self._pathways_to_flux(paths, pathfluxes, n=self.nstates)
 
     # this will be a private function in tpt. only Parameter left will be the sets to be distinguished
@@ -280,37 +307,28 @@ class ReactiveFlux(object):
              subsets
              
         """
-        # set-ify everything
-        setA = set(self.A)
-        setB = set(self.B)
-        setI = set(self.I)
-        raw_sets = [set(user_set) for user_set in user_sets]
-
-        # anything missing? Compute all listed states 
-        set_all = set(range(self.nstates))
-        set_all_user = []
-        for user_set in raw_sets:
-            set_all_user += user_set
-        set_all_user = set(set_all_user)
-        # ... and add all the unlisted states in a separate set
-        set_rest = set_all - set_all_user
-        if len(set_rest) > 0:
-            raw_sets.append(set_rest)
+        # label every state as A (0), intermediate (1) or B (2)
+        region = np.ones(self.nstates, dtype=int)
+        region[np.asarray(self.A, dtype=int)] = 0
+        region[np.asarray(self.B, dtype=int)] = 2
+        raw_sets = [np.unique(np.asarray(list(user_set), dtype=int)) for user_set in user_sets]
+
+        # anything missing? Put all the unlisted states in a separate set
+        listed = np.zeros(self.nstates, dtype=bool)
+        for raw_set in raw_sets:
+            listed[raw_set] = True
+        if not np.all(listed):
+            raw_sets.append(np.where(~listed)[0])
 
         # split sets
-        Asets = []
-        Isets = []
-        Bsets = []
+        split_sets = ([], [], [])
         for raw_set in raw_sets:
-            s = raw_set.intersection(setA)
-            if len(s) > 0:
-                Asets.append(s)
-            s = raw_set.intersection(setI)
-            if len(s) > 0:
-                Isets.append(s)
-            s = raw_set.intersection(setB)
-            if len(s) > 0:
-                Bsets.append(s)
+            raw_region = region[raw_set]
+            for r in range(3):
+                s = raw_set[raw_region == r]
+                if s.size > 0:
+                    split_sets[r].append(set(s.tolist()))
+        Asets, Isets, Bsets = split_sets
         tpt_sets = Asets + Isets + Bsets
         Aindexes = range(0, len(Asets))
         Bindexes = range(len(Asets) + len(Isets), len(tpt_sets))
@@ -348,24 +366,95 @@ class ReactiveFlux(object):
         """
         # coarse-grain sets
         (tpt_sets, Aindexes, Bindexes) = self._compute_coarse_sets(user_sets)
-        nnew = len(tpt_sets)
 
-        # coarse-grain fluxHere we should branch between sparse and dense implementations, but currently there is only a 
+        # coarse-grain flux, Fc = M^T F M with the set membership matrix M (dense or sparse)
         F_coarse = tptapi.coarsegrain(self._gross_flux, tpt_sets)
         Fnet_coarse = tptapi.to_netflux(F_coarse)
 
-        # coarse-grain stationary probability and committors - this can be done all dense
-        pstat_coarse = np.zeros((nnew))
-        forward_committor_coarse = np.zeros((nnew))
-        backward_committor_coarse = np.zeros((nnew))
-        for i in range(0, nnew):
-            I = list(tpt_sets[i])
-            muI = self._mu[I]
-            pstat_coarse[i] = np.sum(muI)
-            partialI = muI / pstat_coarse[i]  # normalized stationary probability over I
-            forward_committor_coarse[i] = np.dot(partialI, self._qplus[I])
-            backward_committor_coarse[i] = np.dot(partialI, self._qminus[I])
+        # coarse-grain stationary probability and committors, M^T mu and M^T (mu q) / M^T mu
+        M = sparse.tpt.membership_matrix(tpt_sets, self.nstates)
+        Mt = M.transpose()
+        pstat_coarse = Mt.dot(self._mu)
+        forward_committor_coarse = Mt.dot(self._mu * self._qplus) / pstat_coarse
+        backward_committor_coarse = Mt.dot(self._mu * self._qminus) / pstat_coarse
 
         res = ReactiveFlux(Aindexes, Bindexes, Fnet_coarse, mu=pstat_coarse,
                            qminus=backward_committor_coarse, qplus=forward_committor_coarse, gross_flux=F_coarse)
-        return (tpt_sets, res)
\ No newline at end of file
+        return (tpt_sets, res)
+
+
+class _LazyReactiveFlux(ReactiveFlux):
+    r"""A->B reactive flux whose flux matrices are only computed on demand.
+
+    Used by :func:`msmtools.flux.tpt_many`. Only the stationary vector
+    and the committors are stored. The total flux and the rate are
+    computed from the rows of A of the transition (or rate) matrix, the
+    gross and net flux are assembled and cached on first access.
+
+    Parameters
+    ----------
+    T : (n,n) scipy.sparse matrix
+        Transition matrix or rate matrix
+    A : array_like
+        List of integer state labels for set A
+    B : array_like
+        List of integer state labels for set B
+    mu : (n,) ndarray
+        Stationary vector
+    qminus : (n,) ndarray
+        Backward committor for A->B reaction
+    qplus : (n,) ndarray
+        Forward committor for A-> B reaction
+    dense : bool (optional)
+        If True, the flux matrices are returned as ndarrays
+
+    """
+
+    def __init__(self, T, A, B, mu, qminus, qplus, dense=False):
+        self._T = T
+        self._A = A
+        self._B = B
+        self._mu = mu
+        self._qminus = qminus
+        self._qplus = qplus
+        self._dense = dense
+        self._fluxes = None
+        self._totalflux_cache = None
+
+    def _compute_fluxes(self):
+        if self._fluxes is None:
+            grossflux = sparse.tpt.flux_matrix(self._T, self._mu, self._qminus, self._qplus, netflux=False)
+            netflux = sparse.tpt.to_netflux(grossflux)
+            if self._dense:
+                grossflux = grossflux.toarray()
+                netflux = netflux.toarray()
+            self._fluxes = (netflux, grossflux)
+        return self._fluxes
+
+    @property
+    def nstates(self):
+        r"""Returns the number of states.
+
+        """
+        return self._mu.shape[0]
+
+    @property
+    def _flux(self):
+        return self._compute_fluxes()[0]
+
+    @property
+    def _gross_flux(self):
+        return self._compute_fluxes()[1]
+
+    @property
+    def _totalflux(self):
+        if self._totalflux_cache is None:
+            # qplus vanishes and qminus is one on A, the net flux out of A is
+            # sum_{i in A} mu_i sum_j T_ij qplus_j
+            A = np.asarray(self._A, dtype=int)
+            self._totalflux_cache = np.dot(self._mu[A], self._T[A, :].dot(self._qplus))
+        return self._totalflux_cache
+
+    @property
+    def _kAB(self):
+        return tptapi.rate(self._totalflux, self._mu, self._qminus)
@@ -28,120 +28,162 @@ r"""Decomposition of a netflux network into its dominant reaction pathways
 .. moduleauthor:: B.Trendelkamp-Schroer <benjamin DOT trendelkamp-schroer AT fu-berlin DOT de>
 
 """
+import heapq
 import warnings
 import numpy as np
-import scipy.sparse.csgraph as csgraph
-from scipy.sparse import coo_matrix
+from scipy.sparse import coo_matrix, csr_matrix
 
 
-def find_bottleneck(F, A, B):
-    r"""Find dynamic bottleneck of flux network.
+class _FluxGraph(object):
+    r"""Mutable CSR representation of a flux network.
 
-    Parameters
-    ----------
-    F : scipy.sparse matrix
-        The flux network
-    A : array_like
-        The set of starting states
-    B : array_like
-        The set of end states
+    Edge capacities are kept in a list and updated in place when a
+    pathway is removed, so that the sparsity structure is never rebuilt.
 
-    Returns
-    -------
-    e : tuple of int
-    The edge corresponding to the dynamic bottleneck
-
-    """
-    F = F.tocoo()
-    n = F.shape[0]
-
-    """Get exdges and corresponding flux values"""
-    val = F.data
-    row = F.row
-    col = F.col
-
-    """Sort edges according to flux"""
-    ind = np.argsort(val)
-    val = val[ind]
-    row = row[ind]
-    col = col[ind]
-
-    """Check if edge with largest conductivity connects A and B"""
-    b = np.array(row[-1], col[-1])
-    if has_path(b, A, B):
-        return b
-    else:
-        """Bisection of flux-value array"""
-        r = val.size
-        l = 0
-        N = 0
-        while r - l > 1:
-            m = np.int(np.floor(0.5 * (r + l)))
-            valtmp = val[m:]
-            rowtmp = row[m:]
-            coltmp = col[m:]
-            C = coo_matrix((valtmp, (rowtmp, coltmp)), shape=(n, n))
-            """Check if there is a path connecting A and B by
-            iterating over all starting nodes in A"""
-            if has_connection(C, A, B):
-                l = 1 * m
-            else:
-                r = 1 * m
-
-        E_AB = coo_matrix((val[l + 1:], (row[l + 1:], col[l + 1:])), shape=(n, n))
-        b1 = row[l]
-        b2 = col[l]
-        return b1, b2, E_AB
-
-
-def has_connection(graph, A, B):
-    r"""Check if the given graph contains a path connecting A and B.
-
-    Parameters
-    ----------
-    graph : scipy.sparse matrix
-        Adjacency matrix of the graph
-    A : array_like
-        The set of starting states
-    B : array_like
-        The set of end states
-
-    Returns
-    -------
-    hc : bool
-       True if the graph contains a path connecting A and B, otherwise
-       False.
-       
     """
-    for istart in A:
-        nodes = csgraph.breadth_first_order(graph, istart, directed=True, return_predecessors=False)
-        if has_path(nodes, A, B):
-            return True
-    return False
-
 
-def has_path(nodes, A, B):
-    r"""Test if nodes from a breadth_first_order search lead from A to
-    B.
-
-    Parameters
-    ----------
-    nodes : array_like
-        Nodes from breadth_first_oder_seatch
-    A : array_like
-        The set of educt states
-    B : array_like
-        The set of product states
-
-    Returns
-    -------
-    has_path : boolean
-        True if there exists a path, else False
-
-    """
-    x1 = np.intersect1d(nodes, A).size > 0
-    x2 = np.intersect1d(nodes, B).size > 0
-    return x1 and x2
+    def __init__(self, F):
+        F = csr_matrix(F)
+        F.sum_duplicates()
+        F.sort_indices()
+        self.indptr = F.indptr.tolist()
+        self.indices = F.indices.tolist()
+        self.data = F.data.astype(float).tolist()
+        """Row of every edge, and work space of the searches"""
+        self.rows = np.repeat(np.arange(F.shape[0]), np.diff(F.indptr)).tolist()
+        self._width = [-np.inf] * F.shape[0]
+        self._pred = [0] * F.shape[0]
+        self._settled = [False] * F.shape[0]
+
+    def widest_path(self, s, t, threshold=0.0, strict=True):
+        r"""Path from s to t with maximal capacity (widest path).
+
+        Modified Dijkstra search, the width of a node is the largest
+        capacity of any path reaching it from s. Only edges with capacity
+        larger than threshold (or equal to it if strict is False) are
+        used. The search stops as soon as t is settled.
+
+        Returns
+        -------
+        nodes : list of int
+            Nodes of the path from s to t, None if there is no path
+        edges : list of int
+            Positions of the edges of the path in the data list
+        width : float
+            Capacity of the path
+
+        """
+        indptr = self.indptr
+        indices = self.indices
+        data = self.data
+        """Widths and predecessors are kept between searches, only the visited entries are reset"""
+        width = self._width
+        pred = self._pred
+        settled = self._settled
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        if strict:
+            threshold = max(threshold, 0.0)
+        elif threshold <= 0.0:
+            threshold, strict = 0.0, True
+        visited = [s]
+        width[s] = np.inf
+        heap = [(-np.inf, s)]
+        while heap:
+            negw, u = heappop(heap)
+            if settled[u]:
+                continue
+            settled[u] = True
+            if u == t:
+                break
+            w_u = -negw
+            for k in range(indptr[u], indptr[u + 1]):
+                c = data[k]
+                if c < threshold or (strict and c == threshold):
+                    continue
+                v = indices[k]
+                w_v = w_u if w_u < c else c
+                if w_v > width[v] and not settled[v]:
+                    if width[v] == -np.inf:
+                        visited.append(v)
+                    width[v] = w_v
+                    pred[v] = k
+                    heappush(heap, (-w_v, v))
+        nodes = None
+        edges = None
+        w_t = 0.0
+        if settled[t]:
+            w_t = width[t]
+            nodes = [t]
+            edges = []
+            while nodes[-1] != s:
+                k = pred[nodes[-1]]
+                edges.append(k)
+                nodes.append(self.rows[k])
+            nodes.reverse()
+            edges.reverse()
+        for v in visited:
+            width[v] = -np.inf
+            settled[v] = False
+        return nodes, edges, w_t
+
+    def dominant_path(self, s, t):
+        r"""Dominant reaction pathway from s to t.
+
+        The widest path determines the bottleneck edge (b1, b2). The
+        dominant path consists of the dominant paths from s to b1 and
+        from b2 to t, using only edges with larger capacity than the
+        bottleneck.
+
+        The decomposition is carried out with an explicit stack, so that
+        the length of the pathway is not limited by the recursion depth.
+        The part of a widest path in front of its first bottleneck is
+        the widest path to b1 found by the same search, only the paths
+        from b2 to t require new searches.
+
+        """
+        nodes, edges, w = self.widest_path(s, t)
+        if nodes is None:
+            return None, None
+        dominant_edges = []
+        """Widest paths still to be decomposed, or edges of the dominant path, last one first"""
+        stack = [(nodes, edges)]
+        while stack:
+            item = stack.pop()
+            if not isinstance(item, tuple):
+                dominant_edges.append(item)
+                continue
+            nodes, edges = item
+            capacities = [self.data[k] for k in edges]
+            w = min(capacities)
+            """First bottleneck edge, all edges in front of it are wider"""
+            p = capacities.index(w)
+            if p < len(edges) - 1:
+                """
+                The rest of the widest path is a path from b2 to t, edges narrower than it can
+                not be part of the widest path from b2 to t and are not searched. No path is wider
+                than the widest edge leaving b2, if the rest is as wide it is a widest path.
+
+                """
+                b2 = nodes[p + 1]
+                w_right = min(capacities[p + 1:])
+                if w_right < max(self.data[self.indptr[b2]:self.indptr[b2 + 1]]):
+                    right_nodes, right_edges, w_right = self.widest_path(b2, nodes[-1], threshold=w_right,
+                                                                         strict=False)
+                    stack.append((right_nodes, right_edges))
+                else:
+                    stack.append((nodes[p + 1:], edges[p + 1:]))
+            stack.append(edges[p])
+            if p > 0:
+                stack.append((nodes[0:p + 1], edges[0:p]))
+        return [s] + [self.indices[k] for k in dominant_edges], dominant_edges
+
+    def remove(self, edges):
+        r"""Remove the capacity of the path with the given edges, returns the capacity"""
+        c = min(self.data[k] for k in edges)
+        for k in edges:
+            self.data[k] -= c
+        return c
 
 
 def pathway(F, A, B):
@@ -162,24 +204,11 @@ def pathway(F, A, B):
         The dominant reaction-pathway
         
     """
-    b1, b2, F = find_bottleneck(F, A, B)
-    if np.any(A == b1):
-        wL = [b1, ]
-    elif np.any(B == b1):
-        raise ValueError(("Roles of vertices b1 and b2 are switched."
-                          "This should never happen for a correct flux network"
-                          "obtained from a reversible transition meatrix."))
-    else:
-        wL = pathway(F, A, [b1, ])
-    if np.any(B == b2):
-        wR = [b2, ]
-    elif np.any(A == b2):
-        raise ValueError(("Roles of vertices b1 and b2 are switched."
-                          "This should never happen for a correct flux network"
-                          "obtained from a reversible transition meatrix."))
-    else:
-        wR = pathway(F, [b2, ], B)
-    return wL + wR
+    F, a, b = add_endstates(F, A, B)
+    path, edges = _FluxGraph(F).dominant_path(a, b)
+    if path is None:
+        raise ValueError("There is no path connecting A and B in the flux network")
+    return path[1:-1]
 
 
 def capacity(F, path):
@@ -198,14 +227,9 @@ def capacity(F, path):
         Capacity (min. current of path)
        
     """
-    F = F.todok()
-    L = len(path)
-    currents = np.zeros(L - 1)
-    for l in range(L - 1):
-        i = path[l]
-        j = path[l + 1]
-        currents[l] = F[i, j]
-
+    F = csr_matrix(F)
+    path = np.asarray(path)
+    currents = np.asarray(F[path[0:-1], path[1:]]).ravel()
     return currents.min()
 
 
@@ -226,13 +250,64 @@ def remove_path(F, path):
         
     """
     c = capacity(F, path)
-    F = F.todok()
-    L = len(path)
-    for l in range(L - 1):
-        i = path[l]
-        j = path[l + 1]
-        F[i, j] -= c
-    return F
+    path = np.asarray(path)
+    P = coo_matrix((c * np.ones(path.shape[0] - 1), (path[0:-1], path[1:])), shape=F.shape)
+    return csr_matrix(F) - P
+
+
+def iter_pathways(F, A, B):
+    r"""Iterate over the dominant reaction paths of a flux network.
+
+    Pathways are computed lazily, one per iteration, in order of
+    decreasing capacity. The iteration ends when no pathway connecting
+    A and B is left in the network.
+
+    Parameters
+    ----------
+    F : (M, M) scipy.sparse matrix
+        The flux network (matrix of netflux values)
+    A : array_like
+        The set of starting states
+    B : array_like
+        The set of end states
+
+    Yields
+    ------
+    path : ndarray
+        Dominant reaction pathway
+    capacity : float
+        Capacity of the pathway
+    fraction : float
+        Fraction of the total flux carried by this and all previous
+        pathways
+
+    References
+    ----------
+    .. [1] P. Metzner, C. Schuette and E. Vanden-Eijnden.
+        Transition Path Theory for Markov Jump Processes. 
+        Multiscale Model Simul 7: 1192-1219 (2009)    
+
+    """
+    F, a, b = add_endstates(F, A, B)
+    graph = _FluxGraph(F)
+
+    """Total flux"""
+    TF = sum(graph.data[graph.indptr[a]:graph.indptr[a + 1]])
+
+    """Total capacity fo all previously found reaction paths"""
+    CF = 0.0
+
+    while True:
+        """Find dominant pathway of flux-network"""
+        path, edges = graph.dominant_path(a, b)
+        if path is None:
+            return
+        """Remove capacity along given path from flux-network"""
+        c = graph.remove(edges)
+        """Update capacity of all previously found paths"""
+        CF += c
+        """Remove artifical end-states"""
+        yield np.array(path[1:-1]), c, CF / TF
 
 
 def pathways(F, A, B, fraction=1.0, maxiter=1000):
@@ -258,6 +333,12 @@ def pathways(F, A, B, fraction=1.0, maxiter=1000):
     capacities: list
         List of capacities corresponding to each reactions pathway in paths
 
+    Notes
+    -----
+    Every pathway is found by widest-path searches on a single mutable
+    copy of the flux network, from which the capacity of each pathway is
+    removed in place.
+
     References
     ----------
     .. [1] P. Metzner, C. Schuette and E. Vanden-Eijnden.
@@ -265,41 +346,19 @@ def pathways(F, A, B, fraction=1.0, maxiter=1000):
         Multiscale Model Simul 7: 1192-1219 (2009)    
                 
     """
-    F, a, b = add_endstates(F, A, B)
-    A = [a, ]
-    B = [b, ]
-
-    """Total flux"""
-    TF = F.tocsr()[A, :].sum()
-
-    """Total capacity fo all previously found reaction paths"""
-    CF = 0.0
-    niter = 0
-
     """List of dominant reaction pathways"""
     paths = []
     """List of corresponding capacities"""
     capacities = []
 
-    while True:
-        """Find dominant pathway of flux-network"""
-        path = pathway(F, A, B)
-        """Compute capacity of current pathway"""
-        c = capacity(F, path)
-        """Remove artifical end-states"""
-        path = path[1:-1]
-        """Append to lists"""
-        paths.append(np.array(path))
+    for path, c, f in iter_pathways(F, A, B):
+        paths.append(path)
         capacities.append(c)
-        """Update capacity of all previously found paths"""
-        CF += c
-        """Remove capacity along given path from flux-network"""
-        F = remove_path(F, path)
-        niter += 1
-        if CF / TF >= fraction:
+        if f >= fraction:
             break
-        if niter > maxiter:
+        if len(paths) >= maxiter:
             warnings.warn("Maximum number of iterations reached", RuntimeWarning)
+            break
     return paths, capacities
 
 
@@ -342,14 +401,14 @@ def add_endstates(F, A, B):
     col_old = F.col
 
     """Add currents from new A=[n,] to all states in A"""
-    row1 = np.zeros(outA.shape[0], dtype=np.int)
+    row1 = np.zeros(outA.shape[0], dtype=int)
     row1[:] = M
     col1 = np.array(A)
     data1 = outA
 
     """Add currents from old B to new B=[n+1,]"""
     row2 = np.array(B)
-    col2 = np.zeros(inB.shape[0], dtype=np.int)
+    col2 = np.zeros(inB.shape[0], dtype=int)
     col2[:] = M + 1
     data2 = inB
 
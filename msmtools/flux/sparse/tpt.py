@@ -95,13 +95,18 @@ def flux_matrix(T, pi, qminus, qplus, netflux=True):
         Matrix of flux values between pairs of states.
     
     """
-    D1 = diags((pi * qminus,), (0,))
-    D2 = diags((qplus,), (0,))
+    T = csr_matrix(T)
+    n = T.shape[0]
+    rows = np.repeat(np.arange(n), np.diff(T.indptr))
+    cols = T.indices
 
-    flux = D1.dot(T.dot(D2))
+    """f_ij = pi_i qminus_i T_ij qplus_j, scaled on the CSR data of T"""
+    data = T.data * (pi * qminus)[rows] * qplus[cols]
 
     """Remove self-fluxes"""
-    flux = flux - diags(flux.diagonal(), 0)
+    data[rows == cols] = 0.0
+    flux = csr_matrix((data, cols.copy(), T.indptr.copy()), shape=T.shape)
+    flux.eliminate_zeros()
 
     """Return net or gross flux"""
     if netflux:
@@ -127,10 +132,12 @@ def to_netflux(flux):
         Matrix of netflux values between pairs of states.
     
     """
-    netflux = flux - flux.T
+    flux = csr_matrix(flux)
+    netflux = (flux - flux.T).tocsr()
 
     """Set negative entries to zero"""
-    netflux = remove_negative_entries(netflux)
+    netflux.data[netflux.data < 0.0] = 0.0
+    netflux.eliminate_zeros()
     return netflux
 
 
@@ -144,38 +151,65 @@ def coarsegrain(F, sets):
     
     Parameters
     ----------
-    F : (n, n) ndarray
+    F : (n, n) scipy.sparse matrix
         Matrix of flux values between pairs of states.
     sets : list of array-like of ints
         The sets of states onto which the flux is coarse-grained.
+
+    Returns
+    -------
+    Fc : (m, m) scipy.sparse matrix
+        The coarse-grained flux, Fc = M^T F M with the set membership
+        matrix M. The diagonal (flux within a set) is removed.
     
     """
-    nnew = len(sets)
-    Fin = F.tocsr()
-    Fc = csr_matrix((nnew, nnew))
-    for i in range(0, nnew - 1):
-        for j in range(i, nnew):
-            I = list(sets[i])
-            J = list(sets[j])
-            Fc[i, j] = (Fin[I, :][:, J]).sum()
-            Fc[j, i] = (Fin[J, :][:, I]).sum()
+    M = membership_matrix(sets, F.shape[0])
+    Fc = M.transpose().dot(F.tocsr()).dot(M)
+    """Remove self-fluxes"""
+    Fc = Fc - diags(Fc.diagonal(), 0)
+    Fc.eliminate_zeros()
     return Fc
 
 
+def membership_matrix(sets, n):
+    r"""Sparse matrix M with M[i, k]=1 if state i belongs to set k.
+
+    Parameters
+    ----------
+    sets : list of array-like of ints
+        The sets of states
+    n : int
+        Number of states
+
+    Returns
+    -------
+    M : (n, m) scipy.sparse.csr_matrix
+        Membership matrix of the m sets. A state listed twice in a set
+        contributes twice.
+
+    """
+    sizes = [len(s) for s in sets]
+    rows = np.concatenate([np.asarray(list(s), dtype=int) for s in sets] + [np.zeros(0, dtype=int)])
+    cols = np.repeat(np.arange(len(sets)), sizes)
+    M = coo_matrix((np.ones(rows.shape[0]), (rows, cols)), shape=(n, len(sets)))
+    return M.tocsr()
+
+
 # ======================================================================
 # Total flux, rate and mfpt for the A->B reaction
 # ======================================================================
 
 
-def total_flux(flux, A):
+def total_flux(flux, A=None):
     r"""Compute the total flux between reactant and product.
     
     Parameters
     ----------
     flux : (M, M) scipy.sparse matrix
         Matrix of flux values between pairs of states.
-    A : array_like
-        List of integer state labels for set A (reactant)
+    A : array_like (optional)
+        List of integer state labels for set A (reactant). If not
+        given, the total flux produced by all flux sources is returned.
     
     Returns
     -------
@@ -183,16 +217,14 @@ def total_flux(flux, A):
         The total flux between reactant and product
     
     """
-    X = set(np.arange(flux.shape[0]))  # total state space
-    A = set(A)
-    notA = X.difference(A)
-
-    """Extract rows corresponding to A"""
-    W = flux.tocsr()
-    W = W[list(A), :]
-    """Extract columns corresonding to X\A"""
-    W = W.tocsc()
-    W = W[:, list(notA)]
-
-    F = W.sum()
-    return F
\ No newline at end of file
+    W = csr_matrix(flux)
+    n = W.shape[0]
+    if A is None:
+        prod = np.asarray(W.sum(axis=1)).ravel() - np.asarray(W.sum(axis=0)).ravel()
+        return np.sum(np.maximum(prod, 0.0))
+    inA = np.zeros(n, dtype=bool)
+    inA[np.asarray(A, dtype=int)] = True
+    rows = np.repeat(np.arange(n), np.diff(W.indptr))
+
+    """Sum of entries in rows corresponding to A and columns corresponding to X\A"""
+    return W.data[inA[rows] & ~inA[W.indices]].sum()
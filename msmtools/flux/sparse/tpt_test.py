@@ -329,5 +329,30 @@ class TestTPT(unittest.TestCase):
         #    assert_allclose(self.kn, k)
 
 
+class TestCoarsegrain(unittest.TestCase):
+    def setUp(self):
+        self.F = np.random.random((10, 10))
+        np.fill_diagonal(self.F, 0.0)
+        self.F[self.F < 0.5] = 0.0
+        self.sets = [[0, 1, 2], [5, 3], [4], [6, 7, 8, 9]]
+        m = len(self.sets)
+        self.Fc = np.zeros((m, m))
+        for i in range(m):
+            for j in range(m):
+                if i != j:
+                    self.Fc[i, j] = self.F[self.sets[i], :][:, self.sets[j]].sum()
+
+    def test_coarsegrain(self):
+        Fcn = tpt.coarsegrain(csr_matrix(self.F), self.sets)
+        assert_allclose(Fcn.toarray(), self.Fc)
+
+    def test_membership_matrix(self):
+        M = tpt.membership_matrix(self.sets, 10).toarray()
+        self.assertEqual(M.shape, (10, 4))
+        assert_allclose(M.sum(axis=1), np.ones(10))
+        self.assertEqual(M[5, 1], 1.0)
+        self.assertEqual(M[4, 2], 1.0)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -35,7 +35,7 @@ import numpy as np
 from scipy.sparse import csr_matrix
 
 from msmtools.util.numeric import assert_allclose
-from msmtools.flux import pathways
+from msmtools.flux import pathways, iter_pathways
 
 
 class TestPathways(unittest.TestCase):
@@ -134,6 +134,76 @@ class TestPathways(unittest.TestCase):
                 assert_allclose(paths[i], self.paths[i])
                 assert_allclose(capacities[i], self.capacities[i])            
             assert issubclass(w[-1].category, RuntimeWarning)
-        
+
+class TestPathwaysTies(unittest.TestCase):
+
+    def setUp(self):
+        """Two parallel channels of equal capacity sharing their first edge"""
+        F = np.zeros((5, 5))
+        F[0, 1] = 10.0
+        F[1, 2] = 5.0
+        F[1, 3] = 5.0
+        F[2, 4] = 5.0
+        F[3, 4] = 5.0
+        self.F = csr_matrix(F)
+        self.A = [0]
+        self.B = [4]
+
+    def test_pathways_ties(self):
+        paths, capacities = pathways(self.F, self.A, self.B)
+        self.assertEqual(len(paths), 2)
+        assert_allclose(capacities, [5.0, 5.0])
+        self.assertEqual(set(tuple(p) for p in paths), set([(0, 1, 2, 4), (0, 1, 3, 4)]))
+
+
+class TestPathwaysLong(unittest.TestCase):
+
+    def test_pathways_line(self):
+        """A line of 1200 states with equal capacities, longer than the recursion limit"""
+        n = 1200
+        F = csr_matrix((np.ones(n - 1), (np.arange(n - 1), np.arange(1, n))), shape=(n, n))
+        paths, capacities = pathways(F, [0], [n - 1])
+        self.assertEqual(len(paths), 1)
+        assert_allclose(paths[0], np.arange(n))
+        assert_allclose(capacities, [1.0])
+
+
+class TestIterPathways(unittest.TestCase):
+
+    def setUp(self):
+        F = np.zeros((8, 8))
+        F[0, 2] = 10.0
+        F[2, 6] = 10.0
+        F[1, 3] = 100.0
+        F[3, 4] = 30.0
+        F[3, 5] = 70.0
+        F[4, 6] = 5.0
+        F[4, 7] = 25.0
+        F[5, 6] = 30.0
+        F[5, 7] = 40.0
+        self.F = csr_matrix(F)
+        self.A = [0, 1]
+        self.B = [6, 7]
+        self.paths = [[1, 3, 5, 7], [1, 3, 5, 6], [1, 3, 4, 7], [0, 2, 6], [1, 3, 4, 6]]
+        self.capacities = [40.0, 30.0, 25.0, 10.0, 5.0]
+
+    def test_iter_pathways(self):
+        items = list(iter_pathways(self.F, self.A, self.B))
+        self.assertEqual(len(items), len(self.paths))
+        for i, (path, c, f) in enumerate(items):
+            assert_allclose(path, self.paths[i])
+            assert_allclose(c, self.capacities[i])
+            assert_allclose(f, np.sum(self.capacities[0:i + 1]) / 110.0)
+
+    def test_iter_pathways_early_stop(self):
+        it = iter_pathways(self.F.toarray(), self.A, self.B)
+        path, c, f = next(it)
+        assert_allclose(path, self.paths[0])
+        assert_allclose(f, 40.0 / 110.0)
+        path, c, f = next(it)
+        assert_allclose(path, self.paths[1])
+        assert_allclose(c, self.capacities[1])
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
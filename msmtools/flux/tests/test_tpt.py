@@ -326,5 +326,115 @@ class TestTptFunctionsSparse(unittest.TestCase):
         assert_allclose(self.raten, rate)
 
 
+################################################################################
+# Rate matrix
+################################################################################
+
+class TestTPTRateMatrix(unittest.TestCase):
+    def setUp(self):
+        """Non-reversible rate matrix K and its uniformized transition matrix P=I+K/lam"""
+        n = 20
+        R = np.random.RandomState(42).rand(n, n)
+        R[R < 0.7] = 0.0
+        R[np.arange(n - 1), np.arange(1, n)] += 1.0
+        R[np.arange(1, n), np.arange(n - 1)] += 0.5
+        np.fill_diagonal(R, 0.0)
+        self.K = R - np.diag(R.sum(axis=1))
+        self.lam = np.max(-np.diag(self.K))
+        self.P = np.eye(n) + self.K / self.lam
+        self.A = [0, 1]
+        self.B = [n - 2, n - 1]
+
+    def test_tpt_sparse(self):
+        tpt_K = flux.tpt(csr_matrix(self.K), self.A, self.B, rate_matrix=True)
+        tpt_P = flux.tpt(self.P, self.A, self.B)
+        assert_allclose(tpt_K.stationary_distribution, tpt_P.stationary_distribution)
+        assert_allclose(tpt_K.forward_committor, tpt_P.forward_committor)
+        assert_allclose(tpt_K.backward_committor, tpt_P.backward_committor)
+        assert_allclose(tpt_K.gross_flux.toarray(), self.lam * tpt_P.gross_flux)
+        assert_allclose(tpt_K.net_flux.toarray(), self.lam * tpt_P.net_flux)
+        assert_allclose(tpt_K.rate, self.lam * tpt_P.rate)
+
+    def test_tpt_dense(self):
+        tpt_K = flux.tpt(self.K, self.A, self.B, rate_matrix=True)
+        tpt_P = flux.tpt(self.P, self.A, self.B)
+        assert_allclose(tpt_K.net_flux, self.lam * tpt_P.net_flux)
+        assert_allclose(tpt_K.total_flux, self.lam * tpt_P.total_flux)
+
+    def test_not_a_rate_matrix(self):
+        with self.assertRaises(ValueError):
+            flux.tpt(self.P, self.A, self.B, rate_matrix=True)
+
+
+################################################################################
+# Many pairs
+################################################################################
+
+class TestTPTMany(unittest.TestCase):
+    def setUp(self):
+        p = np.zeros(12)
+        q = np.zeros(12)
+        p[0:-1] = 0.5
+        q[1:] = 0.4
+        p[5] = 0.01
+        q[8] = 0.1
+
+        import msmtools.analysis.dense.birth_death_chain
+
+        bdc = msmtools.analysis.dense.birth_death_chain.BirthDeathChain(q, p)
+        self.T = bdc.transition_matrix()
+        self.mu = bdc.stationary_distribution()
+        self.pairs = [([0, 1], [10, 11]), ([2], [3]), ([11], [0, 4, 5]), ([5, 6], [7])]
+
+    def _compare(self, tpts, T):
+        self.assertEqual(len(tpts), len(self.pairs))
+        for (A, B), tpt_lazy in zip(self.pairs, tpts):
+            tpt_ref = flux.tpt(T, A, B, mu=self.mu)
+            self.assertEqual(tpt_lazy.A, A)
+            self.assertEqual(tpt_lazy.B, B)
+            assert_allclose(tpt_lazy.forward_committor, tpt_ref.forward_committor)
+            assert_allclose(tpt_lazy.backward_committor, tpt_ref.backward_committor)
+            assert_allclose(tpt_lazy.total_flux, tpt_ref.total_flux)
+            assert_allclose(tpt_lazy.rate, tpt_ref.rate)
+            F_lazy = tpt_lazy.net_flux
+            F_ref = tpt_ref.net_flux
+            if not isinstance(F_lazy, np.ndarray):
+                F_lazy = F_lazy.toarray()
+                F_ref = F_ref.toarray()
+            assert_allclose(F_lazy, F_ref)
+
+    def test_tpt_many_dense(self):
+        self._compare(flux.tpt_many(self.T, self.pairs, mu=self.mu), self.T)
+
+    def test_tpt_many_sparse(self):
+        T = csr_matrix(self.T)
+        tpts = flux.tpt_many(T, self.pairs, mu=self.mu)
+        self._compare(tpts, T)
+        """Sparse and dense input give the same fluxes"""
+        for tpt_sparse, tpt_dense in zip(tpts, flux.tpt_many(self.T, self.pairs, mu=self.mu)):
+            assert_allclose(tpt_sparse.gross_flux.toarray(), tpt_dense.gross_flux)
+            assert_allclose(tpt_sparse.net_flux.toarray(), tpt_dense.net_flux)
+            assert_allclose(tpt_sparse.total_flux, tpt_dense.total_flux)
+            assert_allclose(tpt_sparse.rate, tpt_dense.rate)
+
+    def test_tpt_many_direct(self):
+        """Pairs exceeding max_rank are factorized on their own"""
+        self._compare(flux.tpt_many(self.T, self.pairs, mu=self.mu, max_rank=2), self.T)
+
+    def test_tpt_many_parallel(self):
+        self._compare(flux.tpt_many(self.T, self.pairs, mu=self.mu, n_jobs=2), self.T)
+
+    def test_tpt_many_stationary_distribution(self):
+        """mu is computed if not given, on a generic sparse matrix"""
+        C = np.random.RandomState(42).rand(12, 12)
+        T = csr_matrix(C / C.sum(axis=1)[:, np.newaxis])
+        for (A, B), tpt_lazy in zip(self.pairs, flux.tpt_many(T, self.pairs)):
+            tpt_ref = flux.tpt(T.toarray(), A, B)
+            assert_allclose(tpt_lazy.stationary_distribution, tpt_ref.stationary_distribution)
+            assert_allclose(tpt_lazy.forward_committor, tpt_ref.forward_committor)
+            assert_allclose(tpt_lazy.net_flux.toarray(), tpt_ref.net_flux)
+            assert_allclose(tpt_lazy.rate, tpt_ref.rate)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -41,6 +41,8 @@ Metropolis-Hastings chain
 
    transition_matrix_metropolis_1d
    generate_traj
+   generate_ensemble
+   MarkovChainSampler
 
 """
 from .api import *
\ No newline at end of file
@@ -29,13 +29,18 @@ Created on Jan 8, 2014
 '''
 
 import math
+import ctypes
 import numpy as np
-import scipy.stats
+import scipy.sparse
 import msmtools.util.types as types
 
+import markov_chain
+
 __all__ = ['transition_matrix_metropolis_1d',
            'generate_traj',
-           'generate_trajs']
+           'generate_trajs',
+           'generate_ensemble',
+           'MarkovChainSampler']
 
 
 class MarkovChainSampler(object):
@@ -43,40 +48,51 @@ class MarkovChainSampler(object):
     Class for generation of trajectories from a transition matrix P.
     If many trajectories will be sampled from P, using this class is much more 
     efficient than individual calls to generate_traj because that avoid costly
-    multiple construction of random variable objects.
+    multiple construction of the alias tables.
 
     """
 
-    def __init__(self, P, dt=1):
+    def __init__(self, P, dt=1, random_state=None):
         """
         Constructs a sampling object with transition matrix P. The results will be produced every dt'th time step
 
         Parameters
         ----------
-        P : (n, n) ndarray
-            transition matrix
+        P : (n, n) ndarray or scipy.sparse matrix
+            transition matrix. A sparse matrix is used as is, without converting it to a dense array.
         dt : int
             trajectory will be saved every dt time steps.
-            Internally, the dt'th power of P is taken to ensure a more efficient simulation.
+            The chain is propagated dt single steps between two saved states.
+        random_state : None, int or numpy.random.RandomState, optional
+            source of random numbers. None uses the global numpy random state,
+            an int seeds a new numpy.random.RandomState.
 
         """
-        # process input
-        if dt > 1:
-            # take a power of P if requested
-            self.P = np.linalg.matrix_power(P, dt)
-        else:
-            # create local copy and transform to ndarray if in a different format
-            self.P = np.array(P)
+        # process input, a sparse P stays sparse and a dense P is converted to CSR
+        self._dense_input = not scipy.sparse.issparse(P)
+        self.P = scipy.sparse.csr_matrix(P, dtype=np.float64, copy=True)
+        self.P.eliminate_zeros()
+        self.P.sort_indices()
         self.n = self.P.shape[0]
+        self.dt = int(dt)
+        if self.dt < 1:
+            raise ValueError('dt must be a positive integer, but is ' + str(dt))
+        self.random_state = _ensure_random_state(random_state)
 
         # initialize mu
         self.mudist = None
 
-        # generate discrete random value generators for each line
-        self.rgs = np.ndarray((self.n), dtype=object)
-        for i in xrange(self.n):
-            nz = np.nonzero(self.P[i])
-            self.rgs[i] = scipy.stats.rv_discrete(values=(nz, self.P[i, nz]))
+        # alias tables for each row, one uniform random number per step
+        self._indptr = self.P.indptr.astype(np.int64)
+        self._indices = self.P.indices.astype(np.int64)
+        self._prob, self._alias = markov_chain.alias_tables(self._indptr, self.P.data)
+        # cumulative probabilities of each row i, offset by i, increase monotonically over the CSR data
+        counts = np.diff(self._indptr)
+        csum = np.cumsum(self.P.data)
+        cdf = csum - np.repeat(np.concatenate(([0.0], csum))[self._indptr[:-1]], counts)
+        cdf /= np.repeat(cdf[self._indptr[1:] - 1], counts)
+        cdf[self._indptr[1:] - 1] = 1.0
+        self._keys = np.maximum.accumulate(np.repeat(np.arange(self.n), counts) + cdf)
 
     def trajectory(self, N, start=None, stop=None):
         """
@@ -95,39 +111,24 @@ class MarkovChainSampler(object):
         """
         # check input
         stop = types.ensure_int_vector_or_None(stop, require_order=False)
+        uniform = self.random_state.random_sample
 
         if start is None:
-            if self.mudist is None:
-                # compute mu, the stationary distribution of P
-                import msmtools.analysis as msmana
-
-                mu = msmana.stationary_distribution(self.P)
-                self.mudist = scipy.stats.rv_discrete(values=(range(self.n), mu ))
             # sample starting point from mu
-            start = self.mudist.rvs()
+            start = self._stationary_states(1, uniform)[0]
 
         # evaluate stopping set
-        stopat = np.ndarray((self.n), dtype=bool)
-        stopat[:] = False
+        stopat = np.zeros(self.n, dtype=np.uint8)
         if (stop is not None):
-            for s in np.array(stop):
-                stopat[s] = True
-
-        # result
-        traj = np.zeros(N, dtype=int)
-        traj[0] = start
-        # already at stopping state?
-        if stopat[traj[0]]:
-            return traj[:1]
-        # else run until end or stopping state
-        for t in xrange(1, N):
-            traj[t] = self.rgs[traj[t - 1]].rvs()
-            if stopat[traj[t]]:
-                return traj[:t+1]
-        # return
-        return traj
-
-    def trajectories(self, M, N, start=None, stop=None):
+            stopat[np.array(stop)] = 1
+
+        # run until end or stopping state
+        traj = np.zeros(N, dtype=np.int64)
+        length = markov_chain.sample_trajectory(self._indptr, self._indices, self._prob, self._alias,
+                                                traj, start, stopat, uniform, dt=self.dt)
+        return traj[:length]
+
+    def trajectories(self, M, N, start=None, stop=None, n_jobs=1, out=None):
         """
         Generates M trajectories, each of length N, starting from state s
 
@@ -142,19 +143,214 @@ class MarkovChainSampler(object):
         stop : int or int-array-like, optional, default = None
             stopping set. If given, the trajectory will be stopped before N steps
             once a state of the stop set is reached
+        n_jobs : int, optional, default = 1
+            number of worker processes. If None, use one per CPU. See Notes.
+        out : (M, N) ndarray of int64, optional, default = None
+            C-contiguous output array, e.g. a numpy.memmap of an on-disk dtraj store.
+            Entries after a trajectory reached the stop set are set to -1.
+
+        Returns
+        -------
+        trajs : list of ndarray or (M, N) ndarray
+            list of the M trajectories, or out if given
+
+        Notes
+        -----
+        Trajectory i is sampled from its own numpy.random.RandomState, seeded by a key
+        drawn once from the random state of the sampler together with i. The result is
+        therefore the same for any number of workers, including n_jobs=1, but differs
+        from repeated calls to trajectory, which all draw from the random state of the
+        sampler. The trajectories are split into n_jobs contiguous chunks and every
+        worker writes its trajectories directly into shared memory or, if out is a
+        numpy.memmap, into the file.
 
         """
-        trajs = [self.trajectory(N, start=start, stop=stop) for _ in xrange(M)]
+        stop = types.ensure_int_vector_or_None(stop, require_order=False)
+        if out is not None:
+            if out.shape != (M, N) or out.dtype != np.int64 or not out.flags.c_contiguous:
+                raise ValueError('out must be a C-contiguous int64 array of shape ' + str((M, N)))
+
+        # evaluate stopping set
+        stopat = np.zeros(self.n, dtype=np.uint8)
+        if (stop is not None):
+            stopat[np.array(stop)] = 1
+
+        if n_jobs is None:
+            import multiprocessing
+            n_jobs = multiprocessing.cpu_count()
+        if start is None:
+            # compute mu once, before the workers start
+            self._stationary_states(0, None)
+        # key of the independent random streams, one per trajectory
+        key = [int(w) for w in self.random_state.randint(0, 2**31 - 1, size=4)]
+        chunks = [c for c in np.array_split(np.arange(M), min(n_jobs, max(M, 1))) if c.shape[0] > 0]
+        if len(chunks) > 1:
+            import mmap
+            import multiprocessing
+            if isinstance(out, np.memmap) and isinstance(out.base, mmap.mmap):
+                store = ('memmap', out.filename, out.offset)
+            else:
+                store = ('shared', multiprocessing.RawArray(ctypes.c_int64, M * N))
+            pool = multiprocessing.Pool(len(chunks), _init_trajectories_worker,
+                                        (self, store, (M, N), start, stopat))
+            try:
+                lengths = pool.map(_trajectories_chunk, [(c, key) for c in chunks])
+            finally:
+                pool.close()
+                pool.join()
+            lengths = np.concatenate(lengths)
+            if store[0] == 'shared':
+                trajs = np.ctypeslib.as_array(store[1]).reshape((M, N))
+                if out is not None:
+                    out[:] = trajs
+            else:
+                trajs = out
+        else:
+            trajs = out if out is not None else np.empty((M, N), dtype=np.int64)
+            lengths = _sample_trajectories(self, trajs, range(M), key, start, stopat)
+
+        if out is not None:
+            return out
+        return [trajs[i, :lengths[i]] for i in range(M)]
+
+    def ensemble(self, M, N, start=None, stop=None):
+        """
+        Generates M trajectories, each of length N, advancing all of them in lockstep
+
+        Parameters
+        ----------
+        M : int
+            number of trajectories
+        N : int
+            trajectory length
+        start : int or int-array-like of length M, optional, default = None
+            starting state(s). If not given, will sample from the stationary distribution of P
+        stop : int or int-array-like, optional, default = None
+            stopping set. If given, each trajectory will be stopped before N steps
+            once a state of the stop set is reached
+
+        Returns
+        -------
+        trajs : (M, N) ndarray of int
+            trajectories, one per row. Entries after a trajectory reached the stop set are -1.
+
+        Notes
+        -----
+        Every step samples the next states of all running trajectories at once, by a single
+        searchsorted over the cumulative transition probabilities of the CSR rows.
+
+        """
+        stop = types.ensure_int_vector_or_None(stop, require_order=False)
+        uniform = self.random_state.random_sample
+
+        if start is None:
+            states = self._stationary_states(M, uniform)
+        else:
+            states = np.zeros(M, dtype=np.int64)
+            states[:] = start
+
+        stopat = np.zeros(self.n, dtype=bool)
+        if (stop is not None):
+            stopat[np.array(stop)] = True
+
+        trajs = np.empty((M, N), dtype=np.int64)
+        trajs.fill(-1)
+        if N == 0:
+            return trajs
+        trajs[:, 0] = states
+        running = np.where(~stopat[states])[0]
+        states = states[running]
+        for t in range(1, N):
+            if running.shape[0] == 0:
+                break
+            # dt steps of the chain between two saved states
+            for _ in range(self.dt):
+                states = self._step(states, uniform)
+            trajs[running, t] = states
+            # walkers that reached the stop set drop out
+            go_on = ~stopat[states]
+            running = running[go_on]
+            states = states[go_on]
         return trajs
 
+    def _stationary_states(self, M, uniform):
+        """M states drawn from the stationary distribution of P"""
+        if self.mudist is None:
+            # compute mu, the stationary distribution of P, on the format P was given in
+            import msmtools.analysis as msmana
+
+            mu = msmana.stationary_distribution(self.P.toarray() if self._dense_input else self.P)
+            self.mudist = np.cumsum(mu)
+            self.mudist /= self.mudist[-1]
+        if M == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.minimum(np.searchsorted(self.mudist, uniform(M), side='right'), self.n - 1)
+
+    def _step(self, states, uniform):
+        """One step of the chain for all given states, by inverse-CDF sampling on the CSR rows"""
+        pos = np.searchsorted(self._keys, states + uniform(states.shape[0]), side='right')
+        # guard against round-off of states + u towards states + 1
+        pos = np.minimum(pos, self._indptr[states + 1] - 1)
+        return self._indices[pos]
+
+
+def _ensure_random_state(random_state):
+    r"""RandomState from None (global state), an int seed or a RandomState object"""
+    if random_state is None:
+        return np.random.mtrand._rand
+    if isinstance(random_state, (int, long, np.integer)):
+        return np.random.RandomState(random_state)
+    return random_state
+
+
+def _sample_trajectories(sampler, trajs, rows, key, start, stopat):
+    r"""Samples the trajectories into the given rows of trajs, each from a RandomState seeded by the key and the row"""
+    lengths = np.zeros(len(rows), dtype=np.int64)
+    # reseeding is much cheaper than constructing a RandomState for every trajectory
+    random_state = np.random.RandomState(key)
+    uniform = random_state.random_sample
+    for k, i in enumerate(rows):
+        random_state.seed(key + [int(i)])
+        if start is None:
+            s = sampler._stationary_states(1, uniform)[0]
+        else:
+            s = start
+        lengths[k] = markov_chain.sample_trajectory(sampler._indptr, sampler._indices, sampler._prob,
+                                                    sampler._alias, trajs[i], s, stopat, uniform,
+                                                    dt=sampler.dt)
+        trajs[i, lengths[k]:] = -1
+    return lengths
+
+
+_trajectories_worker = {}
+
+
+def _init_trajectories_worker(sampler, store, shape, start, stopat):
+    r"""Maps the output store of MarkovChainSampler.trajectories in a worker process"""
+    if store[0] == 'memmap':
+        trajs = np.memmap(store[1], dtype=np.int64, mode='r+', offset=store[2], shape=shape)
+    else:
+        trajs = np.ctypeslib.as_array(store[1]).reshape(shape)
+    _trajectories_worker.update(sampler=sampler, trajs=trajs, start=start, stopat=stopat)
+
+
+def _trajectories_chunk(args):
+    r"""Samples a chunk of trajectories into the output store of the worker"""
+    rows, key = args
+    w = _trajectories_worker
+    lengths = _sample_trajectories(w['sampler'], w['trajs'], rows, key, w['start'], w['stopat'])
+    if isinstance(w['trajs'], np.memmap):
+        w['trajs'].flush()
+    return lengths
 
-def generate_traj(P, N, start=None, stop=None, dt=1):
+
+def generate_traj(P, N, start=None, stop=None, dt=1, random_state=None):
     """
     Generates a realization of the Markov chain with transition matrix P.
 
     Parameters
     ----------
-    P : (n, n) ndarray
+    P : (n, n) ndarray or scipy.sparse matrix
         transition matrix
     N : int
         trajectory length
@@ -165,7 +361,10 @@ def generate_traj(P, N, start=None, stop=None, dt=1):
         once a state of the stop set is reached
     dt : int
         trajectory will be saved every dt time steps.
-        Internally, the dt'th power of P is taken to ensure a more efficient simulation.
+        The chain is propagated dt single steps between two saved states.
+    random_state : None, int or numpy.random.RandomState, optional
+        source of random numbers. None uses the global numpy random state,
+        an int seeds a new numpy.random.RandomState.
 
     Returns
     -------
@@ -173,17 +372,17 @@ def generate_traj(P, N, start=None, stop=None, dt=1):
         A discrete trajectory with length N/dt
 
     """
-    sampler = MarkovChainSampler(P, dt=dt)
+    sampler = MarkovChainSampler(P, dt=dt, random_state=random_state)
     return sampler.trajectory(N, start=start, stop=stop)
 
 
-def generate_trajs(P, M, N, start=None, stop=None, dt=1):
+def generate_trajs(P, M, N, start=None, stop=None, dt=1, random_state=None, n_jobs=1, out=None):
     """
     Generates multiple realizations of the Markov chain with transition matrix P.
 
     Parameters
     ----------
-    P : (n, n) ndarray
+    P : (n, n) ndarray or scipy.sparse matrix
         transition matrix
     M : int
         number of trajectories
@@ -196,16 +395,65 @@ def generate_trajs(P, M, N, start=None, stop=None, dt=1):
         once a state of the stop set is reached
     dt : int
         trajectory will be saved every dt time steps.
-        Internally, the dt'th power of P is taken to ensure a more efficient simulation.
+        The chain is propagated dt single steps between two saved states.
+    random_state : None, int or numpy.random.RandomState, optional
+        source of random numbers. None uses the global numpy random state,
+        an int seeds a new numpy.random.RandomState.
+    n_jobs : int, optional, default = 1
+        number of worker processes. If None, use one per CPU. Every trajectory is
+        sampled from its own RandomState, seeded from random_state, and the result
+        is the same for any number of workers.
+    out : (M, N) ndarray of int64, optional, default = None
+        C-contiguous output array, e.g. a numpy.memmap of an on-disk dtraj store.
+        Entries after a trajectory reached the stop set are set to -1.
 
     Returns
     -------
-    traj_sliced : (N/dt, ) ndarray
-        A discrete trajectory with length N/dt
+    trajs : list of ndarray or (M, N) ndarray
+        list of M discrete trajectories of at most N states, or out if given
+
+    """
+    sampler = MarkovChainSampler(P, dt=dt, random_state=random_state)
+    return sampler.trajectories(M, N, start=start, stop=stop, n_jobs=n_jobs, out=out)
+
+
+def generate_ensemble(P, M, N, start=None, stop=None, dt=1, random_state=None):
+    """
+    Generates multiple realizations of the Markov chain with transition matrix P in lockstep.
+
+    Parameters
+    ----------
+    P : (n, n) ndarray or scipy.sparse matrix
+        transition matrix
+    M : int
+        number of trajectories
+    N : int
+        trajectory length
+    start : int or int-array-like of length M, optional, default = None
+        starting state(s). If not given, will sample from the stationary distribution of P
+    stop : int or int-array-like, optional, default = None
+        stopping set. If given, each trajectory will be stopped before N steps
+        once a state of the stop set is reached
+    dt : int
+        trajectory will be saved every dt time steps.
+        The chain is propagated dt single steps between two saved states.
+    random_state : None, int or numpy.random.RandomState, optional
+        source of random numbers. None uses the global numpy random state,
+        an int seeds a new numpy.random.RandomState.
+
+    Returns
+    -------
+    trajs : (M, N) ndarray of int
+        discrete trajectories, one per row. Entries after a trajectory reached the
+        stop set are -1.
+
+    See also
+    --------
+    generate_trajs
 
     """
-    sampler = MarkovChainSampler(P, dt=dt)
-    return sampler.trajectories(M, N, start=start, stop=stop)
+    sampler = MarkovChainSampler(P, dt=dt, random_state=random_state)
+    return sampler.ensemble(M, N, start=start, stop=stop)
 
 
 def transition_matrix_metropolis_1d(E, d=1.0):
@@ -0,0 +1,156 @@
+r"""Cython implementation of Markov chain trajectory sampling with alias tables.
+
+Every row of the CSR transition matrix gets an alias table (Vose's
+method), so that one step of the chain costs a single uniform random
+number and O(1) operations, independent of the number of transitions
+out of the current state.
+
+"""
+
+import numpy
+cimport numpy
+cimport cython
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def alias_tables(numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] indptr,
+                 numpy.ndarray[double, ndim=1, mode="c"] data):
+    r"""Alias tables for all rows of a CSR matrix.
+
+    Parameters
+    ----------
+    indptr : (n+1,) ndarray of int64
+        CSR row pointer
+    data : (nnz,) ndarray of float64
+        CSR data, the transition probabilities. Rows are normalized.
+
+    Returns
+    -------
+    prob : (nnz,) ndarray of float64
+        Probability to keep the drawn entry of the row
+    alias : (nnz,) ndarray of int64
+        Entry of the row, relative to the row start, to take instead
+
+    """
+    cdef Py_ssize_t n = indptr.shape[0] - 1
+    cdef Py_ssize_t nnz = data.shape[0]
+    cdef numpy.ndarray[double, ndim=1, mode="c"] prob = numpy.ones(nnz, dtype=numpy.float64)
+    cdef numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] alias = numpy.zeros(nnz, dtype=numpy.int64)
+    cdef numpy.ndarray[double, ndim=1, mode="c"] p = numpy.zeros(nnz, dtype=numpy.float64)
+    """Work stacks of the small and large entries, at most one row long"""
+    cdef numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] small = numpy.zeros(nnz, dtype=numpy.int64)
+    cdef numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] large = numpy.zeros(nnz, dtype=numpy.int64)
+    cdef Py_ssize_t i, j, start, k, ns, nl, s, l
+    cdef double rowsum
+
+    for i in range(n):
+        start = indptr[i]
+        k = indptr[i + 1] - start
+        if k == 0:
+            raise ValueError('Row %d of the transition matrix has no entries.' % i)
+        rowsum = 0.0
+        for j in range(k):
+            rowsum += data[start + j]
+        if not rowsum > 0.0:
+            raise ValueError('Row %d of the transition matrix has no positive entries.' % i)
+        ns = 0
+        nl = 0
+        for j in range(k):
+            p[start + j] = data[start + j] * k / rowsum
+            alias[start + j] = j
+            if p[start + j] < 1.0:
+                small[ns] = j
+                ns += 1
+            else:
+                large[nl] = j
+                nl += 1
+        while ns > 0 and nl > 0:
+            ns -= 1
+            s = small[ns]
+            l = large[nl - 1]
+            prob[start + s] = p[start + s]
+            alias[start + s] = l
+            p[start + l] = (p[start + l] + p[start + s]) - 1.0
+            if p[start + l] < 1.0:
+                nl -= 1
+                small[ns] = l
+                ns += 1
+        """Left over entries (up to round-off) are kept with probability one"""
+    return prob, alias
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def sample_trajectory(numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] indptr,
+                      numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] indices,
+                      numpy.ndarray[double, ndim=1, mode="c"] prob,
+                      numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] alias,
+                      numpy.ndarray[numpy.int64_t, ndim=1, mode="c"] traj,
+                      numpy.int64_t start,
+                      numpy.ndarray[numpy.uint8_t, ndim=1, mode="c"] stopat,
+                      uniform,
+                      Py_ssize_t dt=1,
+                      Py_ssize_t block=65536):
+    r"""Sample a trajectory of the Markov chain with the given alias tables.
+
+    Parameters
+    ----------
+    indptr, indices : ndarray of int64
+        CSR structure of the transition matrix
+    prob, alias : ndarray
+        Alias tables, see :func:`alias_tables`
+    traj : (N,) ndarray of int64
+        Output, the trajectory is written to traj[0:length]
+    start : int
+        Starting state
+    stopat : (n,) ndarray of uint8
+        Indicator of the stopping set
+    uniform : callable
+        uniform(size) returns an ndarray of uniform random numbers in [0, 1)
+    dt : int (optional)
+        Number of steps of the chain between two saved states. The
+        stopping set is only checked for the saved states.
+    block : int (optional)
+        Number of random numbers drawn from uniform at once
+
+    Returns
+    -------
+    length : int
+        Length of the trajectory, smaller than N if a state of the
+        stopping set was reached
+
+    """
+    cdef Py_ssize_t N = traj.shape[0]
+    cdef Py_ssize_t t, s, pos, k, j, off
+    cdef numpy.int64_t state = start
+    cdef double x
+    cdef numpy.ndarray[double, ndim=1, mode="c"] u
+
+    if N == 0:
+        return 0
+    traj[0] = state
+    if stopat[state]:
+        return 1
+    block = max(1, min(block, (N - 1) * dt))
+    u = numpy.ascontiguousarray(uniform(block), dtype=numpy.float64)
+    pos = 0
+    for t in range(1, N):
+        for s in range(dt):
+            if pos == block:
+                u = numpy.ascontiguousarray(uniform(block), dtype=numpy.float64)
+                pos = 0
+            off = indptr[state]
+            k = indptr[state + 1] - off
+            x = u[pos] * k
+            pos += 1
+            j = <Py_ssize_t> x
+            if j >= k:
+                j = k - 1
+            if x - j >= prob[off + j]:
+                j = alias[off + j]
+            state = indices[off + j]
+        traj[t] = state
+        if stopat[state]:
+            return t + 1
+    return N
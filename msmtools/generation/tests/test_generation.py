@@ -25,8 +25,12 @@
 '''
 @author: noe, trendelkampschroer
 '''
+import os
+import shutil
+import tempfile
 import unittest
 import numpy as np
+import scipy.sparse
 import msmtools.generation as msmgen
 import msmtools.estimation as msmest
 import msmtools.analysis as msmana
@@ -91,6 +95,102 @@ class Test(unittest.TestCase):
             assert traj.size == N or traj[-1] == stop
             assert stop not in traj[:-1]
 
+    def test_random_state(self):
+        P = np.array([[0.9,0.1],
+                      [0.1,0.9]])
+        traj1 = msmgen.generate_traj(P, 100, start=0, random_state=7)
+        traj2 = msmgen.generate_traj(P, 100, start=0, random_state=7)
+        assert np.all(traj1 == traj2)
+
+        rng = np.random.RandomState(7)
+        traj1 = msmgen.generate_traj(P, 100, start=0, random_state=rng)
+        traj2 = msmgen.generate_traj(P, 100, start=0, random_state=np.random.RandomState(7))
+        assert np.all(traj1 == traj2)
+        # an int seeds a RandomState
+        traj2 = msmgen.generate_traj(P, 100, start=0, random_state=7)
+        assert np.all(traj1 == traj2)
+
+    def test_trajectory_many_states(self):
+        C = np.random.rand(20, 20)
+        C[C < 0.5] = 0.0
+        C += np.eye(20)
+        P = C / C.sum(axis=1)[:, np.newaxis]
+        traj = msmgen.generate_traj(P, 200000, start=0)
+        Pest = msmest.transition_matrix(msmest.count_matrix(traj, 1)).toarray()
+        assert np.max(np.abs(Pest - P)) < 0.05
+
+    def test_ensemble(self):
+        P = np.array([[0.9,0.1],
+                      [0.1,0.9]])
+        M = 1000
+        N = 10
+        trajs = msmgen.generate_ensemble(P, M, N, start=0)
+        assert trajs.shape == (M, N)
+        assert np.all(trajs[:, 0] == 0)
+        C = msmest.count_matrix(list(trajs), 1)
+        Pest = msmest.transition_matrix(C)
+        assert np.max(np.abs(Pest - P)) < 0.025
+
+        # stopped trajectories are padded with -1
+        stop = 1
+        trajs = msmgen.generate_ensemble(P, M, N, start=0, stop=stop)
+        for traj in trajs:
+            length = np.count_nonzero(traj >= 0)
+            assert np.all(traj[length:] == -1)
+            assert length == N or traj[length - 1] == stop
+            assert stop not in traj[:length - 1]
+
+    def test_sparse_dt(self):
+        P = np.array([[0.9,0.1,0.0],
+                      [0.1,0.8,0.1],
+                      [0.0,0.1,0.9]])
+        Psparse = scipy.sparse.csr_matrix(P)
+        sampler = msmgen.MarkovChainSampler(Psparse, dt=3)
+        assert scipy.sparse.issparse(sampler.P)
+
+        # saved states are dt steps apart
+        P3 = np.linalg.matrix_power(P, 3)
+        traj = msmgen.generate_traj(Psparse, 100000, start=0, dt=3)
+        Pest = msmest.transition_matrix(msmest.count_matrix(traj, 1)).toarray()
+        assert np.max(np.abs(Pest - P3)) < 0.025
+
+        trajs = msmgen.generate_ensemble(Psparse, 10000, 11, start=0, dt=3)
+        Pest = msmest.transition_matrix(msmest.count_matrix(list(trajs), 1)).toarray()
+        assert np.max(np.abs(Pest - P3)) < 0.025
+
+    def test_trajectories_n_jobs(self):
+        P = np.array([[0.9,0.1,0.0],
+                      [0.1,0.8,0.1],
+                      [0.0,0.1,0.9]])
+        M = 20
+        N = 100
+        # same trajectories for any number of workers, including the serial n_jobs=1
+        trajs1 = msmgen.generate_trajs(P, M, N, random_state=3)
+        for n_jobs in [2, 3]:
+            trajs2 = msmgen.generate_trajs(P, M, N, random_state=3, n_jobs=n_jobs)
+            assert len(trajs2) == M
+            for traj1, traj2 in zip(trajs1, trajs2):
+                assert np.all(traj1 == traj2)
+        # the trajectories are not copies of one stream
+        assert not all(np.all(traj == trajs1[0]) for traj in trajs1[1:])
+
+        # output into an on-disk store, padded with -1 after the stop set
+        trajs1 = msmgen.generate_trajs(P, M, N, start=0, stop=2, random_state=5, n_jobs=3)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'dtrajs.npy')
+            out = np.lib.format.open_memmap(filename, mode='w+', dtype=np.int64, shape=(M, N))
+            trajs2 = msmgen.generate_trajs(P, M, N, start=0, stop=2, random_state=5, n_jobs=2, out=out)
+            assert trajs2 is out
+            del out, trajs2
+            trajs2 = np.load(filename)
+        finally:
+            shutil.rmtree(tmpdir)
+        for traj1, traj2 in zip(trajs1, trajs2):
+            length = traj1.shape[0]
+            assert np.all(traj2[:length] == traj1)
+            assert np.all(traj2[length:] == -1)
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
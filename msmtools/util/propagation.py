@@ -0,0 +1,325 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Propagation of vectors with powers of (sparse) matrices.
+
+This module computes the action A^t x of a matrix power on a vector, or on
+a block of vectors, without forming A^t for sparse matrices. Depending on
+the size of t and the type of A the action is evaluated by repeated
+matrix-vector products, by repeated squaring or in a Krylov subspace.
+
+"""
+
+import numpy as np
+import scipy.sparse
+
+__all__ = ['propagate',
+           'matrix_power',
+           ]
+
+
+def propagate(A, x, t, method='auto', tol=1e-10, maxiter=None):
+    r"""Compute the action A^t x of the t-th power of A on x.
+
+    For the propagation of a distribution p0^T A^t call this function with
+    the transpose of A.
+
+    Parameters
+    ----------
+    A : (n, n) ndarray or scipy.sparse matrix
+        Propagator, e.g. a transition matrix
+    x : (n,) or (n, k) ndarray
+        Vector to propagate, or k vectors in the columns of a matrix
+    t : int
+        Number of steps, t >= 0
+    method : str, optional, default='auto'
+        'matvec' : t successive matrix-vector products, O(nnz(A) t)
+        'power' : repeated squaring of A applied to x, O(n^3 log t) for
+            dense A. For sparse A the squares may fill in.
+        'krylov' : projection of A^t onto the Krylov subspace spanned by x
+            and its images under A. The subspace is enlarged until an
+            a-posteriori bound of the error is below tol. If the bound is
+            not met within maxiter steps, the result is computed by 'matvec'.
+        'auto' : 'power' for dense A and large t. For sparse A 'krylov' with
+            a subspace that costs at most a fraction of the t products of
+            'matvec', and 'matvec' if such a subspace is too small.
+    tol : float, optional, default=1e-10
+        Relative tolerance of the Krylov approximation
+    maxiter : int, optional
+        Maximum dimension of the Krylov subspace, defaults to min(n, 200)
+
+    Returns
+    -------
+    y : (n,) or (n, k) ndarray
+        The propagated vector(s)
+
+    Notes
+    -----
+    The Krylov approximation V H^t V^T x with H = V^T A V and the residual
+    R = A V - V H has the error sum_{i<t} A^i R H^(t-1-i) V^T x. It is
+    bounded with the eigendecomposition of H and the 1- or max-norm of A,
+    whichever is smaller. For (sub)stochastic A or A^T this norm is at
+    most one and the bound is not spoiled by the powers of A.
+
+    """
+    n = A.shape[0]
+    x = np.asarray(x)
+    if x.shape[0] != n:
+        raise ValueError("vector shape %s not compatible with matrix shape %s" % (x.shape, A.shape))
+    if t < 0:
+        raise ValueError("number of steps can not be negative")
+    if maxiter is None:
+        maxiter = min(n, 200)
+    if method == 'auto':
+        if scipy.sparse.issparse(A):
+            # a Krylov subspace that fails to converge wastes at most a quarter of the products
+            k = 1 if x.ndim == 1 else x.shape[1]
+            maxiter = min(maxiter, _krylov_dimension(A, t * k, maxiter, 0.25))
+            method = 'krylov' if maxiter >= k + 20 else 'matvec'
+        else:
+            # n^2 t flops for products versus n^3 log(t) flops for squaring
+            method = 'matvec' if t <= n * np.log2(max(t, 2)) else 'power'
+    if method == 'matvec':
+        return _propagate_matvec(A, x, t)
+    elif method == 'power':
+        return _propagate_power(A, x, t)
+    elif method == 'krylov':
+        y = None
+        if t > 0:
+            y = _propagate_krylov(A, x, t, tol, maxiter)
+        if y is None:
+            y = _propagate_matvec(A, x, t)
+        return y
+    else:
+        raise ValueError("unknown propagation method: %s" % method)
+
+
+def matrix_power(A, t):
+    r"""Compute the t-th power of A by repeated squaring.
+
+    Unlike numpy.linalg.matrix_power this keeps a sparse A sparse.
+
+    Parameters
+    ----------
+    A : (n, n) ndarray or scipy.sparse matrix
+        Matrix
+    t : int
+        Exponent, t >= 0
+
+    Returns
+    -------
+    At : (n, n) ndarray or scipy.sparse matrix
+        The t-th power of A, of the same type as A
+
+    """
+    if t < 0:
+        raise ValueError("exponent can not be negative")
+    if not scipy.sparse.issparse(A):
+        return np.linalg.matrix_power(A, t)
+    A = scipy.sparse.csr_matrix(A)
+    At = scipy.sparse.identity(A.shape[0], dtype=A.dtype, format='csr')
+    for bit in bin(t)[2:]:
+        At = At.dot(At)
+        if bit == '1':
+            At = At.dot(A)
+    return At
+
+
+def _propagate_matvec(A, x, t):
+    y = 1.0 * x
+    for i in range(t):
+        y = A.dot(y)
+    return y
+
+
+def _propagate_power(A, x, t):
+    # apply the squares A^(2^j) for the set bits of t, starting from the lowest
+    y = 1.0 * x
+    A2j = A
+    while t > 0:
+        if t & 1:
+            y = A2j.dot(y)
+        t >>= 1
+        if t > 0:
+            A2j = A2j.dot(A2j)
+    return y
+
+
+def _propagate_krylov(A, x, t, tol, maxiter):
+    r"""Krylov approximation of A^t x, None if its error bound does not meet tol within maxiter"""
+    n = A.shape[0]
+    X = 1.0 * x.reshape((n, -1))
+    # t products accumulate rounding errors of relative size t eps, the result can not be more accurate
+    rtol = max(tol, 10.0 * t * np.finfo(float).eps)
+    Y = _krylov_approximation(A, X, lambda H: np.linalg.matrix_power(H, t),
+                              lambda gamma, mu: _power_weights(gamma, mu, t), rtol, maxiter)
+    if Y is None:
+        return None
+    return Y.reshape(x.shape)
+
+
+def _krylov_approximation(A, X, f, weights, tol, maxiter, extend=None):
+    r"""Approximation V f(H) V^T X of f(A) X in a Krylov subspace, None if its error bound does not meet tol
+
+    Parameters
+    ----------
+    A : (n, n) ndarray or scipy.sparse matrix
+        Matrix
+    X : (n, k) ndarray
+        Vectors spanning the initial subspace
+    f : callable
+        f(H) evaluates the matrix function f(z) = sum_k a_k z^k, a_k >= 0,
+        for the projected matrix H = V^T A V
+    weights : callable
+        weights(gamma, mu) evaluates sum_k a_k sum_{i<k} gamma^i mu^(k-1-i)
+        for an array of moduli mu of the eigenvalues of H and a bound gamma
+        of the norm of A
+    tol : float
+        Relative tolerance of the error bound
+    maxiter : int
+        Maximum dimension of the subspace
+    extend : callable, optional
+        The subspace is spanned by X and the images of its basis vectors
+        under extend, defaults to A.dot. Any other function spanning an
+        A-invariant subspace, e.g. a shift-inverted A, may be used.
+
+    Returns
+    -------
+    Y : (n, k) ndarray or None
+        The approximation of f(A) X
+
+    """
+    n = A.shape[0]
+    if extend is None:
+        extend = A.dot
+    if X.shape[1] >= maxiter:
+        return None
+    p, gamma = _norm_bound(A)
+    # orthonormal basis V of the block Krylov subspace and its image AV
+    V = np.zeros((n, maxiter))
+    AV = np.zeros((n, maxiter))
+    m = 0
+    for i in range(X.shape[1]):
+        m = _extend_basis(V, m, X[:, i])
+    if m == 0:
+        return np.zeros(X.shape)
+    j = 0
+    check = min(m + 4, maxiter)
+    while j < m:
+        AV[:, j] = A.dot(V[:, j])
+        if m < maxiter:
+            m = _extend_basis(V, m, extend(V[:, j]))
+        j += 1
+        if j == check or j == m:
+            Vj = V[:, 0:j]
+            H = np.dot(Vj.T, AV[:, 0:j])
+            C = np.dot(Vj.T, X)
+            Y = np.dot(Vj, np.dot(f(H), C))
+            R = AV[:, 0:j] - np.dot(Vj, H)
+            if _projection_error(H, R, C, gamma, weights, p) <= tol * _column_norms(Y, p).sum():
+                return Y
+            check = min(j + max(4, j // 2), maxiter)
+    return None
+
+
+def _power_weights(gamma, mu, t):
+    r"""Computes sum_{i<t} gamma^i mu^(t-1-i) for an array mu of nonnegative numbers"""
+    mu = np.asarray(mu, dtype=float)
+    with np.errstate(over='ignore', invalid='ignore'):
+        # (gamma^t - mu^t) / (gamma - mu) is bounded by t max(gamma, mu)^(t-1) and inaccurate if gamma ~ mu
+        w = t * np.maximum(gamma, mu) ** (t - 1)
+        far = np.abs(gamma - mu) > 1e-8 * np.maximum(gamma, mu)
+        w[far] = (gamma ** t - mu[far] ** t) / (gamma - mu[far])
+    return w
+
+
+def _projection_error(H, R, C, gamma, weights, p):
+    r"""Bound of the error of V f(H) C in the p-norm, with the residual R = A V - V H of the subspace V
+
+    With A^k V - V H^k = sum_{i<k} A^i R H^(k-1-i) and H = W diag(lambda) W^-1 the
+    error is bounded by sum_l |R w_l| weights(gamma, |lambda_l|) |(W^-1 C)_l|.
+
+    """
+    lam, W = np.linalg.eig(H)
+    try:
+        alpha = np.linalg.solve(W, C)
+    except np.linalg.LinAlgError:
+        return np.inf
+    err = _column_norms(np.dot(R, W), p) * weights(gamma, np.abs(lam))
+    with np.errstate(invalid='ignore'):
+        err = np.dot(err, np.abs(alpha)).sum()
+    if np.isnan(err):
+        return np.inf
+    return err
+
+
+def _norm_bound(A):
+    r"""Order p in (1, inf) of the smaller of the induced norms of A, and its value"""
+    absA = abs(A)
+    norm_1 = float(absA.sum(axis=0).max())
+    norm_inf = float(absA.sum(axis=1).max())
+    if norm_1 <= norm_inf:
+        return 1, norm_1
+    return np.inf, norm_inf
+
+
+def _column_norms(X, p):
+    if p == 1:
+        return np.abs(X).sum(axis=0)
+    return np.abs(X).max(axis=0)
+
+
+def _krylov_dimension(A, t, maxiter, fraction, nnz=None):
+    r"""Largest Krylov subspace dimension that costs at most a fraction of t sparse products with A
+
+    The costs are counted in flops, one call of a numpy or scipy function is
+    counted as a few thousand flops. nnz is the number of nonzeros of the
+    operator that extends the basis, it defaults to that of A.
+
+    """
+    n = A.shape[0]
+    budget = fraction * t * (2.0 * A.nnz + n + 5000.0)
+    if nnz is None:
+        nnz = A.nnz
+    m = np.arange(1, maxiter + 1, dtype=float)
+    # products and orthogonalization per basis vector, projections and eigendecompositions
+    cost = m * (2.0 * (A.nnz + nnz) + 100000.0) + 32.0 * n * m ** 2 + 200.0 * m ** 3
+    return int(np.count_nonzero(cost <= budget))
+
+
+def _extend_basis(V, m, v):
+    r"""Orthogonalizes v against V[:, 0:m] and stores it in V[:, m], returns the new number of basis vectors"""
+    norm = np.linalg.norm(v)
+    if norm == 0.0:
+        return m
+    v = v / norm
+    # classical Gram-Schmidt with reorthogonalization
+    for it in range(2):
+        v -= np.dot(V[:, 0:m], np.dot(V[:, 0:m].T, v))
+    vnorm = np.linalg.norm(v)
+    if vnorm <= 1e-10:
+        # v is contained in the subspace
+        return m
+    V[:, m] = v / vnorm
+    return m + 1
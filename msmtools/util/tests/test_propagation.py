@@ -0,0 +1,94 @@
+# Copyright (c) 2015, 2014 Computational Molecular Biology Group, Free University
+# Berlin, 14195 Berlin, Germany.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification,
+# are permitted provided that the following conditions are met:
+#
+#  * Redistributions of source code must retain the above copyright notice, this
+# list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above copyright notice,
+# this list of conditions and the following disclaimer in the documentation and/or
+# other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS ``AS IS''
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+# ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+r"""Unit tests for the propagation module
+
+"""
+import unittest
+
+import numpy as np
+import scipy.sparse
+from msmtools.util.numeric import assert_allclose
+from msmtools.util import propagation
+
+
+class TestPropagate(unittest.TestCase):
+    def setUp(self):
+        """Birth-death chain with a bottleneck in the middle"""
+        n = 100
+        p = 0.3 * np.ones(n)
+        q = 0.3 * np.ones(n)
+        p[-1] = 0.0
+        q[0] = 0.0
+        p[n // 2] = 0.01
+        self.T = scipy.sparse.diags([q[1:], 1.0 - p - q, p[:-1]], [-1, 0, 1], format='csr')
+        self.T_dense = self.T.toarray()
+        self.x = np.linspace(0.0, 1.0, n)
+        self.X = np.column_stack((self.x, self.x ** 2, np.ones(n)))
+
+    def test_propagate(self):
+        for N in [0, 1, 2, 50, 1000]:
+            y = np.dot(np.linalg.matrix_power(self.T_dense, N), self.x)
+            assert_allclose(propagation.propagate(self.T, self.x, N), y)
+
+    def test_propagate_methods(self):
+        N = 1000
+        y = np.dot(np.linalg.matrix_power(self.T_dense, N), self.x)
+        for method in ['matvec', 'power', 'krylov']:
+            yn = propagation.propagate(self.T, self.x, N, method=method)
+            assert_allclose(yn, y)
+        yn = propagation.propagate(self.T.transpose(), self.x, N, method='krylov', maxiter=20)
+        assert_allclose(yn, np.dot(self.x, np.linalg.matrix_power(self.T_dense, N)))
+
+    def test_propagate_block(self):
+        N = 1000
+        Y = np.dot(np.linalg.matrix_power(self.T_dense, N), self.X)
+        assert_allclose(propagation.propagate(self.T, self.X, N), Y)
+
+    def test_propagate_long_times(self):
+        """Long times on a chain whose Krylov subspaces are not invariant conserve the probability"""
+        n = 500
+        p = 0.3 * np.ones(n)
+        q = 0.3 * np.ones(n)
+        p[-1] = 0.0
+        q[0] = 0.0
+        p[n // 2] = 0.01
+        T = scipy.sparse.diags([q[1:], 1.0 - p - q, p[:-1]], [-1, 0, 1], format='csr')
+        x = np.zeros(n)
+        x[0] = 1.0
+        N = 100000
+        y = np.dot(x, np.linalg.matrix_power(T.toarray(), N))
+        for method, maxiter in [('auto', None), ('krylov', 20)]:
+            yn = propagation.propagate(T.transpose(), x, N, method=method, maxiter=maxiter)
+            assert_allclose(yn.sum(), 1.0)
+            assert_allclose(yn, y)
+
+    def test_matrix_power(self):
+        Tn = propagation.matrix_power(self.T, 37)
+        self.assertTrue(scipy.sparse.issparse(Tn))
+        assert_allclose(Tn.toarray(), np.linalg.matrix_power(self.T_dense, 37))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -115,6 +115,10 @@ def extensions():
         Extension('msmtools.estimation.sparse.mle_trev',
                   sources=['msmtools/estimation/sparse/mle_trev.pyx',
                            'msmtools/estimation/sparse/_mle_trev.c'])
+
+    markov_chain_module = \
+        Extension('msmtools.generation.markov_chain',
+                  sources=['msmtools/generation/markov_chain.pyx'])
     if sys.platform.startswith('win'):
         lib_prefix = 'lib'
     else:
@@ -123,6 +127,7 @@ def extensions():
     exts += [mle_trev_given_pi_dense_module,
              mle_trev_given_pi_sparse_module,
              mle_trev_sparse_module,
+             markov_chain_module,
             ]
     if USE_CYTHON: # if we have cython available now, cythonize module
         exts = cythonize(exts)